@@ -1,8 +1,14 @@
 from django.contrib import admin
-from .models import AccessLog
+from .models import AccessLog, AuditSegment
 
 @admin.register(AccessLog)
 class AccessLogAdmin(admin.ModelAdmin):
     list_display = ('actor', 'patient', 'action', 'timestamp')
     list_filter = ('action', 'timestamp')
     readonly_fields = ('actor', 'patient', 'action', 'details', 'ip_address', 'timestamp')
+
+
+@admin.register(AuditSegment)
+class AuditSegmentAdmin(admin.ModelAdmin):
+    list_display = ('path', 'start', 'part', 'row_count', 'created_at')
+    readonly_fields = ('start', 'end', 'part', 'path', 'row_count', 'first_id', 'last_id', 'patient_ids', 'actor_ids', 'sha256', 'created_at')
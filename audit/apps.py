@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class AuditConfig(AppConfig):
     name = 'audit'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from .writer import flush_access_logs
+
+        request_finished.connect(flush_access_logs, dispatch_uid='audit.flush_access_logs')
@@ -0,0 +1,228 @@
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+from operator import attrgetter
+from time import monotonic
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from .integrity import CheckpointIndex, VerifyResult, seal_checkpoints, sealed_through, verify_rows
+from .models import AccessLog, AuditSegment
+
+ArchiveResult = namedtuple('ArchiveResult', ['rows', 'segments'])
+
+# Archived rows keep the AccessLogSerializer field names so both sources render alike
+ROW_FIELDS = {
+    'id': 'id',
+    'actor': 'actor_id',
+    'actor_username': 'actor__username',
+    'patient': 'patient_id',
+    'patient_health_id': 'patient__health_id',
+    'action': 'action',
+    'details': 'details',
+    'ip_address': 'ip_address',
+    'timestamp': 'timestamp',
+    'chain_seq': 'chain_seq',
+    'entry_hash': 'entry_hash',
+}
+DELETE_CHUNK = 500
+
+
+def day_floor(moment):
+    """Start of the UTC day containing `moment`; segments are bucketed by UTC day."""
+    moment = moment.astimezone(timezone.utc)
+    return datetime.combine(moment.date(), time.min, tzinfo=timezone.utc)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def segment_path(segment):
+    return os.path.join(settings.AUDIT_ARCHIVE_DIR, segment.path)
+
+
+def archive_day(day):
+    """
+    Move every AccessLog row of the UTC day starting at `day` into a new segment file.
+    The file is written and fsynced under a temporary name and renamed into place before
+    the segment row is recorded and the rows deleted in one transaction, so a crash leaves
+    either the rows in the table or a complete segment (an orphaned file is overwritten by
+    the next run). Only sealed entries are moved, since verify_tail reads the table alone:
+    raises ValueError if the day holds entries newer than the last checkpoint. Returns the
+    AuditSegment, or None if the day had no rows.
+    """
+    end = day + timedelta(days=1)
+    unsealed = AccessLog.objects.filter(timestamp__gte=day, timestamp__lt=end, chain_seq__gt=sealed_through())
+    if unsealed.exists():
+        raise ValueError(f"Audit entries of {day:%Y-%m-%d} are not sealed yet; not archiving")
+    part = AuditSegment.objects.filter(start=day).count()
+    relative = f"{day:%Y/%m}/accesslog-{day:%Y-%m-%d}-{part:03d}.ndjson.gz"
+    full = os.path.join(settings.AUDIT_ARCHIVE_DIR, relative)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+
+    rows = (
+        AccessLog.objects
+        .filter(timestamp__gte=day, timestamp__lt=end)
+        .order_by('-timestamp', '-id')
+        .values(*ROW_FIELDS.values())
+        .iterator(chunk_size=2000)
+    )
+    ids, patient_ids, actor_ids = [], set(), set()
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(full), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as gz:
+                for row in rows:
+                    record = {name: row[field] for name, field in ROW_FIELDS.items()}
+                    record['timestamp'] = record['timestamp'].isoformat()
+                    gz.write((json.dumps(record, separators=(',', ':')) + '\n').encode())
+                    ids.append(record['id'])
+                    if record['patient'] is not None:
+                        patient_ids.add(record['patient'])
+                    if record['actor'] is not None:
+                        actor_ids.add(record['actor'])
+            raw.flush()
+            os.fsync(raw.fileno())
+        if not ids:
+            os.remove(tmp)
+            return None
+        digest = file_sha256(tmp)
+        os.replace(tmp, full)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    with transaction.atomic():
+        segment = AuditSegment.objects.create(
+            start=day,
+            end=end,
+            part=part,
+            path=relative,
+            row_count=len(ids),
+            first_id=min(ids),
+            last_id=max(ids),
+            patient_ids=sorted(patient_ids),
+            actor_ids=sorted(actor_ids),
+            sha256=digest,
+        )
+        for i in range(0, len(ids), DELETE_CHUNK):
+            AccessLog.objects.filter(pk__in=ids[i:i + DELETE_CHUNK]).delete()
+    return segment
+
+
+def archive_before(cutoff, stdout=None):
+    """
+    Archive all rows older than the start of the UTC day containing `cutoff`, one segment per
+    day, after sealing a checkpoint that covers them even if its run is not complete yet.
+    """
+    cutoff = day_floor(cutoff)
+    through = AccessLog.objects.filter(timestamp__lt=cutoff).aggregate(seq=Max('chain_seq'))['seq']
+    if through is not None:
+        seal_checkpoints(stdout=stdout, through=through)
+    rows = segments = 0
+    while True:
+        oldest = (
+            AccessLog.objects.filter(timestamp__lt=cutoff)
+            .order_by('timestamp').values_list('timestamp', flat=True).first()
+        )
+        if oldest is None:
+            break
+        segment = archive_day(day_floor(oldest))
+        if segment is None:
+            continue
+        rows += segment.row_count
+        segments += 1
+        if stdout:
+            stdout.write(f"  {segment.path}: {segment.row_count} rows")
+    return ArchiveResult(rows, segments)
+
+
+def read_segment(segment):
+    """Yield the rows of a segment, newest first, with timestamps parsed."""
+    with gzip.open(segment_path(segment), 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            record = json.loads(line)
+            record['timestamp'] = parse_datetime(record['timestamp'])
+            yield record
+
+
+def verify_segments():
+    """
+    Check every segment file against its recorded sha256 and re-prove its entries against
+    their checkpoints, as verify_entries does for the table; an archived entry must be sealed.
+    """
+    started = monotonic()
+    index = CheckpointIndex()
+    failures, checked = [], 0
+    for segment in AuditSegment.objects.order_by('start', 'part'):
+        try:
+            intact = file_sha256(segment_path(segment)) == segment.sha256
+        except FileNotFoundError:
+            failures.append((segment.path, "segment file is missing"))
+            continue
+        if not intact:
+            failures.append((segment.path, "does not match its sha256"))
+        rows = (
+            {
+                'id': record['id'], 'entry_hash': record['entry_hash'], 'chain_seq': record['chain_seq'],
+                'timestamp': record['timestamp'], 'actor_id': record['actor'], 'patient_id': record['patient'],
+                'action': record['action'], 'details': record['details'], 'ip_address': record['ip_address'],
+            }
+            for record in read_segment(segment)
+        )
+        result = verify_rows(rows, index=index, require_sealed=True)
+        failures.extend((f"{segment.path} #{where}", reason) for where, reason in result.failures)
+        checked += result.checked
+    return VerifyResult(checked, failures, monotonic() - started)
+
+
+def archived_entries(since=None, until=None, before=None, actions=None, actor=None, patient=None):
+    """
+    Archived rows in [since, until) matching the filters, newest first, strictly after the
+    (timestamp, id) position `before`; either bound may be None. Segments are opened lazily,
+    one day at a time, and skipped without reading when their id index rules out the
+    requested actor or patient.
+    """
+    segments = AuditSegment.objects.order_by('-start', 'part')
+    if since is not None:
+        segments = segments.filter(end__gt=since)
+    if until is not None:
+        segments = segments.filter(start__lt=until)
+    if before is not None:
+        segments = segments.filter(start__lte=before[0])
+
+    def matches(record):
+        key = (record['timestamp'], record['id'])
+        return (
+            (since is None or since <= record['timestamp'])
+            and (until is None or record['timestamp'] < until)
+            and (before is None or key < before)
+            and (not actions or record['action'] in actions)
+            and (actor is None or record['actor'] == actor)
+            and (patient is None or record['patient'] == patient)
+        )
+
+    for _, parts in itertools.groupby(segments, key=attrgetter('start')):
+        rows = []
+        for segment in parts:
+            if actor is not None and actor not in segment.actor_ids:
+                continue
+            if patient is not None and patient not in segment.patient_ids:
+                continue
+            rows.extend(record for record in read_segment(segment) if matches(record))
+        # Parts of one day may interleave; days never do
+        rows.sort(key=lambda record: (record['timestamp'], record['id']), reverse=True)
+        yield from rows
@@ -0,0 +1,311 @@
+import bisect
+import hashlib
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import AccessLog, AuditChainHead, AuditCheckpoint
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = '0' * 64
+CHAIN_FIELDS = ('chain_seq', 'timestamp', 'actor_id', 'patient_id', 'action', 'details', 'ip_address')
+
+VerifyResult = namedtuple('VerifyResult', ['checked', 'failures', 'seconds'])
+
+
+# --- Hash chain ---------------------------------------------------------------------------
+
+def canonical_entry(seq, timestamp, actor_id, patient_id, action, details, ip_address):
+    """Stable byte encoding of the fields an entry's hash covers."""
+    return json.dumps(
+        [seq, timestamp.astimezone(dt_timezone.utc).isoformat(), actor_id, patient_id, action, details, ip_address],
+        separators=(',', ':'), ensure_ascii=False,
+    ).encode()
+
+
+def chain_hash(prev_hash, canonical):
+    return hashlib.sha256(bytes.fromhex(prev_hash) + canonical).hexdigest()
+
+
+def _row_hash(prev_hash, row):
+    return chain_hash(prev_hash, canonical_entry(*(row[field] for field in CHAIN_FIELDS)))
+
+
+def append_entries(entries):
+    """
+    Chain and insert unsaved AccessLog rows. The head row is bumped first so its lock (a row
+    lock on PostgreSQL, the write lock on SQLite) serializes concurrent writers before they
+    read the previous hash. Returns the new head sequence number.
+    """
+    with transaction.atomic():
+        if not AuditChainHead.objects.filter(pk=1).update(seq=F('seq') + len(entries)):
+            AuditChainHead.objects.create(pk=1, seq=len(entries), entry_hash=GENESIS_HASH)
+        head = AuditChainHead.objects.get(pk=1)
+        seq, prev = head.seq - len(entries), head.entry_hash
+        for entry in entries:
+            seq += 1
+            entry.chain_seq = seq
+            entry.entry_hash = prev = chain_hash(prev, canonical_entry(
+                seq, entry.timestamp, entry.actor_id, entry.patient_id, entry.action, entry.details, entry.ip_address
+            ))
+        AccessLog.objects.bulk_create(entries)
+        AuditChainHead.objects.filter(pk=1).update(entry_hash=prev)
+    return head.seq
+
+
+# --- Merkle trees -------------------------------------------------------------------------
+# The leaves are the raw entry hashes, so a tree also hands back each entry's predecessor.
+# Inner nodes are hashed with a 0x01 prefix; proofs have a fixed length for a given tree size
+# and position, so an inner node cannot pose as a leaf. An unpaired node is promoted as is.
+
+def _node(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def merkle_levels(leaves):
+    """All levels of the tree over `leaves` (32-byte digests), leaves first; the last holds the root."""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([
+            _node(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ])
+    return levels
+
+
+def level_sizes(leaf_count):
+    sizes = [leaf_count]
+    while sizes[-1] > 1:
+        sizes.append((sizes[-1] + 1) // 2)
+    return sizes
+
+
+def pack_levels(levels):
+    return b''.join(b''.join(level) for level in levels)
+
+
+def unpack_levels(blob, leaf_count):
+    levels, offset = [], 0
+    for size in level_sizes(leaf_count):
+        levels.append([blob[offset + i * 32:offset + (i + 1) * 32] for i in range(size)])
+        offset += size * 32
+    return levels
+
+
+def merkle_proof(levels, index):
+    """Sibling path from leaf `index` to the root: [(sibling, sibling_is_left)]."""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append((level[sibling], sibling < index))
+        index //= 2
+    return proof
+
+
+def verify_proof(entry_hash, proof, root):
+    digest = bytes.fromhex(entry_hash)
+    for sibling, is_left in proof:
+        digest = _node(sibling, digest) if is_left else _node(digest, sibling)
+    return digest == root
+
+
+def chain_roots(prev_chained_root, root):
+    """Checkpoints commit to their predecessor, so rewriting one invalidates all later ones."""
+    return hashlib.sha256(bytes.fromhex(prev_chained_root) + root).hexdigest()
+
+
+# --- Checkpoints --------------------------------------------------------------------------
+
+def seal_checkpoints(size=None, stdout=None, through=None):
+    """
+    Cover every complete run of `size` chained entries after the last checkpoint with a new
+    Merkle checkpoint. Each run is re-hashed from its rows before sealing, so a checkpoint
+    only ever vouches for a chain that verified. With `through`, also seal a final shorter
+    run ending at that sequence number (the archiver needs everything it moves sealed);
+    raises ValueError if any entry up to it is missing. Returns the checkpoints created.
+    """
+    size = size or settings.AUDIT_CHECKPOINT_SIZE
+    created = []
+    while True:
+        last = AuditCheckpoint.objects.order_by('-last_seq').first()
+        first_seq = last.last_seq + 1 if last else 1
+        prev_hash = last.last_entry_hash if last else GENESIS_HASH
+        last_seq = first_seq + size - 1
+        if through is not None:
+            if first_seq > through:
+                return created
+            last_seq = min(last_seq, through)
+        rows = list(
+            AccessLog.objects.filter(chain_seq__gte=first_seq, chain_seq__lte=last_seq)
+            .order_by('chain_seq').values('entry_hash', *CHAIN_FIELDS)
+        )
+        if len(rows) < last_seq - first_seq + 1:
+            if through is None:
+                return created
+            raise ValueError(f"Audit entries {first_seq}-{last_seq} are incomplete; not sealing")
+        expected = prev_hash
+        for offset, row in enumerate(rows):
+            expected = _row_hash(expected, row)
+            if row['chain_seq'] != first_seq + offset or row['entry_hash'] != expected:
+                raise ValueError(f"Audit chain broken at seq {first_seq + offset}; not sealing")
+
+        levels = merkle_levels([bytes.fromhex(row['entry_hash']) for row in rows])
+        root = levels[-1][0]
+        try:
+            checkpoint = AuditCheckpoint.objects.create(
+                first_seq=first_seq,
+                last_seq=last_seq,
+                prev_entry_hash=prev_hash,
+                last_entry_hash=rows[-1]['entry_hash'],
+                root=root.hex(),
+                chained_root=chain_roots(last.chained_root if last else GENESIS_HASH, root),
+                nodes=pack_levels(levels),
+            )
+        except IntegrityError:
+            # Another process sealed this range first
+            continue
+        created.append(checkpoint)
+        if stdout:
+            stdout.write(f"  sealed checkpoint {checkpoint.first_seq}-{checkpoint.last_seq}")
+
+
+def sealed_through():
+    """Sequence number of the last sealed entry (0 before the first checkpoint)."""
+    last = AuditCheckpoint.objects.order_by('-last_seq').values_list('last_seq', flat=True).first()
+    return last or 0
+
+
+def seal_if_due(prev_seq, head_seq):
+    """Called after a write moved the head from prev_seq to head_seq; seals once a run completes."""
+    size = settings.AUDIT_CHECKPOINT_SIZE
+    if head_seq // size == prev_seq // size:
+        return
+    try:
+        seal_checkpoints()
+    except Exception:
+        logger.exception("Sealing audit checkpoints failed")
+
+
+# --- Verification -------------------------------------------------------------------------
+
+def verify_checkpoint_chain(rebuild_trees=False):
+    """
+    Check that checkpoints follow each other and that their chained roots link up: one hash
+    per checkpoint. With rebuild_trees, also recompute every stored tree from its leaves.
+    """
+    failures, checked = [], 0
+    prev_chained, prev_last_seq, prev_last_hash = GENESIS_HASH, 0, GENESIS_HASH
+    checkpoints = AuditCheckpoint.objects.order_by('first_seq')
+    if not rebuild_trees:
+        checkpoints = checkpoints.defer('nodes')
+    for cp in checkpoints.iterator():
+        if rebuild_trees:
+            levels = unpack_levels(bytes(cp.nodes), cp.last_seq - cp.first_seq + 1)
+            if merkle_levels(levels[0])[-1][0].hex() != cp.root or levels[0][-1].hex() != cp.last_entry_hash:
+                failures.append((f"checkpoint {cp.first_seq}-{cp.last_seq}", "tree does not match root"))
+        if cp.first_seq != prev_last_seq + 1 or cp.prev_entry_hash != prev_last_hash:
+            failures.append((f"checkpoint {cp.first_seq}-{cp.last_seq}", "does not follow the previous checkpoint"))
+        if chain_roots(prev_chained, bytes.fromhex(cp.root)) != cp.chained_root:
+            failures.append((f"checkpoint {cp.first_seq}-{cp.last_seq}", "chained root mismatch"))
+        prev_chained, prev_last_seq, prev_last_hash = cp.chained_root, cp.last_seq, cp.last_entry_hash
+        checked += 1
+    return checked, failures
+
+
+def verify_tail():
+    """Re-hash the entries written since the last checkpoint, in chain order."""
+    started = time.monotonic()
+    last = AuditCheckpoint.objects.order_by('-last_seq').first()
+    expected_seq = last.last_seq + 1 if last else 1
+    expected = last.last_entry_hash if last else GENESIS_HASH
+    failures, checked = [], 0
+    rows = (
+        AccessLog.objects.filter(chain_seq__gte=expected_seq).order_by('chain_seq')
+        .values('id', 'entry_hash', *CHAIN_FIELDS).iterator(chunk_size=2000)
+    )
+    for row in rows:
+        if row['chain_seq'] != expected_seq:
+            failures.append((row['chain_seq'], f"entries {expected_seq}-{row['chain_seq'] - 1} are missing"))
+            # Resynchronise on the stored hash so one gap is reported once
+            expected = row['entry_hash']
+        else:
+            expected = _row_hash(expected, row)
+            if row['entry_hash'] != expected:
+                failures.append((row['chain_seq'], f"log {row['id']} does not match its hash"))
+                expected = row['entry_hash']
+        expected_seq = row['chain_seq'] + 1
+        checked += 1
+    head = AuditChainHead.objects.filter(pk=1).first()
+    if head and head.seq >= expected_seq:
+        failures.append((head.seq, f"entries {expected_seq}-{head.seq} are missing"))
+    return VerifyResult(checked, failures, time.monotonic() - started)
+
+
+class CheckpointIndex:
+    """Checkpoints located by sequence number, with their trees unpacked on first use."""
+
+    def __init__(self):
+        self.checkpoints = list(AuditCheckpoint.objects.order_by('first_seq').defer('nodes'))
+        self.starts = [cp.first_seq for cp in self.checkpoints]
+        self._levels = {}
+
+    def find(self, seq):
+        i = bisect.bisect_right(self.starts, seq) - 1
+        if i >= 0 and seq <= self.checkpoints[i].last_seq:
+            return self.checkpoints[i]
+        return None
+
+    def levels(self, cp):
+        if cp.pk not in self._levels:
+            blob = AuditCheckpoint.objects.values_list('nodes', flat=True).get(pk=cp.pk)
+            self._levels[cp.pk] = unpack_levels(bytes(blob), cp.last_seq - cp.first_seq + 1)
+        return self._levels[cp.pk]
+
+
+def verify_entries(queryset):
+    """
+    Verify a selection of entries (a patient's, a day's) without reading the rest of the log:
+    each sealed row is re-hashed from its predecessor's leaf and proven against its
+    checkpoint root with an O(log n) Merkle path; rows newer than the last checkpoint are
+    covered by verify_tail. Unchained rows (written around the audit writer) are failures.
+    """
+    rows = queryset.order_by('chain_seq').values('id', 'entry_hash', *CHAIN_FIELDS).iterator(chunk_size=2000)
+    return verify_rows(rows)
+
+
+def verify_rows(rows, index=None, require_sealed=False):
+    """
+    verify_entries over dicts carrying id, entry_hash and CHAIN_FIELDS, from the table or an
+    archive segment. With require_sealed, a row no checkpoint covers is a failure too.
+    """
+    started = time.monotonic()
+    index = index or CheckpointIndex()
+    failures, checked = [], 0
+    for row in rows:
+        checked += 1
+        seq = row['chain_seq']
+        if seq is None:
+            failures.append((row['id'], "not chained"))
+            continue
+        cp = index.find(seq)
+        if cp is None:
+            if require_sealed:
+                failures.append((row['id'], "not covered by a checkpoint"))
+            continue
+        levels = index.levels(cp)
+        position = seq - cp.first_seq
+        prev_hash = cp.prev_entry_hash if position == 0 else levels[0][position - 1].hex()
+        recomputed = _row_hash(prev_hash, row)
+        if recomputed != row['entry_hash'] or recomputed != levels[0][position].hex():
+            failures.append((row['id'], "does not match its sealed hash"))
+        elif not verify_proof(recomputed, merkle_proof(levels, position), bytes.fromhex(cp.root)):
+            failures.append((row['id'], "Merkle proof failed"))
+    return VerifyResult(checked, failures, time.monotonic() - started)
@@ -0,0 +1,30 @@
+"""
+archive_access_logs.py
+Move AccessLog rows older than AUDIT_HOT_DAYS (or --older-than-days) out of the hot table
+into daily gzip NDJSON segments under AUDIT_ARCHIVE_DIR, sealing a checkpoint over them
+first. Run it daily from cron.
+Usage: python manage.py archive_access_logs [--older-than-days 90]
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from audit.archive import archive_before
+
+
+class Command(BaseCommand):
+    help = 'Archive old audit log rows into compressed daily segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.AUDIT_HOT_DAYS)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        stdout = self.stdout if options['verbosity'] > 1 else None
+        try:
+            result = archive_before(cutoff, stdout=stdout)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result.rows} audit entries into {result.segments} segments."
+        ))
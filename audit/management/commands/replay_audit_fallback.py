@@ -0,0 +1,37 @@
+"""
+replay_audit_fallback.py
+Load audit entries that were written to AUDIT_FALLBACK_FILE while the database was
+unavailable back into AccessLog, then remove the file.
+Usage: python manage.py replay_audit_fallback [--file path]
+"""
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from audit.writer import chain_access_logs, read_fallback
+
+
+class Command(BaseCommand):
+    help = 'Replay audit entries from the fallback file into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.AUDIT_FALLBACK_FILE)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not os.path.exists(path):
+            self.stdout.write("No fallback file to replay.")
+            return
+
+        # Move it aside first so entries appended meanwhile land in a fresh file
+        replaying = f"{path}.replaying"
+        if not os.path.exists(replaying):
+            os.replace(path, replaying)
+        entries = read_fallback(replaying)
+        # Replayed entries join the hash chain now, after anything written meanwhile
+        with transaction.atomic():
+            for i in range(0, len(entries), options['batch_size']):
+                chain_access_logs(entries[i:i + options['batch_size']])
+        os.remove(replaying)
+        self.stdout.write(self.style.SUCCESS(f"Replayed {len(entries)} audit entries."))
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0002_alter_accesslog_action'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accesslog',
+            name='action',
+            field=models.CharField(choices=[('VIEW_PROFILE', 'View Profile'), ('VIEW_RECORDS', 'View Records'), ('UPLOAD_RECORD', 'Upload Record'), ('LOGIN', 'Login'), ('CREATE_CONSULTATION', 'Create Consultation'), ('UPLOAD_DOCUMENT', 'Upload Document'), ('GRANT_ACCESS', 'Grant Access'), ('REVOKE_ACCESS', 'Revoke Access'), ('CREATE_HEALTH_ID', 'Create Health ID'), ('QR_SCAN', 'QR Quick Preview Scan')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0003_accesslog_qr_scan'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['patient', '-timestamp', '-id'], name='accesslog_patient_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0005_accesslog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('part', models.PositiveIntegerField(default=0)),
+                ('path', models.CharField(help_text='Relative to AUDIT_ARCHIVE_DIR', max_length=255)),
+                ('row_count', models.PositiveIntegerField()),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('patient_ids', models.JSONField(default=list)),
+                ('actor_ids', models.JSONField(default=list)),
+                ('sha256', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-start', '-part'],
+                'constraints': [models.UniqueConstraint(fields=('start', 'part'), name='unique_audit_segment_part')],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:10
+
+from django.db import migrations
+
+# SQLite: a standalone FTS5 table keyed by the log id, kept in step by triggers.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE audit_accesslog_fts USING fts5(
+        details, ip_address, actor_username, patient_health_id
+    )
+    """,
+    """
+    CREATE TRIGGER audit_accesslog_fts_insert AFTER INSERT ON audit_accesslog BEGIN
+        INSERT INTO audit_accesslog_fts (rowid, details, ip_address, actor_username, patient_health_id)
+        VALUES (
+            new.id, new.details, coalesce(new.ip_address, ''),
+            coalesce((SELECT username FROM accounts_user WHERE id = new.actor_id), ''),
+            coalesce((SELECT health_id FROM patients_patient WHERE id = new.patient_id), '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER audit_accesslog_fts_delete AFTER DELETE ON audit_accesslog BEGIN
+        DELETE FROM audit_accesslog_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER audit_accesslog_fts_update AFTER UPDATE OF details, ip_address, actor_id, patient_id
+    ON audit_accesslog BEGIN
+        DELETE FROM audit_accesslog_fts WHERE rowid = old.id;
+        INSERT INTO audit_accesslog_fts (rowid, details, ip_address, actor_username, patient_health_id)
+        VALUES (
+            new.id, new.details, coalesce(new.ip_address, ''),
+            coalesce((SELECT username FROM accounts_user WHERE id = new.actor_id), ''),
+            coalesce((SELECT health_id FROM patients_patient WHERE id = new.patient_id), '')
+        );
+    END
+    """,
+    """
+    INSERT INTO audit_accesslog_fts (rowid, details, ip_address, actor_username, patient_health_id)
+    SELECT l.id, l.details, coalesce(l.ip_address, ''), coalesce(u.username, ''), coalesce(p.health_id, '')
+    FROM audit_accesslog l
+    LEFT JOIN accounts_user u ON u.id = l.actor_id
+    LEFT JOIN patients_patient p ON p.id = l.patient_id
+    """,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS audit_accesslog_fts_update",
+    "DROP TRIGGER IF EXISTS audit_accesslog_fts_delete",
+    "DROP TRIGGER IF EXISTS audit_accesslog_fts_insert",
+    "DROP TABLE IF EXISTS audit_accesslog_fts",
+]
+
+# PostgreSQL: a tsvector column (not on the model) filled by a BEFORE trigger, with a GIN index.
+POSTGRES_FORWARD = [
+    "ALTER TABLE audit_accesslog ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION audit_accesslog_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce((SELECT username FROM accounts_user WHERE id = NEW.actor_id), '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce((SELECT health_id FROM patients_patient WHERE id = NEW.patient_id), '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(host(NEW.ip_address), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.details, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER audit_accesslog_search_vector
+    BEFORE INSERT OR UPDATE OF details, ip_address, actor_id, patient_id ON audit_accesslog
+    FOR EACH ROW EXECUTE FUNCTION audit_accesslog_search_vector()
+    """,
+    # Backfill through the trigger
+    "UPDATE audit_accesslog SET details = details",
+    "CREATE INDEX audit_accesslog_search_idx ON audit_accesslog USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS audit_accesslog_search_vector ON audit_accesslog",
+    "DROP FUNCTION IF EXISTS audit_accesslog_search_vector()",
+    "ALTER TABLE audit_accesslog DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_user_role'),
+        ('patients', '0011_otp_store'),
+        ('audit', '0006_auditsegment'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
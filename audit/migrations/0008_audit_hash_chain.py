@@ -0,0 +1,86 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:45
+
+import hashlib
+import json
+from datetime import timezone
+from django.conf import settings
+from django.db import migrations, models
+
+GENESIS_HASH = '0' * 64
+
+
+def chain_existing_rows(apps, schema_editor):
+    """Chain the rows already in the log, in id order, so verification covers them too."""
+    AccessLog = apps.get_model('audit', 'AccessLog')
+    AuditChainHead = apps.get_model('audit', 'AuditChainHead')
+
+    seq, prev = 0, GENESIS_HASH
+    batch = []
+    for log in AccessLog.objects.order_by('id').iterator(chunk_size=2000):
+        seq += 1
+        canonical = json.dumps(
+            [seq, log.timestamp.astimezone(timezone.utc).isoformat(), log.actor_id, log.patient_id,
+             log.action, log.details, log.ip_address],
+            separators=(',', ':'), ensure_ascii=False,
+        ).encode()
+        log.chain_seq = seq
+        log.entry_hash = prev = hashlib.sha256(bytes.fromhex(prev) + canonical).hexdigest()
+        batch.append(log)
+        if len(batch) >= 2000:
+            AccessLog.objects.bulk_update(batch, ['chain_seq', 'entry_hash'])
+            batch = []
+    AccessLog.objects.bulk_update(batch, ['chain_seq', 'entry_hash'])
+    AuditChainHead.objects.create(pk=1, seq=seq, entry_hash=prev)
+
+
+def unchain_rows(apps, schema_editor):
+    apps.get_model('audit', 'AccessLog').objects.update(chain_seq=None, entry_hash=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0007_accesslog_search_index'),
+        ('patients', '0011_otp_store'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditChainHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(default=0)),
+                ('entry_hash', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_seq', models.BigIntegerField(unique=True)),
+                ('last_seq', models.BigIntegerField()),
+                ('prev_entry_hash', models.CharField(max_length=64)),
+                ('last_entry_hash', models.CharField(max_length=64)),
+                ('root', models.CharField(max_length=64)),
+                ('chained_root', models.CharField(max_length=64)),
+                ('nodes', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='accesslog',
+            name='chain_seq',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='accesslog',
+            name='entry_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='accesslog',
+            constraint=models.UniqueConstraint(condition=models.Q(('chain_seq__isnull', False)), fields=('chain_seq',), name='unique_accesslog_chain_seq'),
+        ),
+        migrations.RunPython(chain_existing_rows, unchain_rows),
+    ]
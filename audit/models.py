@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from patients.models import Patient
 
 class AccessLog(models.Model):
@@ -13,13 +14,86 @@ class AccessLog(models.Model):
         GRANT_ACCESS = 'GRANT_ACCESS', 'Grant Access'
         REVOKE_ACCESS = 'REVOKE_ACCESS', 'Revoke Access'
         CREATE_HEALTH_ID = 'CREATE_HEALTH_ID', 'Create Health ID'
+        QR_SCAN = 'QR_SCAN', 'QR Quick Preview Scan'
 
     actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='actions')
     patient = models.ForeignKey(Patient, on_delete=models.SET_NULL, null=True, blank=True, related_name='access_logs')
     action = models.CharField(max_length=20, choices=Action.choices)
     details = models.TextField(blank=True, help_text="Additional context")
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is made, not when a buffered write reaches the database
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    # Tamper evidence, assigned by audit.integrity.append_entries: position in the hash chain
+    # and sha256(previous entry_hash + canonical entry). Null for rows written around it.
+    chain_seq = models.BigIntegerField(null=True, editable=False)
+    entry_hash = models.CharField(max_length=64, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Per-patient history, newest first (sharing history pages seek through it)
+            models.Index(fields=['patient', '-timestamp', '-id'], name='accesslog_patient_ts_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chain_seq'], condition=models.Q(chain_seq__isnull=False), name='unique_accesslog_chain_seq'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.actor} performed {self.action} on {self.timestamp}"
+
+
+class AuditSegment(models.Model):
+    """
+    A gzip NDJSON file of AccessLog rows moved out of the hot table by archive_access_logs.
+    Each covers one UTC day [start, end); a day archived in several runs has several parts.
+    The patient/actor id lists let queries skip segments without opening them.
+    """
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    part = models.PositiveIntegerField(default=0)
+    path = models.CharField(max_length=255, help_text="Relative to AUDIT_ARCHIVE_DIR")
+    row_count = models.PositiveIntegerField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    patient_ids = models.JSONField(default=list)
+    actor_ids = models.JSONField(default=list)
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-start', '-part']
+        constraints = [
+            models.UniqueConstraint(fields=['start', 'part'], name='unique_audit_segment_part'),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.row_count} rows)"
+
+
+class AuditChainHead(models.Model):
+    """Single row holding the last chained sequence number and hash; its lock orders writers."""
+    seq = models.BigIntegerField(default=0)
+    entry_hash = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f"Audit chain head at {self.seq}"
+
+
+class AuditCheckpoint(models.Model):
+    """
+    A Merkle tree over the entry hashes of chain_seq [first_seq, last_seq]. Checkpoints are
+    chained through chained_root, so the latest one commits to the whole log before it.
+    nodes holds every tree level, leaves first, as concatenated 32-byte digests.
+    """
+    first_seq = models.BigIntegerField(unique=True)
+    last_seq = models.BigIntegerField()
+    prev_entry_hash = models.CharField(max_length=64)
+    last_entry_hash = models.CharField(max_length=64)
+    root = models.CharField(max_length=64)
+    chained_root = models.CharField(max_length=64)
+    nodes = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Checkpoint {self.first_seq}-{self.last_seq}"
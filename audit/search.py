@@ -0,0 +1,107 @@
+import re
+from django.db import connection
+from django.db.models import Q
+
+from .models import AccessLog
+
+# The index itself is created by migration 0007: an FTS5 table (audit_accesslog_fts) on
+# SQLite and a trigger-maintained search_vector column with a GIN index on PostgreSQL.
+# Note that a SQLite table rebuild of audit_accesslog drops the FTS triggers with it, so any
+# migration that remakes the table has to recreate them.
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _fts5_query(text):
+    """
+    Turn free text into an FTS5 expression that cannot be a syntax error: every term (or
+    "quoted phrase") becomes a quoted phrase, all of them required; a trailing * keeps
+    prefix matching. IPs and health ids tokenize into phrases and match as such.
+    """
+    parts = []
+    for phrase, word in _TERM.findall(text):
+        term = phrase or word
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""').strip()
+        if term:
+            parts.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+def _ranked_ids_sqlite(text, where, params, limit, offset):
+    query = _fts5_query(text)
+    if not query:
+        return []
+    # bm25 weights per column: details, ip_address, actor_username, patient_health_id
+    sql = f"""
+        SELECT l.id, bm25(audit_accesslog_fts, 1.0, 2.0, 4.0, 4.0) AS score
+        FROM audit_accesslog_fts
+        JOIN audit_accesslog l ON l.id = audit_accesslog_fts.rowid
+        WHERE audit_accesslog_fts MATCH %s {where}
+        ORDER BY score, l.id DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, *params, limit, offset])
+        # bm25 is lower-is-better; expose higher-is-better like ts_rank
+        return [(pk, -score) for pk, score in cursor.fetchall()]
+
+
+def _ranked_ids_postgres(text, where, params, limit, offset):
+    sql = f"""
+        SELECT l.id, ts_rank_cd(l.search_vector, q) AS score
+        FROM audit_accesslog l, websearch_to_tsquery('simple', %s) q
+        WHERE l.search_vector @@ q {where}
+        ORDER BY score DESC, l.id DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [text, *params, limit, offset])
+        return cursor.fetchall()
+
+
+def _ranked_ids_fallback(text, actions, since, until, limit, offset):
+    """Other databases: unranked icontains scan, newest first."""
+    qs = AccessLog.objects.all()
+    for term in text.split():
+        qs = qs.filter(
+            Q(details__icontains=term) | Q(ip_address__icontains=term)
+            | Q(actor__username__icontains=term) | Q(patient__health_id__icontains=term)
+        )
+    if actions:
+        qs = qs.filter(action__in=actions)
+    if since is not None:
+        qs = qs.filter(timestamp__gte=since)
+    if until is not None:
+        qs = qs.filter(timestamp__lt=until)
+    ids = qs.order_by('-timestamp', '-id').values_list('id', flat=True)[offset:offset + limit]
+    return [(pk, None) for pk in ids]
+
+
+def search_access_logs(text, actions=None, since=None, until=None, limit=50, offset=0):
+    """
+    Ranked full-text search over details, IP address, actor username and patient health ID
+    of the hot AccessLog table, optionally restricted to actions and a [since, until) range.
+    Returns [(AccessLog, rank)], best match first; rank is None on unsupported databases.
+    """
+    where, params = [], []
+    if actions:
+        where.append(f"l.action IN ({', '.join(['%s'] * len(actions))})")
+        params.extend(actions)
+    if since is not None:
+        where.append("l.timestamp >= %s")
+        params.append(connection.ops.adapt_datetimefield_value(since))
+    if until is not None:
+        where.append("l.timestamp < %s")
+        params.append(connection.ops.adapt_datetimefield_value(until))
+    where = ''.join(f" AND {clause}" for clause in where)
+
+    if connection.vendor == 'sqlite':
+        ranked = _ranked_ids_sqlite(text, where, params, limit, offset)
+    elif connection.vendor == 'postgresql':
+        ranked = _ranked_ids_postgres(text, where, params, limit, offset)
+    else:
+        ranked = _ranked_ids_fallback(text, actions, since, until, limit, offset)
+
+    logs = AccessLog.objects.select_related('actor', 'patient').in_bulk([pk for pk, _ in ranked])
+    return [(logs[pk], rank) for pk, rank in ranked if pk in logs]
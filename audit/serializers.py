@@ -7,5 +7,5 @@ class AccessLogSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = AccessLog
-        fields = ['id', 'actor', 'actor_username', 'patient', 'patient_health_id', 'action', 'details', 'ip_address', 'timestamp']
+        fields = ['id', 'actor', 'actor_username', 'patient', 'patient_health_id', 'action', 'details', 'ip_address', 'timestamp', 'chain_seq', 'entry_hash']
         read_only_fields = fields
@@ -1,3 +1,322 @@
-from django.test import TestCase
+import gzip
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from patients.models import Patient
+from .models import AccessLog
+from .writer import log_access, flush_access_logs
+
+User = get_user_model()
+
+
+class AuditWriterTest(TestCase):
+    def setUp(self):
+        flush_access_logs()
+        self.user = User.objects.create_user(username='auditpat', password='pw', role='PATIENT')
+        self.patient = Patient.objects.get(user=self.user)
+        AccessLog.objects.all().delete()
+
+    def tearDown(self):
+        flush_access_logs()
+
+    def test_entries_are_buffered_until_flush(self):
+        before = timezone.now()
+        log_access(actor=self.user, patient=self.patient, action=AccessLog.Action.VIEW_PROFILE, details='buffered')
+        self.assertFalse(AccessLog.objects.exists())
+
+        self.assertEqual(flush_access_logs(), 1)
+        log = AccessLog.objects.get()
+        self.assertEqual(log.details, 'buffered')
+        self.assertGreaterEqual(log.timestamp, before)
+
+    @override_settings(AUDIT_BUFFER_SIZE=3)
+    def test_flushes_when_full(self):
+        # Inside a transaction the flush waits for the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                log_access(actor=self.user, patient=self.patient, action=AccessLog.Action.VIEW_RECORDS, details=str(i))
+            self.assertFalse(AccessLog.objects.exists())
+        self.assertEqual(AccessLog.objects.count(), 3)
+
+    @override_settings(AUDIT_BUFFER_SIZE=2)
+    def test_rollback_does_not_lose_other_entries(self):
+        from django.db import transaction
+
+        log_access(actor=self.user, patient=self.patient, action=AccessLog.Action.VIEW_RECORDS, details='other request')
+        try:
+            with transaction.atomic():
+                log_access(actor=self.user, patient=self.patient, action=AccessLog.Action.VIEW_RECORDS, details='failed request')
+                raise RuntimeError('rolled back')
+        except RuntimeError:
+            pass
+        self.assertEqual(flush_access_logs(), 2)
+        self.assertEqual(AccessLog.objects.filter(details='other request').count(), 1)
+
+    def test_sync_writes_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            log_access(actor=self.user, patient=self.patient, action=AccessLog.Action.GRANT_ACCESS, sync=True)
+        self.assertEqual(AccessLog.objects.count(), 1)
+
+    def test_sync_write_in_transaction_waits_for_commit(self):
+        from .models import AuditChainHead
+        with self.captureOnCommitCallbacks() as callbacks:
+            log_access(actor=self.user, patient=self.patient, action=AccessLog.Action.GRANT_ACCESS, sync=True)
+            self.assertFalse(AccessLog.objects.exists())
+            self.assertFalse(AuditChainHead.objects.filter(seq__gt=0).exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(AccessLog.objects.get().chain_seq, 1)
+
+    def test_flushed_at_request_end(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(f'/api/patients/{self.patient.health_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(AccessLog.objects.filter(patient=self.patient, details__startswith='Viewed profile').exists())
+
+    def test_fallback_file_and_replay(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'audit', 'fallback.ndjson')
+
+        with override_settings(AUDIT_FALLBACK_FILE=path):
+            log_access(actor=self.user, patient=self.patient, action=AccessLog.Action.VIEW_RECORDS, details='kept')
+            with mock.patch.object(AccessLog.objects, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                    self.assertLogs('audit.writer', level='ERROR'):
+                flush_access_logs()
+            self.assertFalse(AccessLog.objects.exists())
+            self.assertTrue(os.path.exists(path))
+
+            call_command('replay_audit_fallback', stdout=open(os.devnull, 'w'))
+
+        log = AccessLog.objects.get()
+        self.assertEqual((log.details, log.actor_id, log.patient_id), ('kept', self.user.pk, self.patient.pk))
+        self.assertFalse(os.path.exists(path))
+
+
+class AuditArchiveTest(TestCase):
+    def setUp(self):
+        from .models import AuditSegment
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        override = override_settings(AUDIT_ARCHIVE_DIR=tmp)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = User.objects.create_superuser(username='auditadmin', password='pw', email='auditadmin@test.com')
+        self.patients = [
+            Patient.objects.get(user=User.objects.create_user(username=f'archpat{i}', password='pw', role='PATIENT', email=f'archpat{i}@test.com'))
+            for i in range(2)
+        ]
+        AccessLog.objects.all().delete()
+        now = timezone.now()
+        self.ages = [100, 100, 100, 95, 95, 1, 0]
+        for i, days in enumerate(self.ages):
+            log = AccessLog.objects.create(
+                actor=self.admin,
+                patient=self.patients[0] if i != 3 else self.patients[1],
+                action=AccessLog.Action.VIEW_RECORDS,
+                details=f'entry {i}',
+            )
+            AccessLog.objects.filter(pk=log.pk).update(timestamp=now - timezone.timedelta(days=days, minutes=i))
+        self.segments = AuditSegment.objects
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _walk(self, params):
+        seen, url, first = [], '/api/audit/logs/', True
+        while url:
+            response = self.client.get(url, params if first else None)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(entry['details'] for entry in response.data['results'])
+            url, first = response.data['next'], False
+        return seen
+
+    def test_rollover_moves_old_rows_into_daily_segments(self):
+        call_command('archive_access_logs', '--older-than-days', '30', stdout=open(os.devnull, 'w'))
+        self.assertEqual(AccessLog.objects.count(), 2)
+        self.assertEqual(self.segments.count(), 2)
+        self.assertEqual(sorted(s.row_count for s in self.segments.all()), [2, 3])
+        # Nothing left to move
+        call_command('archive_access_logs', '--older-than-days', '30', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.segments.count(), 2)
+
+    def test_archived_rows_are_listed_when_the_range_reaches_back(self):
+        call_command('archive_access_logs', '--older-than-days', '30', stdout=open(os.devnull, 'w'))
+        # Older by i minutes within a day
+        expected = ['entry 6', 'entry 5', 'entry 3', 'entry 4', 'entry 0', 'entry 1', 'entry 2']
+        # Paging past the hot table without a date filter reaches the archive too
+        self.assertEqual(self._walk({'limit': 2}), expected)
+        until = (timezone.now() - timezone.timedelta(days=50)).date().isoformat()
+        self.assertEqual(self._walk({'until': until}), expected[2:])
+        # A range that stops short of the archive does not open it
+        recent = (timezone.now() - timezone.timedelta(days=10)).date().isoformat()
+        with mock.patch('audit.views.archived_entries') as archived:
+            self.assertEqual(self._walk({'since': recent}), ['entry 6', 'entry 5'])
+        archived.assert_not_called()
+
+        since = (timezone.now() - timezone.timedelta(days=120)).date().isoformat()
+        self.assertEqual(self._walk({'since': since, 'limit': 2}), expected)
+
+        response = self.client.get('/api/audit/logs/', {'since': since, 'patient': self.patients[1].pk})
+        self.assertEqual([e['details'] for e in response.data['results']], ['entry 3'])
+        self.assertEqual(response.data['results'][0]['patient_health_id'], self.patients[1].health_id)
+
+
+class AuditSearchTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='searchadmin', password='pw', email='searchadmin@test.com')
+        user = User.objects.create_user(username='drhouse', password='pw', role='DOCTOR', email='drhouse@test.com')
+        self.patient = Patient.objects.get(
+            user=User.objects.create_user(username='searchpat', password='pw', role='PATIENT', email='searchpat@test.com')
+        )
+        AccessLog.objects.all().delete()
+        self.viewed = AccessLog.objects.create(actor=user, patient=self.patient, action=AccessLog.Action.VIEW_RECORDS, details='Viewed cardiology records', ip_address='10.1.2.3')
+        self.granted = AccessLog.objects.create(actor=self.admin, patient=self.patient, action=AccessLog.Action.GRANT_ACCESS, details='Granted access to Dr. drhouse')
+        AccessLog.objects.create(actor=self.admin, patient=None, action=AccessLog.Action.LOGIN, details='Signed in')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _search(self, **params):
+        response = self.client.get('/api/audit/logs/search/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [entry['id'] for entry in response.data['results']]
+
+    def test_ranked_matches_across_fields(self):
+        # The username match outranks the mention in details
+        self.assertEqual(self._search(q='drhouse'), [self.viewed.pk, self.granted.pk])
+        self.assertEqual(self._search(q='cardio*'), [self.viewed.pk])
+        self.assertEqual(self._search(q='10.1.2.3'), [self.viewed.pk])
+        self.assertEqual(len(self._search(q=self.patient.health_id)), 2)
+
+    def test_filters_and_odd_input(self):
+        self.assertEqual(self._search(q='drhouse', action='GRANT_ACCESS'), [self.granted.pk])
+        tomorrow = (timezone.now() + timezone.timedelta(days=1)).date().isoformat()
+        self.assertEqual(self._search(q='drhouse', since=tomorrow), [])
+        self.assertEqual(self._search(q='AND OR "unbalanced ( NEAR'), [])
+        self.assertEqual(self.client.get('/api/audit/logs/search/').status_code, 400)
+
+    def test_index_follows_inserts_and_deletes(self):
+        log = AccessLog.objects.create(actor=self.admin, patient=self.patient, action=AccessLog.Action.QR_SCAN, details='Scanned at triage desk')
+        self.assertEqual(self._search(q='triage'), [log.pk])
+        log.delete()
+        self.assertEqual(self._search(q='triage'), [])
+
+
+@override_settings(AUDIT_CHECKPOINT_SIZE=4)
+class AuditIntegrityTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='chainpat', password='pw', role='PATIENT', email='chainpat@test.com')
+        other = User.objects.create_user(username='chainother', password='pw', role='PATIENT', email='chainother@test.com')
+        self.patient = Patient.objects.get(user=user)
+        self.other = Patient.objects.get(user=other)
+        AccessLog.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(10):
+                log_access(
+                    actor=user, patient=self.patient if i % 2 else self.other,
+                    action=AccessLog.Action.VIEW_RECORDS, details=f'entry {i}', sync=True,
+                )
+
+    def _verify(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('verify_audit', *args, stdout=out, stderr=err)
+        return out.getvalue()
+
+    def test_writer_chains_and_seals(self):
+        from .models import AuditCheckpoint
+
+        self.assertEqual(
+            list(AccessLog.objects.order_by('chain_seq').values_list('chain_seq', flat=True)), list(range(1, 11))
+        )
+        # Sealed as the head crossed 4 and 8
+        self.assertEqual(list(AuditCheckpoint.objects.order_by('first_seq').values_list('first_seq', 'last_seq')), [(1, 4), (5, 8)])
+        output = self._verify('--patient', self.patient.health_id)
+        self.assertIn('Since last checkpoint: 2 entries', output)
+        self.assertIn('Range proofs: 5 entries', output)
+
+    def test_edited_sealed_entry_is_caught_by_range_proof(self):
+        from django.core.management.base import CommandError
+
+        victim = AccessLog.objects.get(chain_seq=3)
+        AccessLog.objects.filter(pk=victim.pk).update(details='nothing to see here')
+        # Neither the checkpoint chain nor the tail covers it; the range proof does
+        self._verify('--no-seal')
+        with self.assertRaisesMessage(CommandError, 'Audit verification failed'):
+            self._verify('--date', victim.timestamp.date().isoformat())
+
+    def test_edited_or_deleted_tail_entry_is_caught(self):
+        from .integrity import verify_tail
+
+        AccessLog.objects.filter(chain_seq=9).update(action=AccessLog.Action.LOGIN)
+        self.assertEqual([seq for seq, _ in verify_tail().failures], [9])
+        AccessLog.objects.filter(chain_seq=10).delete()
+        self.assertIn('entries 10-10 are missing', verify_tail().failures[-1][1])
+
+    def test_merkle_proofs_for_every_shape(self):
+        import hashlib
+        from .integrity import merkle_levels, merkle_proof, verify_proof
+
+        for size in range(1, 10):
+            leaves = [hashlib.sha256(bytes([i])).digest() for i in range(size)]
+            levels = merkle_levels(leaves)
+            root = levels[-1][0]
+            for index, leaf in enumerate(leaves):
+                self.assertTrue(verify_proof(leaf.hex(), merkle_proof(levels, index), root))
+                self.assertFalse(verify_proof(leaves[(index + 1) % size].hex(), merkle_proof(levels, index), root) and size > 1)
+
+    def _archive_everything(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        override = override_settings(AUDIT_ARCHIVE_DIR=tmp)
+        override.enable()
+        self.addCleanup(override.disable)
+        # A cutoff of tomorrow takes every row, including the two past the last full run
+        call_command('archive_access_logs', '--older-than-days', '-1', stdout=StringIO())
+
+    def test_archiving_seals_a_short_run_first(self):
+        from .models import AuditCheckpoint, AuditSegment
+
+        self._archive_everything()
+        self.assertFalse(AccessLog.objects.exists())
+        self.assertEqual(
+            list(AuditCheckpoint.objects.order_by('first_seq').values_list('first_seq', 'last_seq')),
+            [(1, 4), (5, 8), (9, 10)],
+        )
+        self.assertIn('Since last checkpoint: 0 entries', self._verify())
+        self.assertIn('Archived: 10 entries', self._verify('--full'))
+
+        # Sealing carries on in full runs after the short one
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(4):
+                log_access(actor=self.patient.user, patient=self.patient, action=AccessLog.Action.VIEW_RECORDS, details=f'later {i}', sync=True)
+        self.assertEqual(AuditCheckpoint.objects.order_by('-last_seq').values_list('first_seq', 'last_seq').first(), (11, 14))
+
+        segment = AuditSegment.objects.get()
+        path = os.path.join(settings.AUDIT_ARCHIVE_DIR, segment.path)
+        with gzip.open(path, 'rt') as fh:
+            tampered = fh.read().replace('entry 3', 'entry 4', 1)
+        with gzip.open(path, 'wt') as fh:
+            fh.write(tampered)
+        from django.core.management.base import CommandError
+        self._verify()
+        with self.assertRaisesMessage(CommandError, 'Audit verification failed'):
+            self._verify('--full')
+
+    def test_unsealed_entries_are_not_archived(self):
+        from .archive import archive_day, day_floor
+
+        with self.assertRaisesMessage(ValueError, 'not sealed yet'):
+            archive_day(day_floor(timezone.now()))
+        self.assertEqual(AccessLog.objects.count(), 10)
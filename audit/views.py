@@ -1,6 +1,14 @@
-from rest_framework import viewsets, permissions
-from .models import AccessLog
+import heapq
+from itertools import islice
+from django.db.models import Max, Q
+from rest_framework import viewsets, permissions, serializers, status, decorators
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .models import AccessLog, AuditSegment
 from .serializers import AccessLogSerializer
+from .archive import archived_entries
+from .search import search_access_logs
+from utils.pagination import clamp_limit, decode_time_cursor, encode_time_cursor, parse_date_bound
 
 class IsSuperUser(permissions.BasePermission):
     """
@@ -9,22 +17,120 @@ class IsSuperUser(permissions.BasePermission):
     def has_permission(self, request, view):
         return bool(request.user and request.user.is_superuser)
 
+def _int_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an id")
+
+
 class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows audit logs to be viewed by superusers.
+    The list is keyset-paginated newest first (`before` cursor, `limit`) and filtered by
+    `action` (comma-separated), `actor`, `patient`, `since` and `until`. Whenever the page
+    reaches back past the newest archived day, archived segments are merged in.
     """
-    queryset = AccessLog.objects.all().order_by('-timestamp')
+    queryset = AccessLog.objects.select_related('actor', 'patient').order_by('-timestamp', '-id')
     serializer_class = AccessLogSerializer
     permission_classes = [IsSuperUser]
-    filterset_fields = ['action', 'actor', 'patient']
-    search_fields = ['details', 'ip_address', 'actor__username', 'patient__health_id']
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            actions = [a.strip() for a in params.get('action', '').split(',') if a.strip()]
+            actor = _int_param(params, 'actor')
+            patient = _int_param(params, 'patient')
+            since = parse_date_bound(params['since']) if params.get('since') else None
+            until = parse_date_bound(params['until'], end_of_day=True) if params.get('until') else None
+            before = decode_time_cursor(params['before']) if params.get('before') else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        limit = clamp_limit(params.get('limit'), default=50, maximum=500)
+
+        hot = self.get_queryset()
+        if actions:
+            hot = hot.filter(action__in=actions)
+        if actor is not None:
+            hot = hot.filter(actor_id=actor)
+        if patient is not None:
+            hot = hot.filter(patient_id=patient)
+        if since is not None:
+            hot = hot.filter(timestamp__gte=since)
+        if until is not None:
+            hot = hot.filter(timestamp__lt=until)
+        if before is not None:
+            ts, pk = before
+            hot = hot.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+
+        # Both streams are newest first; the archive is only read as far as the page needs
+        hot_rows = [((log.timestamp, log.pk), log) for log in hot[:limit + 1]]
+        streams = [hot_rows]
+        # Archived rows are all older than the newest segment's end. Skip the archive when the
+        # requested range stops short of it or a full page of hot rows is newer than it.
+        archived_until = AuditSegment.objects.aggregate(end=Max('end'))['end']
+        if archived_until is not None and (since is None or since < archived_until) and (
+            len(hot_rows) <= limit or hot_rows[-1][0][0] < archived_until
+        ):
+            archived = archived_entries(since, until, before, actions, actor, patient)
+            streams.append(((record['timestamp'], record['id']), record) for record in archived)
+        page = list(islice(heapq.merge(*streams, key=lambda item: item[0], reverse=True), limit + 1))
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_time_cursor(*page[-1][0])
+
+        timestamp_field = serializers.DateTimeField()
+        results = []
+        for _, item in page:
+            if isinstance(item, AccessLog):
+                results.append(self.get_serializer(item).data)
+            else:
+                results.append({**item, 'timestamp': timestamp_field.to_representation(item['timestamp'])})
+        return Response({
+            'results': results,
+            'next_cursor': next_cursor,
+            'next': replace_query_param(request.build_absolute_uri(), 'before', next_cursor) if next_cursor else None,
+        })
+
+    @decorators.action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search (`q`) over details, IP, actor username and patient health ID,
+        filtered by `action`, `since` and `until`; paged with `limit` and `offset`.
+        Covers the hot table; archived segments are reached through the list endpoint.
+        """
+        params = request.query_params
+        text = params.get('q', '').strip()
+        if not text:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            actions = [a.strip() for a in params.get('action', '').split(',') if a.strip()]
+            since = parse_date_bound(params['since']) if params.get('since') else None
+            until = parse_date_bound(params['until'], end_of_day=True) if params.get('until') else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        limit = clamp_limit(params.get('limit'), default=50, maximum=500)
+        offset = params.get('offset', '')
+        offset = int(offset) if offset.isdigit() else 0
+
+        hits = search_access_logs(text, actions, since, until, limit=limit + 1, offset=offset)
+        results = [{**self.get_serializer(log).data, 'rank': rank} for log, rank in hits[:limit]]
+        next_url = None
+        if len(hits) > limit:
+            next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+        return Response({'results': results, 'next': next_url})
 
 
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from doctors.models import Doctor, Hospital, Appointment
-from patients.models import Patient
-from labs.models import DiagnosticLab
+from doctors.counters import read_counters
 
 class AdminDashboardStatsView(APIView):
     """
@@ -33,14 +139,24 @@ class AdminDashboardStatsView(APIView):
     permission_classes = [IsSuperUser]
 
     def get(self, request):
+        # Materialized counters: one indexed read instead of a COUNT(*) per table
+        since = timezone.localdate() - timedelta(days=29)
+        counters = read_counters(
+            ['doctors', 'verified_doctors', 'pending_doctors', 'hospitals', 'labs', 'pending_labs', 'patients', 'appointments'],
+            series='new_patients', since=since,
+        )
         stats = {
-            'total_doctors': Doctor.objects.count(),
-            'verified_doctors': Doctor.objects.filter(is_verified=True).count(),
-            'pending_doctors': Doctor.objects.filter(is_verified=False).count(),
-            'total_hospitals': Hospital.objects.count(),
-            'total_labs': DiagnosticLab.objects.count(),
-            'pending_labs': DiagnosticLab.objects.filter(is_verified=False).count(),
-            'total_patients': Patient.objects.count(),
-            'total_appointments': Appointment.objects.count(),
+            'total_doctors': counters['doctors'],
+            'verified_doctors': counters['verified_doctors'],
+            'pending_doctors': counters['pending_doctors'],
+            'total_hospitals': counters['hospitals'],
+            'total_labs': counters['labs'],
+            'pending_labs': counters['pending_labs'],
+            'total_patients': counters['patients'],
+            'total_appointments': counters['appointments'],
+            'new_patients_per_day': [
+                {'date': day, 'count': counters['new_patients'].get(day, 0)}
+                for day in (since + timedelta(days=i) for i in range(30))
+            ],
         }
         return Response(stats)
@@ -0,0 +1,161 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AccessLog
+from .integrity import append_entries, seal_if_due
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_FIELDS = ('actor_id', 'patient_id', 'action', 'details', 'ip_address')
+
+
+class AuditBuffer:
+    """
+    Per-process queue of AccessLog rows waiting to be written with one bulk_create.
+    Flushed when it holds AUDIT_BUFFER_SIZE entries, when its oldest entry is
+    AUDIT_FLUSH_INTERVAL seconds old, at the end of every request (after the response
+    has been handed to the server) and at interpreter exit.
+    If the database refuses the batch, the rows are appended to AUDIT_FALLBACK_FILE
+    instead; `manage.py replay_audit_fallback` loads them back.
+    A flush that falls due inside a transaction waits for it to commit: the buffer holds
+    other requests' entries, which must not roll back with this caller's work.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._oldest = None
+        self._deferred = threading.local()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, entry):
+        with self._lock:
+            if not self._entries:
+                self._oldest = time.monotonic()
+            self._entries.append(entry)
+            due = (
+                len(self._entries) >= settings.AUDIT_BUFFER_SIZE
+                or time.monotonic() - self._oldest >= settings.AUDIT_FLUSH_INTERVAL
+            )
+        if due and connection.in_atomic_block:
+            # Once per transaction; if it rolls back, the entries stay queued
+            if not getattr(self._deferred, 'pending', False):
+                self._deferred.pending = True
+                transaction.on_commit(self.flush)
+        elif due:
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far. Returns the number of entries handled."""
+        with self._lock:
+            entries, self._entries, self._oldest = self._entries, [], None
+        self._deferred.pending = False
+        if not entries:
+            return 0
+        try:
+            # Its own transaction (a savepoint if the caller has one open), so a failure
+            # cannot poison the caller's
+            chain_access_logs(entries)
+        except DatabaseError:
+            logger.exception("Audit flush failed; writing %d entries to %s", len(entries), settings.AUDIT_FALLBACK_FILE)
+            write_fallback(entries)
+        return len(entries)
+
+
+def write_fallback(entries):
+    """Append entries as NDJSON to the fallback file and fsync it."""
+    path = settings.AUDIT_FALLBACK_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = []
+    for entry in entries:
+        row = {field: getattr(entry, field) for field in FALLBACK_FIELDS}
+        row['timestamp'] = entry.timestamp.isoformat()
+        lines.append(json.dumps(row) + '\n')
+    with open(path, 'a', encoding='utf-8') as fh:
+        fh.writelines(lines)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def read_fallback(path):
+    """Parse a fallback file back into unsaved AccessLog rows."""
+    entries = []
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            row['timestamp'] = parse_datetime(row['timestamp'])
+            entries.append(AccessLog(**row))
+    return entries
+
+
+def write_access_logs(entries):
+    """
+    Chain and insert entries. Everything that writes AccessLog rows goes through here (or
+    chain_access_logs) so the hash chain has no holes.
+    Inside a transaction the entries are chained once it commits: the chain head is a single
+    row, and holding its lock until a slow request commits would queue every other audit
+    write behind it. Entries of a transaction that rolls back are not written; if chaining
+    fails after the commit they go to the fallback file and the error propagates.
+    """
+    if not entries:
+        return
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _chain_or_fallback(entries))
+    else:
+        chain_access_logs(entries)
+
+
+def chain_access_logs(entries):
+    """
+    Chain and insert entries now, in a short transaction of their own, or as part of the
+    caller's if one is open (the fallback replay, which must be all or nothing).
+    """
+    with transaction.atomic():
+        head_seq = append_entries(entries)
+    transaction.on_commit(lambda: seal_if_due(head_seq - len(entries), head_seq))
+
+
+def _chain_or_fallback(entries):
+    try:
+        chain_access_logs(entries)
+    except DatabaseError:
+        logger.exception("Audit write failed; writing %d entries to %s", len(entries), settings.AUDIT_FALLBACK_FILE)
+        write_fallback(entries)
+        raise
+
+
+_buffer = AuditBuffer()
+atexit.register(_buffer.flush)
+
+
+def log_access(actor, patient, action, details='', sync=False, **extra):
+    """
+    Record an audit entry. Buffered by default; pass sync=True (or set AUDIT_WRITE_MODE to
+    'sync') for actions that must be committed before the response goes out (when the
+    caller's transaction commits, if one is open), in which case a database failure
+    propagates to the caller.
+    The timestamp is taken now, not when the buffer is flushed.
+    """
+    entry = AccessLog(actor=actor, patient=patient, action=action, details=details, timestamp=timezone.now(), **extra)
+    if sync or settings.AUDIT_WRITE_MODE == 'sync':
+        write_access_logs([entry])
+    else:
+        _buffer.add(entry)
+    return entry
+
+
+def flush_access_logs(**kwargs):
+    """Flush the process buffer; connected to request_finished."""
+    return _buffer.flush()
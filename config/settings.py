@@ -64,7 +64,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'utils.query_inspector.QueryInspectorMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -104,6 +106,14 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+# Set by the load-test server (loadtest/server.py): every transaction takes SQLite's write
+# lock when it begins and waits up to SQLITE_TIMEOUT seconds for it, so many concurrent
+# writers queue instead of failing with "database is locked"
+if config('SQLITE_IMMEDIATE_TRANSACTIONS', default=False, cast=bool):
+    DATABASES['default']['OPTIONS'] = {
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': config('SQLITE_TIMEOUT', default=20, cast=int),
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -147,6 +157,109 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Public origin baked into patient QR codes
+PUBLIC_BASE_URL = config('PUBLIC_BASE_URL', default='http://localhost:8000')
+
+# QR rendering: 'on_demand' stores no image and serves /api/patients/<health_id>/qr.png,
+# 'sync' renders inside Patient.save(), 'deferred' commits the patient first and
+# renders on a background worker (see `render_qr_codes`).
+QR_RENDER_MODE = config('QR_RENDER_MODE', default='on_demand')
+QR_RENDER_WORKERS = config('QR_RENDER_WORKERS', default=2, cast=int)
+QR_IMAGE_CACHE_SIZE = config('QR_IMAGE_CACHE_SIZE', default=1024, cast=int)
+QR_IMAGE_MAX_AGE = config('QR_IMAGE_MAX_AGE', default=60 * 60 * 24, cast=int)
+
+# Health IDs are handed out from per-process blocks reserved in the database
+HEALTH_ID_BLOCK_SIZE = config('HEALTH_ID_BLOCK_SIZE', default=100, cast=int)
+# Keep accepting IDs issued before check digits were introduced (HID- + 8 random hex digits)
+HEALTH_ID_ACCEPT_LEGACY = config('HEALTH_ID_ACCEPT_LEGACY', default=True, cast=bool)
+
+# Signed QR quick-preview payloads (Ed25519). Doctor clients verify them offline against the
+# public keys served at /api/patients/qr-payload/keys/, picked by the key id in each payload.
+# QR_PAYLOAD_PRIVATE_KEY is a base64 private key from `manage.py qr_signing_key`. To rotate,
+# add the old public key (`qr_signing_key --current`) to the retired list and set a new
+# private key: payloads signed with the old one keep verifying until they expire.
+QR_PAYLOAD_PRIVATE_KEY = config('QR_PAYLOAD_PRIVATE_KEY', default='')
+QR_PAYLOAD_RETIRED_PUBLIC_KEYS = config('QR_PAYLOAD_RETIRED_PUBLIC_KEYS', default='', cast=Csv())
+QR_PAYLOAD_ALLERGY_CHARS = config('QR_PAYLOAD_ALLERGY_CHARS', default=80, cast=int)
+
+# Medical-history PDF exports render on a background pool and are reused until the history changes
+PDF_EXPORT_WORKERS = config('PDF_EXPORT_WORKERS', default=2, cast=int)
+# A queued or running export older than this is assumed lost and is re-queued
+PDF_EXPORT_STALE_AFTER = config('PDF_EXPORT_STALE_AFTER', default=600, cast=int)
+
+# Uploaded patient imports run on a background thread, hashing passwords on this many threads
+PATIENT_IMPORT_WORKERS = config('PATIENT_IMPORT_WORKERS', default=4, cast=int)
+
+# Hospital-wide ZIP exports: PDFs render on a bounded pool (processes by default)
+PDF_BULK_EXPORT_WORKERS = config('PDF_BULK_EXPORT_WORKERS', default=2, cast=int)
+PDF_BULK_EXPORT_PROCESSES = config('PDF_BULK_EXPORT_PROCESSES', default=True, cast=bool)
+# Exports running at once per server process, each with its own pool; more get a 503
+PDF_BULK_EXPORT_CONCURRENCY = config('PDF_BULK_EXPORT_CONCURRENCY', default=1, cast=int)
+
+# Shared cache. The local-memory default is per process; point CACHE_BACKEND and
+# CACHE_LOCATION at a shared backend (e.g. Redis) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Doctor -> patient access decisions are cached until the permission expires (capped at
+# ACCESS_CACHE_TTL); in-process copies live at most ACCESS_CACHE_LOCAL_TTL seconds, which
+# is how long other workers may keep honouring a revoked permission. With the per-process
+# local-memory cache only the in-process copies are kept, so that bound still holds.
+ACCESS_CACHE_TTL = config('ACCESS_CACHE_TTL', default=300, cast=int)
+ACCESS_CACHE_LOCAL_TTL = config('ACCESS_CACHE_LOCAL_TTL', default=5, cast=int)
+ACCESS_CACHE_LOCAL_SIZE = config('ACCESS_CACHE_LOCAL_SIZE', default=10000, cast=int)
+
+# OTP storage: 'patients.otp.DatabaseOTPStore' or 'patients.otp.CacheOTPStore' (needs a shared cache)
+OTP_STORE = config('OTP_STORE', default='patients.otp.DatabaseOTPStore')
+OTP_MAX_ATTEMPTS = config('OTP_MAX_ATTEMPTS', default=5, cast=int)
+# How codes reach the patient: 'patients.otp.EmailOTPSender', or 'patients.otp.FileOTPSender'
+# (load testing only: appends codes in clear to OTP_OUTBOX_FILE)
+OTP_SENDER = config('OTP_SENDER', default='patients.otp.EmailOTPSender')
+OTP_OUTBOX_FILE = config('OTP_OUTBOX_FILE', default='')
+# Token-bucket limits on issuing OTPs, in DRF rate syntax
+OTP_DOCTOR_RATE = config('OTP_DOCTOR_RATE', default='20/hour')
+OTP_PATIENT_RATE = config('OTP_PATIENT_RATE', default='5/hour')
+
+# Audit log writes are buffered per process and flushed with one bulk insert at request end,
+# every AUDIT_BUFFER_SIZE entries or after AUDIT_FLUSH_INTERVAL seconds. 'sync' writes each
+# entry immediately. Entries the database rejects are appended to AUDIT_FALLBACK_FILE.
+AUDIT_WRITE_MODE = config('AUDIT_WRITE_MODE', default='buffered')
+AUDIT_BUFFER_SIZE = config('AUDIT_BUFFER_SIZE', default=100, cast=int)
+AUDIT_FLUSH_INTERVAL = config('AUDIT_FLUSH_INTERVAL', default=2.0, cast=float)
+AUDIT_FALLBACK_FILE = config('AUDIT_FALLBACK_FILE', default=str(BASE_DIR / 'var' / 'audit-fallback.ndjson'))
+
+# AccessLog rows older than AUDIT_HOT_DAYS are moved by archive_access_logs into daily
+# gzip NDJSON segments under AUDIT_ARCHIVE_DIR; they stay queryable through /api/audit/logs/.
+AUDIT_HOT_DAYS = config('AUDIT_HOT_DAYS', default=90, cast=int)
+AUDIT_ARCHIVE_DIR = config('AUDIT_ARCHIVE_DIR', default=str(BASE_DIR / 'var' / 'audit-archive'))
+
+# Audit entries are hash-chained; every AUDIT_CHECKPOINT_SIZE entries are sealed under a
+# Merkle checkpoint so ranges can be verified with `manage.py verify_audit` without a rescan.
+AUDIT_CHECKPOINT_SIZE = config('AUDIT_CHECKPOINT_SIZE', default=1024, cast=int)
+
+# Per-request query instrumentation (utils.query_inspector). With QUERY_INSPECTOR_HEADERS the
+# query count, DB time and repeated-query count go out as X-DB-* response headers. A request
+# that runs the same query QUERY_REPEAT_WARNING times, or more than QUERY_COUNT_WARNING queries
+# in all, is logged as a warning naming the code and the lazy attribute behind it.
+QUERY_INSPECTOR = config('QUERY_INSPECTOR', default=True, cast=bool)
+QUERY_INSPECTOR_HEADERS = config('QUERY_INSPECTOR_HEADERS', default=DEBUG, cast=bool)
+QUERY_REPEAT_WARNING = config('QUERY_REPEAT_WARNING', default=5, cast=int)
+QUERY_COUNT_WARNING = config('QUERY_COUNT_WARNING', default=50, cast=int)
+
+# Prometheus-style metrics at /metrics (utils.metrics): request latency, status codes,
+# in-flight requests and DB queries per URL name, email outcomes, PDF/QR render times.
+# Under gunicorn set METRICS_DIR to a directory shared by the workers (emptied on start) so
+# /metrics adds up every worker. /metrics requires METRICS_TOKEN as a bearer token; without
+# one it is only served while DEBUG is on.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1.0, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -163,8 +276,8 @@ REST_FRAMEWORK = {
         'rest_framework.throttling.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/day',
-        'user': '1000/day',
+        'anon': config('THROTTLE_ANON_RATE', default='100/day'),
+        'user': config('THROTTLE_USER_RATE', default='1000/day'),
         'uploads': '20/day'
     }
 }
@@ -184,7 +297,8 @@ ADMIN_EMAIL = 'admin@qrhealthsystem.com'
 
 # Security Settings (Production)
 if not DEBUG:
-    SECURE_SSL_REDIRECT = True
+    # Off only for plain-HTTP servers that never face users (the load-test server)
+    SECURE_SSL_REDIRECT = config('SECURE_SSL_REDIRECT', default=True, cast=bool)
     SESSION_COOKIE_SECURE = True
     CSRF_COOKIE_SECURE = True
     SECURE_BROWSER_XSS_FILTER = True
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from django.core import mail
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import get_resolver, reverse, URLPattern, URLResolver
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from audit.models import AccessLog
+from audit.writer import log_access
+from doctors.models import Hospital, HospitalAdmin, Department, Doctor, Consultation, Appointment
+from labs.models import DiagnosticLab, LabTechnician, LabTest, LabReport
+from loadtest import diff_reports, parse_mix, run_load
+from loadtest.stats import percentile
+from patients.models import Patient, EmergencyContact, PatientDocument, OldPrescription, SharingPermission, PdfExportJob
+from records.models import MedicalRecord
+from support.models import SupportTicket
+from utils.metrics import Counter, Gauge, Histogram, Registry
+from utils.notifications import _deliver
+from utils.query_inspector import QueryBudgetMixin, QueryRecorder, fingerprint
+
+User = get_user_model()
+
+# Query budget for the list endpoint of every router-registered ViewSet, measured with three
+# rows of everything the endpoint shows: (URL name, who asks, max queries). Growing a budget
+# should be a deliberate decision; a new ViewSet without one fails test_every_router_list_has_a_budget.
+ROUTER_BUDGETS = [
+    ('patient-list', 'staff', 2),
+    ('emergency-contact-list', 'patient', 2),
+    ('document-list', 'patient', 2),
+    ('old-prescription-list', 'patient', 2),
+    ('sharing-list', 'patient', 2),
+    ('pdf-export-list', 'patient', 1),
+    ('records-list', 'patient', 1),
+    ('hospital-list', 'patient', 1),
+    ('consultation-list', 'doctor', 4),
+    ('appointment-list', 'doctor', 1),
+    ('department-list', 'hospital_admin', 2),
+    ('accesslog-list', 'staff', 2),  # plus the newest archived day
+    ('supportticket-list', 'staff', 1),
+    ('lab-organization-list', 'patient', 2),
+    ('lab-report-list', 'lab_tech', 2),
+]
+
+
+def _router_list_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _router_list_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and 'list' in getattr(pattern.callback, 'actions', {}).values():
+            if pattern.name and pattern.name.endswith('-list'):
+                yield pattern.name
+
+
+class QueryInspectorTest(TestCase):
+    def test_fingerprint_ignores_parameters_and_in_list_length(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT *  FROM t\n WHERE id IN (%s)'),
+        )
+
+    def test_recorder_names_the_lazy_attribute(self):
+        hospital = Hospital.objects.create(name='Insp', address='x', registration_number='INSP', phone='1', email='insp@test.com')
+        for i in range(3):
+            user = User.objects.create_user(username=f'inspdoc{i}', password='pw', role='DOCTOR', email=f'inspdoc{i}@test.com')
+            Doctor.objects.create(user=user, hospital=hospital, license_number=f'INSP{i}', specialization='Gen')
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            names = [doctor.user.username for doctor in Doctor.objects.all()]
+        self.assertEqual(len(names), 3)
+        [(_, times, origin)] = recorder.repeated(3)
+        self.assertEqual(times, 3)
+        self.assertIn('touching doctor.user', origin)
+        self.assertIn('config/tests.py', origin)
+
+    def test_headers_and_warning(self):
+        user = User.objects.create_user(username='insppat', password='pw', role='PATIENT', email='insppat@test.com')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with self.settings(QUERY_INSPECTOR_HEADERS=True, QUERY_COUNT_WARNING=0):
+            with self.assertLogs('utils.query_inspector', level='WARNING') as logs:
+                response = client.get(reverse('hospital-list'))
+        self.assertGreater(int(response['X-DB-Query-Count']), 0)
+        self.assertIn('X-DB-Time-Ms', response)
+        self.assertEqual(response['X-DB-Repeated-Queries'], '0')
+        self.assertIn('GET /api/doctors/hospitals/', logs.output[0])
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class MetricsTest(TestCase):
+    def _scrape(self):
+        return self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+
+    def test_request_is_recorded_under_its_url_name(self):
+        user = User.objects.create_user(username='metpat', password='pw', role='PATIENT', email='metpat@test.com')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        self.assertEqual(client.get(reverse('hospital-list')).status_code, 200)
+
+        response = self._scrape()
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('http_requests_total{view="hospital-list",method="GET",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="hospital-list",method="GET",le="+Inf"}', body)
+        self.assertIn('http_request_duration_seconds_count{view="hospital-list",method="GET"}', body)
+        self.assertIn('http_request_db_queries_sum{view="hospital-list"}', body)
+        self.assertIn('http_requests_in_flight{view="hospital-list"} 0', body)
+
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self._scrape().status_code, 200)
+
+    def test_no_token_is_only_served_in_debug(self):
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_email_outcomes_are_counted(self):
+        _deliver('Subject', 'Body', ['metrics@test.com'], 'consultation')
+        self.assertEqual(len(mail.outbox), 1)
+        body = self._scrape().content.decode()
+        self.assertIn('notification_emails_total{kind="consultation",outcome="sent"}', body)
+
+    def test_worker_files_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        registry = Registry()
+        requests = Counter('requests_total', 'Requests', ['view'], registry=registry)
+        in_flight = Gauge('in_flight', 'In flight', registry=registry)
+        latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0), registry=registry)
+        requests.inc(view='a')
+        in_flight.set(1)
+        latency.observe(0.05)
+
+        # One live worker (our parent) and one that has exited
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        for pid in (os.getppid(), dead.pid):
+            with open(os.path.join(directory, f'{pid}.json'), 'w') as out:
+                json.dump({'requests_total': [[['a'], 2]], 'in_flight': [[[], 3]], 'latency_seconds': [[[], [[0, 1, 0], 0.5]]]}, out)
+
+        with self.settings(METRICS_DIR=directory):
+            text = registry.expose()
+        self.assertIn('requests_total{view="a"} 5', text)
+        # Gauges add up live processes only: ours and the parent's, not the exited one's
+        self.assertIn('in_flight 4', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3', text)
+        self.assertIn('latency_seconds_count 3', text)
+        self.assertIn('latency_seconds_sum 1.05', text)
+
+        # The exited worker's file was folded into the aggregate, and still counts once
+        self.assertCountEqual([f for f in os.listdir(directory) if f.endswith('.json')], ['aggregate.json', f'{os.getppid()}.json'])
+        with self.settings(METRICS_DIR=directory):
+            self.assertIn('requests_total{view="a"} 5', registry.expose())
+
+    def test_reused_pid_does_not_overwrite_an_exited_workers_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        registry = Registry()
+        requests = Counter('requests_total', 'Requests', ['view'], registry=registry)
+        # Left behind by an earlier process that had our pid
+        with open(os.path.join(directory, f'{os.getpid()}.json'), 'w') as out:
+            json.dump({'requests_total': [[['a'], 7]]}, out)
+
+        with self.settings(METRICS_DIR=directory, METRICS_FLUSH_INTERVAL=3600):
+            requests.inc(view='a')
+            registry.flush()
+            self.assertIn('requests_total{view="a"} 8', registry.expose())
+
+
+class RouterQueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='Budget General', address='1 Main St', registration_number='BUD1', phone='1', email='bud@test.com', is_verified=True)
+        cls.users = {
+            'staff': User.objects.create_superuser(username='budroot', password='pw', email='budroot@test.com'),
+        }
+        cls.users['hospital_admin'] = User.objects.create_user(username='budadmin', password='pw', role='HOSPITAL_ADMIN', email='budadmin@test.com')
+        HospitalAdmin.objects.create(user=cls.users['hospital_admin'], hospital=cls.hospital, is_verified=True)
+        test_type = LabTest.objects.create(name='CBC', code='BUD-CBC')
+
+        doctors, patients, technicians = [], [], []
+        for i in range(3):
+            department = Department.objects.create(hospital=cls.hospital, name=f'Dept {i}')
+            user = User.objects.create_user(username=f'buddoc{i}', password='pw', role='DOCTOR', email=f'buddoc{i}@test.com')
+            doctors.append(Doctor.objects.create(
+                user=user, hospital=cls.hospital, department=department, license_number=f'BUDD{i}', specialization='Gen', is_verified=True
+            ))
+            user = User.objects.create_user(username=f'budpat{i}', password='pw', role='PATIENT', email=f'budpat{i}@test.com')
+            patients.append(Patient.objects.get(user=user))
+            lab = DiagnosticLab.objects.create(
+                name=f'Lab {i}', address='x', accreditation_number=f'BUDL{i}', phone='2', email=f'budlab{i}@test.com', hospital=cls.hospital, is_verified=True
+            )
+            user = User.objects.create_user(username=f'budtech{i}', password='pw', role='LAB_TECH', email=f'budtech{i}@test.com')
+            technicians.append(LabTechnician.objects.create(user=user, lab=lab, license_number=f'BUDT{i}', is_verified=True))
+            Hospital.objects.create(name=f'Other {i}', address='x', registration_number=f'BUDH{i}', phone='3', email=f'budh{i}@test.com', is_verified=True)
+
+        owner = patients[0]
+        cls.users.update(patient=owner.user, doctor=doctors[0].user, lab_tech=technicians[0].user)
+        for i, (doctor, patient) in enumerate(zip(doctors, patients)):
+            EmergencyContact.objects.create(patient=owner, name=f'Kin {i}', relationship='Sibling', phone='1')
+            PatientDocument.objects.create(patient=owner, document_type='OTHER', title=f'Doc {i}', file='patient_documents/x.pdf', uploaded_by=owner.user)
+            OldPrescription.objects.create(patient=owner, prescription_date=date.today(), symptoms='Cough', uploaded_by=owner.user)
+            SharingPermission.objects.create(patient=owner, doctor=doctor, access_type='OTP_FULL', granted_by=owner.user, expires_at=timezone.now() + timedelta(days=1))
+            PdfExportJob.objects.create(patient=owner, requested_by=owner.user, fingerprint=f'{i:064d}')
+            MedicalRecord.objects.create(patient=owner, doctor=doctor.user, record_type='DIAGNOSIS', title=f'Record {i}')
+            Consultation.objects.create(doctor=doctors[0], patient=patient, consultation_date=timezone.now(), chief_complaint='Cough')
+            Appointment.objects.create(doctor=doctors[0], patient=patient, appointment_date=timezone.now(), reason='Checkup')
+            LabReport.objects.create(patient=patient, technician=technicians[0], test_type=test_type)
+            SupportTicket.objects.create(user=patient.user, subject='Help', description='Please')
+            log_access(doctor.user, patient, AccessLog.Action.VIEW_RECORDS, details='Budget', sync=True)
+
+    def test_every_router_list_has_a_budget(self):
+        budgeted = {name for name, _, _ in ROUTER_BUDGETS}
+        missing = set(_router_list_names(get_resolver().url_patterns)) - budgeted
+        self.assertFalse(missing, f"Router list endpoints without a query budget: {sorted(missing)}")
+
+    def test_router_list_query_budgets(self):
+        client = APIClient()
+        for name, role, budget in ROUTER_BUDGETS:
+            with self.subTest(name):
+                client.force_authenticate(user=self.users[role])
+                response = self.assertQueryBudget(budget, reverse(name), client=client)
+                self.assertEqual(response.status_code, 200)
+
+
+class LoadTestHarnessTest(LiveServerTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        hospital = Hospital.objects.create(name='LT General', address='x', registration_number='LT1', phone='1', email='lt@test.com')
+        lab = DiagnosticLab.objects.create(name='LT Lab', address='x', accreditation_number='LTL1', phone='2', email='ltlab@test.com')
+        LabTest.objects.create(name='CBC', code='LT-CBC')
+        for i in range(2):
+            User.objects.create_user(username=f'lt_patient{i}', password='pw', role='PATIENT', email=f'ltpat{i}@test.com')
+            user = User.objects.create_user(username=f'lt_doctor{i}', password='pw', role='DOCTOR', email=f'ltdoc{i}@test.com')
+            Doctor.objects.create(user=user, hospital=hospital, license_number=f'LTD{i}', specialization='Gen', is_verified=True)
+        user = User.objects.create_user(username='lt_lab_tech0', password='pw', role='LAB_TECH', email='lttech@test.com')
+        LabTechnician.objects.create(user=user, lab=lab, license_number='LTT0', is_verified=True)
+
+    def test_mixed_run_reports_every_flow(self):
+        mix = parse_mix('download_pdf=0')
+        # The live server threads share the in-memory test database connection, so the query
+        # inspector would count concurrent requests' queries together
+        with self.settings(MEDIA_ROOT=self.media, QUERY_INSPECTOR=False):
+            report = asyncio.run(run_load(
+                self.live_server_url, mix, concurrency=2, duration=60, iterations=24, prefix='lt', password='pw',
+                accounts={'PATIENT': 2, 'DOCTOR': 2, 'LAB_TECH': 1}, label='test',
+            ))
+        # No console to read OTP codes from when the server was not started by the driver
+        self.assertNotIn('otp', report['meta']['mix'])
+        self.assertEqual(sum(s['count'] for s in report['scenarios'].values()), 24)
+        self.assertEqual(report['total']['errors'], 0, report['requests'])
+        for name, summary in report['requests'].items():
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'], name)
+        self.assertEqual(Consultation.objects.count(), report['requests'].get('consultation.create', {}).get('count', 0))
+
+    def test_otp_codes_reach_the_driver_through_the_outbox(self):
+        from loadtest.server import OtpMailbox
+
+        outbox = os.path.join(self.media, 'otp-outbox.txt')
+        mix = {name: 0 for name in parse_mix('')}
+        mix['otp'] = 1
+        with self.settings(
+            MEDIA_ROOT=self.media, QUERY_INSPECTOR=False, OTP_SENDER='patients.otp.FileOTPSender',
+            OTP_OUTBOX_FILE=outbox, OTP_DOCTOR_RATE='1000/hour', OTP_PATIENT_RATE='1000/hour',
+        ):
+            report = asyncio.run(run_load(
+                self.live_server_url, mix, concurrency=2, duration=60, iterations=6, prefix='lt', password='pw',
+                accounts={'PATIENT': 2, 'DOCTOR': 2, 'LAB_TECH': 1}, label='test', mailbox=OtpMailbox(outbox),
+            ))
+        self.assertEqual(report['scenarios']['otp']['count'], 6)
+        self.assertEqual(report['scenarios']['otp']['errors'], 0, report['requests'])
+        self.assertEqual(report['requests']['otp.verify']['statuses'], {'200': 6})
+
+    def test_diff_flags_regressions(self):
+        def report(p95, errors=0):
+            summary = {'count': 100, 'throughput': 50.0, 'error_rate': errors, 'p50_ms': 10.0, 'p95_ms': p95, 'p99_ms': 30.0}
+            return {'scenarios': {}, 'requests': {'qr_scan': summary}}
+
+        self.assertFalse(any(row[-1] for row in diff_reports(report(20.0), report(21.0))))
+        regressed = [(row[1]) for row in diff_reports(report(20.0), report(30.0, errors=0.01)) if row[-1]]
+        self.assertEqual(regressed, ['p95_ms', 'error_rate'])
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 99), 4)
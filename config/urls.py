@@ -27,6 +27,7 @@ from drf_yasg import openapi
 from audit.views import AdminDashboardStatsView
 from doctors.views import DoctorListView, DoctorVerificationView, HospitalListView, HospitalVerificationView
 from labs.views import LabListView, LabVerificationView
+from utils.metrics import metrics_view
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -43,6 +44,7 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/auth/', include('accounts.urls')),
     path('api/patients/', include('patients.urls')),
     path('api/records/', include('records.urls')),
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Hospital, Doctor, Consultation
+from .counters import update_counted
 
 
 @admin.register(Hospital)
@@ -23,7 +24,7 @@ class DoctorAdmin(admin.ModelAdmin):
     
     @admin.action(description='Verify selected doctors')
     def verify_doctors(self, request, queryset):
-        queryset.update(is_verified=True)
+        update_counted(queryset, is_verified=True)
     
     @admin.action(description='Set authorization level to BASIC')
     def set_basic_auth(self, request, queryset):
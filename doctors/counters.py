@@ -0,0 +1,212 @@
+from collections import Counter as Tally, namedtuple
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Counters are keyed by (name, scope, bucket): scope is '' for site-wide counters or
+# 'hospital:<id>', bucket is a date for per-day series and None for running totals.
+GLOBAL = ''
+CounterSource = namedtuple('CounterSource', ['model', 'fields', 'keys'])
+
+
+def hospital_scope(hospital_id):
+    return f"hospital:{hospital_id}"
+
+
+def _doctor_keys(row):
+    keys = [('doctors', GLOBAL, None), ('verified_doctors' if row['is_verified'] else 'pending_doctors', GLOBAL, None)]
+    if row['hospital_id']:
+        keys.append(('doctors', hospital_scope(row['hospital_id']), None))
+        if not row['is_verified']:
+            keys.append(('pending_doctors', hospital_scope(row['hospital_id']), None))
+    return keys
+
+
+def _lab_keys(row):
+    keys = [('labs', GLOBAL, None)]
+    if not row['is_verified']:
+        keys.append(('pending_labs', GLOBAL, None))
+    if row['hospital_id']:
+        keys.append(('labs', hospital_scope(row['hospital_id']), None))
+    return keys
+
+
+def _consultation_keys(row):
+    # Attributed to the doctor's hospital when written, like HospitalStatsView counted them
+    if row['doctor__hospital_id']:
+        return [('consultations', hospital_scope(row['doctor__hospital_id']), None)]
+    return []
+
+
+def _patient_keys(row):
+    return [('patients', GLOBAL, None), ('new_patients', GLOBAL, timezone.localdate(row['created_at']))]
+
+
+SOURCES = [
+    CounterSource('doctors.Doctor', ('is_verified', 'hospital_id'), _doctor_keys),
+    CounterSource('doctors.Hospital', (), lambda row: [('hospitals', GLOBAL, None)]),
+    CounterSource('doctors.Appointment', (), lambda row: [('appointments', GLOBAL, None)]),
+    CounterSource('doctors.Consultation', ('doctor__hospital_id',), _consultation_keys),
+    CounterSource('labs.DiagnosticLab', ('is_verified', 'hospital_id'), _lab_keys),
+    CounterSource('patients.Patient', ('created_at',), _patient_keys),
+]
+
+
+def source_for(model):
+    label = model._meta.label
+    return next((source for source in SOURCES if source.model == label), None)
+
+
+def _instance_row(instance, fields):
+    row = {}
+    for lookup in fields:
+        value = instance
+        for attr in lookup.split('__'):
+            value = getattr(value, attr) if value is not None else None
+        row[lookup] = value
+    return row
+
+
+def counter_keys(instance, source=None):
+    source = source or source_for(type(instance))
+    return source.keys(_instance_row(instance, source.fields))
+
+
+def stored_counter_keys(instance, source=None):
+    """Keys the instance counted under as last saved (before the save in progress)."""
+    source = source or source_for(type(instance))
+    if instance._state.adding or instance.pk is None:
+        return []
+    if not source.fields:
+        return source.keys({})
+    if hasattr(instance, 'get_initial_value') and all('__' not in f for f in source.fields):
+        row = {f: instance.get_initial_value(f) for f in source.fields}
+    else:
+        row = type(instance)._base_manager.filter(pk=instance.pk).values(*source.fields).first()
+        if row is None:
+            return []
+    return source.keys(row)
+
+
+def bump(deltas):
+    """
+    Apply {(name, scope, bucket): delta} with relative UPDATEs in the caller's transaction, so
+    concurrent writers never lose increments. Missing counters are created.
+    """
+    from .models import Counter
+
+    for (name, scope, bucket), delta in deltas.items():
+        if not delta:
+            continue
+        lookup = {'name': name, 'scope': scope, 'bucket': bucket}
+        if Counter.objects.filter(**lookup).update(value=F('value') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                Counter.objects.create(value=delta, **lookup)
+        except IntegrityError:
+            # Created concurrently; now the update will find it
+            Counter.objects.filter(**lookup).update(value=F('value') + delta)
+
+
+def count_change(before, after):
+    """Deltas that move an object from the `before` keys to the `after` keys."""
+    deltas = Tally(after)
+    deltas.subtract(Tally(before))
+    return dict(deltas)
+
+
+def count_created(instances):
+    """For bulk_create callers, which bypass model signals."""
+    deltas = Tally()
+    for instance in instances:
+        deltas.update(counter_keys(instance))
+    bump(dict(deltas))
+
+
+def update_counted(queryset, **values):
+    """queryset.update() for counted models: bulk updates bypass the signals, so diff here."""
+    source = source_for(queryset.model)
+    with transaction.atomic():
+        before = Tally(k for row in queryset.values(*source.fields) for k in source.keys(row))
+        pks = list(queryset.values_list('pk', flat=True))
+        updated = queryset.model._base_manager.filter(pk__in=pks).update(**values)
+        after = Tally(
+            k for row in queryset.model._base_manager.filter(pk__in=pks).values(*source.fields)
+            for k in source.keys(row)
+        )
+        bump(count_change(before.elements(), after.elements()))
+    return updated
+
+
+def read_counters(names, scope=GLOBAL, series=None, since=None):
+    """
+    Current totals for `names` (missing counters are 0) in one indexed read. With `series`,
+    the same query also returns that per-day counter from `since` on, as {date: value}.
+    """
+    from .models import Counter
+
+    query = Q(name__in=names, bucket__isnull=True)
+    if series:
+        query |= Q(name=series, bucket__gte=since)
+    totals = {name: 0 for name in names}
+    if series:
+        totals[series] = {}
+    for name, bucket, value in Counter.objects.filter(query, scope=scope).order_by('bucket').values_list('name', 'bucket', 'value'):
+        if bucket is None:
+            totals[name] = value
+        else:
+            totals[name][bucket] = value
+    return totals
+
+
+def compute_counters(apps=global_apps):
+    """
+    Recompute every counter from the source tables: one grouped aggregate per model.
+    Takes an app registry so migrations can run it against historical models.
+    """
+    totals = Tally()
+    for source in SOURCES:
+        model = apps.get_model(source.model)
+        if source.model == 'patients.Patient':
+            rows = (
+                model.objects.annotate(day=TruncDate('created_at')).values('day')
+                .annotate(n=Count('pk')).values_list('day', 'n')
+            )
+            for day, n in rows:
+                totals[('patients', GLOBAL, None)] += n
+                totals[('new_patients', GLOBAL, day)] += n
+            continue
+        if source.fields:
+            rows = model.objects.values(*source.fields).annotate(n=Count('pk')).order_by()
+        else:
+            rows = [{'n': model.objects.count()}]
+        for row in rows:
+            for key in source.keys(row):
+                totals[key] += row['n']
+    return {key: value for key, value in totals.items() if value}
+
+
+def reconcile_counters(apps=global_apps, dry_run=False):
+    """
+    Replace the stored counters with freshly computed ones. Returns {key: (stored, actual)}
+    for every counter that had drifted.
+    """
+    Counter = apps.get_model('doctors', 'Counter')
+    with transaction.atomic():
+        actual = compute_counters(apps)
+        stored = {(c.name, c.scope, c.bucket): c.value for c in Counter.objects.all()}
+        drift = {
+            key: (stored.get(key, 0), actual.get(key, 0))
+            for key in set(stored) | set(actual)
+            if stored.get(key, 0) != actual.get(key, 0)
+        }
+        if not dry_run and drift:
+            Counter.objects.all().delete()
+            Counter.objects.bulk_create([
+                Counter(name=name, scope=scope, bucket=bucket, value=value)
+                for (name, scope, bucket), value in actual.items()
+            ])
+    return drift
@@ -0,0 +1,370 @@
+"""
+generate_load_dataset.py
+Build a large synthetic dataset for capacity planning and benchmarks: hospitals, departments,
+doctors, labs, technicians, patients, consultations, appointments, lab reports, sharing
+permissions and audit logs, written with chunked bulk_create.
+
+The data is deterministic for a given --seed and size on an empty database, and skewed the
+way production is: a few patients account for many visits and a few doctors see most of them.
+Patient QR codes are not rendered (bulk_create skips Patient.save); they are rendered on
+first request, or ahead of time with `render_qr_codes`. The dashboard counters are
+reconciled once at the end instead of being bumped row by row.
+
+Usage: python manage.py generate_load_dataset [--patients 1000000] [--seed 42]
+       [--chunk-size 5000] [--prefix load] [--hospitals N] [--doctors N] ...
+"""
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from audit.models import AccessLog
+from audit.writer import chain_access_logs
+from doctors.counters import reconcile_counters
+from doctors.models import Hospital, Department, Doctor, Consultation, Appointment
+from labs.models import DiagnosticLab, LabTechnician, LabTest, LabReport
+from patients.health_id import allocate_health_ids
+from patients.importer import chunked
+from patients.models import Patient, SharingPermission
+
+User = get_user_model()
+
+DEPARTMENTS = ['General Medicine', 'Cardiology', 'Orthopedics', 'Pediatrics', 'Dermatology', 'Neurology']
+SPECIALIZATIONS = ['General Physician', 'Cardiologist', 'Orthopedic Surgeon', 'Pediatrician', 'Dermatologist', 'Neurologist']
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Chennai', 'Kolkata', 'Pune', 'Hyderabad', 'Jaipur']
+FIRST_NAMES = ['Aarav', 'Diya', 'Ishaan', 'Ananya', 'Vihaan', 'Saanvi', 'Arjun', 'Meera', 'Kabir', 'Riya']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Reddy', 'Singh', 'Gupta', 'Nair', 'Das', 'Mehta', 'Khan']
+COMPLAINTS = ['Fever', 'Cough', 'Headache', 'Back pain', 'Chest pain', 'Skin rash', 'Fatigue', 'Follow-up']
+LAB_TESTS = [('Complete Blood Count', 'CBC'), ('Lipid Profile', 'LIPID'), ('HbA1c', 'HBA1C'), ('Thyroid Panel', 'TSH')]
+BLOOD_GROUPS = [code for code, _ in Patient.BLOOD_GROUPS]
+
+# Entity counts per patient when not given explicitly
+RATIOS = {
+    'hospitals': 1 / 5000,
+    'doctors': 1 / 250,
+    'labs': 1 / 5000,
+    'technicians': 3 / 5000,
+    'consultations': 2,
+    'appointments': 1,
+    'lab_reports': 1,
+    'permissions': 0.5,
+    'audit_logs': 2,
+}
+
+
+def skewed(rng, n, share):
+    """
+    An index in [0, n) where the first 1% of indexes (at least one) get `share` of the
+    picks and the rest are uniform: a few heavy patients, a few busy doctors.
+    """
+    if rng.random() < share:
+        return rng.randrange(max(1, n // 100))
+    return rng.randrange(n)
+
+
+class Command(BaseCommand):
+    help = 'Generate a large deterministic synthetic dataset for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        for name in RATIOS:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None,
+                                help=f"Default: {RATIOS[name]:g} per patient")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skew', type=float, default=0.3, help='Share of activity going to the busiest 1%% of patients and doctors')
+        parser.add_argument('--days', type=int, default=365, help='Spread event dates over this many past days')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='load', help='Prefix for usernames, emails and registration numbers')
+        parser.add_argument('--password', default='loadtest123', help='Password shared by every generated user')
+
+    def handle(self, *args, **options):
+        patients = options['patients']
+        self.sizes = {
+            name: options[name] if options[name] is not None else max(1, round(patients * ratio))
+            for name, ratio in RATIOS.items()
+        }
+        self.sizes['patients'] = patients
+        # Events pick from these, so each needs at least one row
+        for name in ('patients', 'hospitals', 'doctors', 'labs', 'technicians'):
+            if self.sizes[name] < 1:
+                raise CommandError(f"--{name} must be at least 1")
+        self.rng = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.chunk_size = options['chunk_size']
+        self.prefix = options['prefix']
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days']).total_seconds()
+        if User.objects.filter(username__startswith=f"{self.prefix}_").exists():
+            raise CommandError(f"Users prefixed '{self.prefix}_' already exist; pick another --prefix")
+
+        # Hashing is deliberately slow; one hash shared by every user keeps it out of the picture
+        self.password = make_password(options['password'])
+        self.stdout.write(self.style.MIGRATE_HEADING('=== Generating load dataset ==='))
+        started = time.monotonic()
+        total = 0
+        for name, step in [
+            ('hospitals', self.create_hospitals),
+            ('departments', self.create_departments),
+            ('doctors', self.create_doctors),
+            ('labs', self.create_labs),
+            ('technicians', self.create_technicians),
+            ('patients', self.create_patients),
+            ('consultations', self.create_consultations),
+            ('appointments', self.create_appointments),
+            ('lab_reports', self.create_lab_reports),
+            ('permissions', self.create_permissions),
+            ('audit_logs', self.create_audit_logs),
+        ]:
+            step_started = time.monotonic()
+            created = step()
+            elapsed = time.monotonic() - step_started
+            total += created
+            rate = created / elapsed if elapsed else 0
+            self.stdout.write(f"  {name}: {created} in {elapsed:.1f}s ({rate:.0f}/s)")
+
+        # bulk_create skips the signals that keep the dashboard counters in step
+        reconcile_counters()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Generated {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f}/s)"))
+
+    # ── helpers ──────────────────────────────────────────────────────────────
+
+    def _write(self, model, objects):
+        """bulk_create an iterable of unsaved objects, one transaction per chunk."""
+        created = []
+        for chunk in chunked(objects, self.chunk_size):
+            with transaction.atomic():
+                created.extend(model.objects.bulk_create(chunk))
+        return created
+
+    def _write_count(self, model, objects):
+        """_write for the large event tables: keeps nothing but the count, so memory stays flat."""
+        created = 0
+        for chunk in chunked(objects, self.chunk_size):
+            with transaction.atomic():
+                created += len(model.objects.bulk_create(chunk))
+        return created
+
+    def _name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def _users(self, role, count, offset=0):
+        for i in range(offset, offset + count):
+            first_name, last_name = self._name()
+            username = f"{self.prefix}_{role.lower()}{i}"
+            yield User(
+                username=username,
+                email=f"{username}@{self.prefix}.example.com",
+                password=self.password,
+                first_name=first_name,
+                last_name=last_name,
+                role=role,
+            )
+
+    def _past(self):
+        return self.now - timedelta(seconds=self.rng.random() * self.span)
+
+    def _patient(self):
+        return self.patients[skewed(self.rng, len(self.patients), self.skew)]
+
+    def _doctor(self):
+        return self.doctors[skewed(self.rng, len(self.doctors), self.skew)]
+
+    # ── providers ────────────────────────────────────────────────────────────
+
+    def create_hospitals(self):
+        self.hospitals = self._write(Hospital, (
+            Hospital(
+                name=f"{self.rng.choice(CITIES)} General Hospital {i}",
+                address=f"{i} Hospital Road, {self.rng.choice(CITIES)}",
+                registration_number=f"{self.prefix.upper()}-H{i}",
+                phone=f"98{i:08d}"[:15],
+                email=f"hospital{i}@{self.prefix}.example.com",
+                is_verified=self.rng.random() < 0.9,
+            )
+            for i in range(self.sizes['hospitals'])
+        ))
+        return len(self.hospitals)
+
+    def create_departments(self):
+        self.departments = self._write(Department, (
+            Department(hospital=hospital, name=name)
+            for hospital in self.hospitals
+            for name in DEPARTMENTS
+        ))
+        return len(self.departments)
+
+    def create_doctors(self):
+        users = self._write(User, self._users(User.Role.DOCTOR, self.sizes['doctors']))
+        doctors = []
+        for i, user in enumerate(users):
+            # Busy hospitals employ more doctors
+            hospital_index = skewed(self.rng, len(self.hospitals), self.skew)
+            department_index = self.rng.randrange(len(DEPARTMENTS))
+            doctors.append(Doctor(
+                user=user,
+                hospital=self.hospitals[hospital_index],
+                department=self.departments[hospital_index * len(DEPARTMENTS) + department_index],
+                license_number=f"{self.prefix.upper()}-D{i}",
+                specialization=SPECIALIZATIONS[department_index],
+                years_of_experience=self.rng.randrange(1, 35),
+                is_verified=self.rng.random() < 0.9,
+            ))
+        self.doctors = self._write(Doctor, doctors)
+        return len(users) + len(self.doctors)
+
+    def create_labs(self):
+        self.labs = self._write(DiagnosticLab, (
+            DiagnosticLab(
+                name=f"{self.rng.choice(CITIES)} Diagnostics {i}",
+                address=f"{i} Lab Lane",
+                accreditation_number=f"{self.prefix.upper()}-L{i}",
+                phone=f"97{i:08d}"[:15],
+                email=f"lab{i}@{self.prefix}.example.com",
+                # Most labs belong to a hospital, some are independent
+                hospital=self.rng.choice(self.hospitals) if self.rng.random() < 0.8 else None,
+                is_verified=self.rng.random() < 0.9,
+            )
+            for i in range(self.sizes['labs'])
+        ))
+        self.lab_tests = []
+        for name, code in LAB_TESTS:
+            test_type, _ = LabTest.objects.get_or_create(code=code, defaults={'name': name})
+            self.lab_tests.append(test_type)
+        return len(self.labs)
+
+    def create_technicians(self):
+        users = self._write(User, self._users(User.Role.LAB_TECH, self.sizes['technicians']))
+        self.technicians = self._write(LabTechnician, (
+            LabTechnician(
+                user=user,
+                lab=self.labs[i % len(self.labs)],
+                license_number=f"{self.prefix.upper()}-T{i}",
+                is_verified=self.rng.random() < 0.9,
+            )
+            for i, user in enumerate(users)
+        ))
+        return len(users) + len(self.technicians)
+
+    def create_patients(self):
+        # Users and patients go in together per chunk so memory stays flat at 1M rows
+        self.patients = []
+        created = 0
+        for chunk in chunked(range(self.sizes['patients']), self.chunk_size):
+            health_ids = allocate_health_ids(len(chunk))
+            with transaction.atomic():
+                users = User.objects.bulk_create(list(self._users(User.Role.PATIENT, len(chunk), offset=chunk[0])))
+                patients = Patient.objects.bulk_create([
+                    Patient(
+                        user=user,
+                        health_id=health_id,
+                        date_of_birth=(self.now - timedelta(days=self.rng.randrange(365, 90 * 365))).date(),
+                        blood_group=self.rng.choice(BLOOD_GROUPS),
+                        gender=self.rng.choice(['Male', 'Female']),
+                        organ_donor=self.rng.random() < 0.05,
+                    )
+                    for user, health_id in zip(users, health_ids)
+                ])
+            # Keep just the keys: later steps only need them for foreign keys
+            self.patients.extend((patient.pk, patient.user_id) for patient in patients)
+            created += len(users) + len(patients)
+        return created
+
+    def create_consultations(self):
+        def consultations():
+            for _ in range(self.sizes['consultations']):
+                doctor = self._doctor()
+                patient_id, _ = self._patient()
+                yield Consultation(
+                    doctor_id=doctor.pk,
+                    patient_id=patient_id,
+                    consultation_date=self._past(),
+                    chief_complaint=self.rng.choice(COMPLAINTS),
+                )
+        return self._write_count(Consultation, consultations())
+
+    def create_appointments(self):
+        statuses = Appointment.Status.values
+
+        def appointments():
+            for _ in range(self.sizes['appointments']):
+                patient_id, _ = self._patient()
+                yield Appointment(
+                    doctor_id=self._doctor().pk,
+                    patient_id=patient_id,
+                    # A tenth in the future, the rest already happened
+                    appointment_date=self.now + timedelta(seconds=self.rng.uniform(-0.9, 0.1) * self.span),
+                    reason=self.rng.choice(COMPLAINTS),
+                    status=self.rng.choice(statuses),
+                )
+        return self._write_count(Appointment, appointments())
+
+    def create_lab_reports(self):
+        def reports():
+            for _ in range(self.sizes['lab_reports']):
+                patient_id, _ = self._patient()
+                yield LabReport(
+                    patient_id=patient_id,
+                    technician_id=self.technicians[skewed(self.rng, len(self.technicians), self.skew)].pk,
+                    test_type_id=self.rng.choice(self.lab_tests).pk,
+                    result_data={'value': round(self.rng.uniform(1, 200), 1)},
+                )
+        return self._write_count(LabReport, reports())
+
+    def create_permissions(self):
+        access_types = SharingPermission.AccessType
+
+        def pairs():
+            # The app keeps at most one grant per doctor and patient (OTPVerifyView relies on
+            # it), so a pair drawn twice is redrawn uniformly
+            seen = set()
+            for _ in range(min(self.sizes['permissions'], len(self.patients) * len(self.doctors))):
+                patient_index = skewed(self.rng, len(self.patients), self.skew)
+                doctor_index = skewed(self.rng, len(self.doctors), self.skew)
+                while (patient_index, doctor_index) in seen:
+                    patient_index = self.rng.randrange(len(self.patients))
+                    doctor_index = self.rng.randrange(len(self.doctors))
+                seen.add((patient_index, doctor_index))
+                yield self.patients[patient_index], self.doctors[doctor_index]
+
+        def permissions():
+            for (patient_id, user_id), doctor in pairs():
+                access_type = self.rng.choice([access_types.QR_QUICK, access_types.QR_QUICK, access_types.OTP_FULL])
+                full = access_type == access_types.OTP_FULL
+                expires_at = self.now + timedelta(hours=self.rng.uniform(-48, 24 if not full else 24 * 30))
+                yield SharingPermission(
+                    patient_id=patient_id,
+                    doctor_id=doctor.pk,
+                    access_type=access_type,
+                    granted_by_id=user_id,
+                    expires_at=expires_at,
+                    can_view_documents=full,
+                    can_add_records=full,
+                    is_active=expires_at > self.now,
+                )
+        return self._write_count(SharingPermission, permissions())
+
+    def create_audit_logs(self):
+        actions = [AccessLog.Action.VIEW_PROFILE, AccessLog.Action.VIEW_RECORDS, AccessLog.Action.QR_SCAN]
+        count = self.sizes['audit_logs']
+        created = 0
+        # Written in time order through the chain writer, so the hash chain and checkpoints hold
+        for chunk in chunked(range(count), self.chunk_size):
+            entries = []
+            for i in chunk:
+                patient_id, _ = self._patient()
+                entries.append(AccessLog(
+                    actor_id=self._doctor().user_id,
+                    patient_id=patient_id,
+                    action=self.rng.choice(actions),
+                    details='Load dataset',
+                    timestamp=self.now - timedelta(seconds=self.span * (count - i) / count),
+                ))
+            chain_access_logs(entries)
+            created += len(entries)
+        return created
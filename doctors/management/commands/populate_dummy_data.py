@@ -56,27 +56,27 @@ class Command(BaseCommand):
         patients_data = [
             {
                 'username': 'sarah_connor', 'first': 'Sarah', 'last': 'Connor', 
-                'health_id': 'SARAH001', 'dob': '1985-05-12', 'blood': 'O-',
+                'dob': '1985-05-12', 'blood': 'O-',
                 'allergies': 'Terminators', 'chronic': 'PTSD', 'contact': '555-1001'
             },
             {
                 'username': 'bruce_wayne', 'first': 'Bruce', 'last': 'Wayne', 
-                'health_id': 'BRUCE001', 'dob': '1980-02-19', 'blood': 'AB+',
+                'dob': '1980-02-19', 'blood': 'AB+',
                 'allergies': 'None', 'chronic': 'Back Pain, Insomnia', 'contact': '555-1002'
             },
             {
                 'username': 'clark_kent', 'first': 'Clark', 'last': 'Kent', 
-                'health_id': 'CLARK001', 'dob': '1986-06-18', 'blood': 'A+',
+                'dob': '1986-06-18', 'blood': 'A+',
                 'allergies': 'Kryptonite', 'chronic': 'None', 'contact': '555-1003'
             },
             {
                 'username': 'peter_parker', 'first': 'Peter', 'last': 'Parker', 
-                'health_id': 'PETER001', 'dob': '2001-08-10', 'blood': 'B+',
+                'dob': '2001-08-10', 'blood': 'B+',
                 'allergies': 'None', 'chronic': 'None', 'contact': '555-1004'
             },
             {
                 'username': 'tony_stark', 'first': 'Tony', 'last': 'Stark', 
-                'health_id': 'TONY001', 'dob': '1970-05-29', 'blood': 'O+',
+                'dob': '1970-05-29', 'blood': 'O+',
                 'allergies': 'Shrapnel', 'chronic': 'Heart Condition', 'contact': '555-1005'
             }
         ]
@@ -106,13 +106,6 @@ class Command(BaseCommand):
                 }
             )
             
-            # Update health ID if needed
-            if patient.health_id != p_data['health_id']:
-                # checks if specific HID is taken (unless it's self)
-                if not Patient.objects.filter(health_id=p_data['health_id']).exclude(id=patient.id).exists():
-                     patient.health_id = p_data['health_id']
-                     patient.save()
-
             self.stdout.write(f"Processed Patient: {p_data['first']} {p_data['last']} (ID: {patient.health_id})")
 
             # Create Records & Consultations
@@ -0,0 +1,27 @@
+"""
+reconcile_counters.py
+Recompute the materialized dashboard counters from the source tables and replace the stored
+ones, reporting any that had drifted (e.g. after raw SQL or queryset.update() on a counted model).
+Usage: python manage.py reconcile_counters [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+from doctors.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counters and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not fix it')
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters(dry_run=options['dry_run'])
+        for (name, scope, bucket), (stored, actual) in sorted(drift.items(), key=lambda item: (item[0][0], item[0][1], str(item[0][2]))):
+            label = ' '.join(part for part in (name, scope, bucket and bucket.isoformat()) if part)
+            self.stdout.write(f"  {label}: stored {stored}, actual {actual}")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Counters are in step"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} counters have drifted (dry run, not fixed)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Reconciled {len(drift)} counters"))
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0008_department_doctor_department'),
+        ('patients', '0008_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['patient', '-consultation_date', '-id'], name='consult_patient_date_idx'),
+        ),
+    ]
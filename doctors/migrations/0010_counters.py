@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+def initialize_counters(apps, schema_editor):
+    from doctors.counters import reconcile_counters
+    reconcile_counters(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0009_timeline_indexes'),
+        ('labs', '0004_timeline_indexes'),
+        ('patients', '0011_otp_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('scope', models.CharField(blank=True, default='', max_length=50)),
+                ('bucket', models.DateField(blank=True, null=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('bucket__isnull', True)), fields=('name', 'scope'), name='unique_counter_total'), models.UniqueConstraint(condition=models.Q(('bucket__isnull', False)), fields=('name', 'scope', 'bucket'), name='unique_counter_bucket')],
+            },
+        ),
+        migrations.RunPython(initialize_counters, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
+from utils.dirty_fields import DirtyFieldsMixin
 
 
 class Hospital(models.Model):
@@ -71,7 +72,7 @@ class HospitalAdmin(models.Model):
         return f"Admin: {self.user.get_full_name() or self.user.username} ({self.hospital.name})"
 
 
-class Doctor(models.Model):
+class Doctor(DirtyFieldsMixin, models.Model):
     """Extended doctor profile linked to User model."""
     
     class AuthorizationLevel(models.TextChoices):
@@ -173,6 +174,10 @@ class Consultation(models.Model):
 
     class Meta:
         ordering = ['-consultation_date']
+        indexes = [
+            # Per-patient history in timeline order
+            models.Index(fields=['patient', '-consultation_date', '-id'], name='consult_patient_date_idx'),
+        ]
 
 
 class Appointment(models.Model):
@@ -212,3 +217,29 @@ class Appointment(models.Model):
 
     def __str__(self):
         return f"Appointment: {self.patient.user.get_full_name()} with Dr. {self.doctor.user.get_full_name()} on {self.appointment_date}"
+
+
+class Counter(models.Model):
+    """
+    A materialized count kept in step by model signals (see doctors.counters) so dashboards
+    read a handful of rows instead of counting tables. scope is '' for site-wide counters or
+    'hospital:<id>'; bucket is set for per-day series.
+    """
+    name = models.CharField(max_length=50)
+    scope = models.CharField(max_length=50, blank=True, default='')
+    bucket = models.DateField(null=True, blank=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'scope'], condition=models.Q(bucket__isnull=True), name='unique_counter_total'
+            ),
+            models.UniqueConstraint(
+                fields=['name', 'scope', 'bucket'], condition=models.Q(bucket__isnull=False), name='unique_counter_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        scope = self.scope or 'global'
+        return f"{self.name} [{scope}{f' {self.bucket}' if self.bucket else ''}] = {self.value}"
@@ -1,11 +1,28 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Prefetch, Q
 from .models import Hospital, Department, Doctor, Consultation, Appointment
 from accounts.serializers import UserSerializer
 
 User = get_user_model()
 
 
+# List views annotate the counts below onto their querysets so a page costs one query, not
+# one COUNT per row. The serializers fall back to counting when an object was loaded without them.
+
+def annotate_departments(queryset):
+    return queryset.annotate(num_doctors=Count('doctors'))
+
+
+def annotate_hospitals(queryset):
+    return queryset.annotate(num_verified_doctors=Count('doctors', filter=Q(doctors__is_verified=True)))
+
+
+def hospital_prefetch(lookup='hospital'):
+    """Prefetch for a nested HospitalSerializer: one extra query for the whole page."""
+    return Prefetch(lookup, queryset=annotate_hospitals(Hospital.objects.all()))
+
+
 class DepartmentSerializer(serializers.ModelSerializer):
     """Serializer for Department model."""
     doctor_count = serializers.SerializerMethodField()
@@ -15,8 +32,13 @@ class DepartmentSerializer(serializers.ModelSerializer):
         fields = ['id', 'hospital', 'name', 'description', 'doctor_count', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    @classmethod
+    def annotate_queryset(cls, queryset):
+        return annotate_departments(queryset)
+
     def get_doctor_count(self, obj):
-        return obj.doctors.count()
+        count = getattr(obj, 'num_doctors', None)
+        return count if count is not None else obj.doctors.count()
 
 
 class HospitalSerializer(serializers.ModelSerializer):
@@ -32,8 +54,13 @@ class HospitalSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'is_verified', 'created_at', 'updated_at']
     
+    @classmethod
+    def annotate_queryset(cls, queryset):
+        return annotate_hospitals(queryset)
+
     def get_doctor_count(self, obj):
-        return obj.doctors.filter(is_verified=True).count()
+        count = getattr(obj, 'num_verified_doctors', None)
+        return count if count is not None else obj.doctors.filter(is_verified=True).count()
 
 
 class HospitalDetailSerializer(HospitalSerializer):
@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save, pre_save
+from django.apps import apps
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from .models import Consultation, Doctor, Hospital
+from .counters import SOURCES, bump, count_change, counter_keys, stored_counter_keys
 from utils.notifications import (
     send_consultation_notification, 
     send_doctor_registration_email, 
@@ -26,8 +28,8 @@ def notify_hospital_registration(sender, instance, created, **kwargs):
 @receiver(pre_save, sender=Doctor)
 def doctor_verification_shapshot(sender, instance, **kwargs):
     """Capture verification status before saving."""
-    if instance.pk:
-        instance._previous_is_verified = Doctor.objects.get(pk=instance.pk).is_verified
+    if not instance._state.adding:
+        instance._previous_is_verified = instance.get_initial_value('is_verified')
     else:
         instance._previous_is_verified = False
 
@@ -37,3 +39,29 @@ def notify_doctor_approval(sender, instance, created, **kwargs):
     if not created and hasattr(instance, '_previous_is_verified'):
         if instance.is_verified and not instance._previous_is_verified:
             send_doctor_approved_email(instance)
+
+
+# --- Materialized counters (doctors.counters) ---------------------------------------------
+# Applied inside the caller's transaction, so counters commit or roll back with the save or delete.
+
+def counters_snapshot(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._counter_keys_before = stored_counter_keys(instance)
+
+
+def counters_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_counter_keys_before', [])
+    bump(count_change(before, counter_keys(instance)))
+
+
+def counters_deleted(sender, instance, **kwargs):
+    bump(count_change(counter_keys(instance), []))
+
+
+for _source in SOURCES:
+    _model = apps.get_model(_source.model)
+    pre_save.connect(counters_snapshot, sender=_model, dispatch_uid=f'counters_snapshot.{_source.model}')
+    post_save.connect(counters_saved, sender=_model, dispatch_uid=f'counters_saved.{_source.model}')
+    post_delete.connect(counters_deleted, sender=_model, dispatch_uid=f'counters_deleted.{_source.model}')
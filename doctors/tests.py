@@ -97,3 +97,342 @@ class AppointmentAPITest(TestCase):
         # If user has neither, it returns none.
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
+
+
+class HospitalPatientExportTest(TestCase):
+    def setUp(self):
+        from .models import Consultation, HospitalAdmin
+
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(name='Export General', address='3 Main St', registration_number='EXP1', phone='1', email='exp@test.com')
+        self.admin_user = User.objects.create_user(username='expadmin', password='pw', role='HOSPITAL_ADMIN', email='expadmin@test.com')
+        HospitalAdmin.objects.create(user=self.admin_user, hospital=self.hospital, is_verified=True)
+        doc_user = User.objects.create_user(username='expdoc', password='pw', role='DOCTOR', email='expdoc@test.com')
+        doctor = Doctor.objects.create(user=doc_user, hospital=self.hospital, license_number='EXPD', specialization='Gen')
+
+        self.patients = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'exppat{i}', password='pw', role='PATIENT', email=f'exppat{i}@test.com')
+            self.patients.append(Patient.objects.get(user=user))
+        for patient in self.patients[:2]:
+            Consultation.objects.create(doctor=doctor, patient=patient, consultation_date=timezone.now(), chief_complaint='Discharge')
+
+    def _export(self, **data):
+        import io
+        import zipfile
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post('/api/doctors/hospitals/patients/export/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        return archive
+
+    def test_export_is_scoped_to_hospital(self):
+        from audit.models import AccessLog
+
+        with self.settings(PDF_BULK_EXPORT_PROCESSES=False), self.captureOnCommitCallbacks(execute=True):
+            archive = self._export()
+
+        expected = {f'{p.health_id}.pdf' for p in self.patients[:2]}
+        self.assertEqual(set(archive.namelist()), expected)
+        for name in expected:
+            self.assertTrue(archive.read(name).startswith(b'%PDF'))
+        self.assertEqual(AccessLog.objects.filter(actor=self.admin_user, details__contains='bulk').count(), 2)
+
+    def test_process_pool_export_of_selected_patients(self):
+        wanted = [self.patients[0].health_id, self.patients[2].health_id]
+        with self.settings(PDF_BULK_EXPORT_PROCESSES=True, PDF_BULK_EXPORT_WORKERS=1):
+            archive = self._export(health_ids=wanted)
+        # Patient 2 was never seen at this hospital
+        self.assertEqual(archive.namelist(), [f'{self.patients[0].health_id}.pdf'])
+
+    def test_exports_over_the_limit_are_turned_away(self):
+        self.client.force_authenticate(user=self.admin_user)
+        url = '/api/doctors/hospitals/patients/export/'
+        with self.settings(PDF_BULK_EXPORT_PROCESSES=False, PDF_BULK_EXPORT_CONCURRENCY=1):
+            running = self.client.post(url, {}, format='json')
+            self.assertEqual(running.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            # The slot comes back once the running export has been streamed out
+            b''.join(running.streaming_content)
+            self.assertEqual(self._export().namelist(), [f'{p.health_id}.pdf' for p in self.patients[:2]])
+            # ...or abandoned before it started
+            abandoned = self.client.post(url, {}, format='json')
+            abandoned.close()
+            response = self.client.post(url, {}, format='json')
+            response.close()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_patients_cannot_export(self):
+        self.client.force_authenticate(user=self.patients[0].user)
+        response = self.client.post('/api/doctors/hospitals/patients/export/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CounterTest(TestCase):
+    def setUp(self):
+        from .models import HospitalAdmin
+
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(name='Count General', address='4 Main St', registration_number='CNT1', phone='1', email='cnt@test.com')
+        self.admin_user = User.objects.create_user(username='cntadmin', password='pw', role='HOSPITAL_ADMIN', email='cntadmin@test.com')
+        HospitalAdmin.objects.create(user=self.admin_user, hospital=self.hospital, is_verified=True)
+
+    def _doctor(self, name, hospital=None):
+        user = User.objects.create_user(username=name, password='pw', role='DOCTOR', email=f'{name}@test.com')
+        return Doctor.objects.create(user=user, hospital=hospital or self.hospital, license_number=name.upper(), specialization='Gen')
+
+    def _hospital_stats(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get('/api/doctors/hospitals/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_signals_track_creates_verification_and_deletes(self):
+        from .counters import GLOBAL, hospital_scope, read_counters
+
+        names = ['doctors', 'verified_doctors', 'pending_doctors']
+        first, second = self._doctor('cntdoc1'), self._doctor('cntdoc2')
+        self.assertEqual(read_counters(names), {'doctors': 2, 'verified_doctors': 0, 'pending_doctors': 2})
+
+        first.is_verified = True
+        first.save()
+        # Saving again without changes must not count twice
+        first.save()
+        self.assertEqual(read_counters(names), {'doctors': 2, 'verified_doctors': 1, 'pending_doctors': 1})
+        self.assertEqual(read_counters(['doctors', 'pending_doctors'], scope=hospital_scope(self.hospital.pk)),
+                         {'doctors': 2, 'pending_doctors': 1})
+
+        second.delete()
+        self.assertEqual(read_counters(names, scope=GLOBAL), {'doctors': 1, 'verified_doctors': 1, 'pending_doctors': 0})
+
+    def test_hospital_stats_read_counters(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import Consultation
+        from labs.models import DiagnosticLab
+
+        doctor = self._doctor('cntdoc3')
+        self._doctor('cntdoc4', hospital=Hospital.objects.create(name='Other', address='x', registration_number='CNT2', phone='2', email='o@test.com'))
+        DiagnosticLab.objects.create(name='Lab', address='x', accreditation_number='ACC-CNT', phone='3', email='lab@test.com', hospital=self.hospital)
+        patient_user = User.objects.create_user(username='cntpat', password='pw', role='PATIENT', email='cntpat@test.com')
+        Consultation.objects.create(doctor=doctor, patient=Patient.objects.get(user=patient_user), consultation_date=timezone.now(), chief_complaint='Cough')
+
+        self._hospital_stats()
+        with CaptureQueriesContext(connection) as ctx:
+            stats = self._hospital_stats()
+        self.assertEqual(stats, {'total_doctors': 1, 'pending_doctors': 1, 'total_labs': 1, 'total_consultations': 1})
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_admin_dashboard_and_reconcile(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import Counter
+
+        self._doctor('cntdoc5')
+        User.objects.create_user(username='cntpat2', password='pw', role='PATIENT', email='cntpat2@test.com')
+        superuser = User.objects.create_superuser(username='cntroot', password='pw', email='cntroot@test.com')
+        self.client.force_authenticate(user=superuser)
+        stats = self.client.get('/api/admin/stats/').data
+        self.assertEqual((stats['total_doctors'], stats['pending_doctors'], stats['total_hospitals']), (1, 1, 1))
+        self.assertEqual(len(stats['new_patients_per_day']), 30)
+        self.assertEqual(stats['new_patients_per_day'][-1]['count'], stats['total_patients'])
+
+        # Bulk updates bypass the signals; reconcile repairs the drift
+        Doctor.objects.update(is_verified=True)
+        Counter.objects.filter(name='hospitals').update(value=7)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('Reconciled', out.getvalue())
+        stats = self.client.get('/api/admin/stats/').data
+        self.assertEqual((stats['verified_doctors'], stats['pending_doctors'], stats['total_hospitals']), (1, 0, 1))
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn('in step', out.getvalue())
+
+
+class AnnotatedCountsTest(TestCase):
+    def setUp(self):
+        from .models import Department, HospitalAdmin
+
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(name='Annot General', address='5 Main St', registration_number='ANN1', phone='1', email='ann@test.com', is_verified=True)
+        self.admin_user = User.objects.create_user(username='annadmin', password='pw', role='HOSPITAL_ADMIN', email='annadmin@test.com')
+        HospitalAdmin.objects.create(user=self.admin_user, hospital=self.hospital, is_verified=True)
+        self.staff = User.objects.create_superuser(username='annroot', password='pw', email='annroot@test.com')
+        self.department = Department.objects.create(hospital=self.hospital, name='Cardiology')
+        self.serial = 0
+
+    def _add_row(self, verified=True):
+        """One more doctor, lab and technician, all pointing at the hospital."""
+        from labs.models import DiagnosticLab, LabTechnician
+
+        self.serial += 1
+        n = self.serial
+        doc_user = User.objects.create_user(username=f'anndoc{n}', password='pw', role='DOCTOR', email=f'anndoc{n}@test.com')
+        Doctor.objects.create(user=doc_user, hospital=self.hospital, department=self.department, license_number=f'ANND{n}', specialization='Gen', is_verified=verified)
+        lab = DiagnosticLab.objects.create(name=f'Lab {n}', address='x', accreditation_number=f'ANNL{n}', phone='2', email=f'lab{n}@test.com', hospital=self.hospital)
+        tech_user = User.objects.create_user(username=f'anntech{n}', password='pw', role='LAB_TECH', email=f'anntech{n}@test.com')
+        LabTechnician.objects.create(user=tech_user, lab=lab, license_number=f'ANNT{n}', is_verified=verified)
+
+    def _queries(self, user, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response.data
+
+    def test_list_query_counts_do_not_grow_with_rows(self):
+        endpoints = [
+            (self.staff, '/api/admin/hospitals/'),
+            (self.staff, '/api/doctors/hospitals/'),
+            (self.admin_user, '/api/doctors/departments/'),
+            (self.admin_user, '/api/doctors/hospitals/labs/'),
+            (self.admin_user, '/api/doctors/hospitals/technicians/'),
+            (self.staff, '/api/admin/labs/'),
+            (self.staff, '/api/labs/admin/technicians/'),
+        ]
+        self._add_row()
+        before = {url: self._queries(user, url)[0] for user, url in endpoints}
+        self._add_row(verified=False)
+        self._add_row()
+        for user, url in endpoints:
+            self.assertEqual(self._queries(user, url)[0], before[url], url)
+
+    def test_annotated_counts_match_fallback(self):
+        from labs.models import LabTechnician
+        from labs.serializers import LabTechnicianSerializer
+        from .serializers import HospitalSerializer
+
+        self._add_row()
+        self._add_row(verified=False)
+        _, data = self._queries(self.staff, '/api/labs/admin/technicians/')
+        fallback = LabTechnicianSerializer(LabTechnician.objects.order_by('pk'), many=True).data
+        self.assertEqual(sorted(data, key=lambda t: t['id']), fallback)
+        self.assertEqual(data[0]['lab_details']['hospital_details']['doctor_count'], 1)
+        self.assertEqual(HospitalSerializer(self.hospital).data['doctor_count'], 1)
+
+        _, departments = self._queries(self.admin_user, '/api/doctors/departments/')
+        self.assertEqual(departments[0]['doctor_count'], 2)
+
+
+class QueryOptimizerTest(TestCase):
+    def setUp(self):
+        from .models import Department, HospitalAdmin
+
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(name='Opt General', address='6 Main St', registration_number='OPT1', phone='1', email='opt@test.com', is_verified=True)
+        self.department = Department.objects.create(hospital=self.hospital, name='Neurology')
+        self.admin_user = User.objects.create_user(username='optadmin', password='pw', role='HOSPITAL_ADMIN', email='optadmin@test.com')
+        HospitalAdmin.objects.create(user=self.admin_user, hospital=self.hospital, is_verified=True)
+        self.staff = User.objects.create_superuser(username='optroot', password='pw', email='optroot@test.com')
+        self.serial = 0
+
+    def _add_doctor(self):
+        from .models import Consultation
+
+        self.serial += 1
+        n = self.serial
+        user = User.objects.create_user(username=f'optdoc{n}', password='pw', role='DOCTOR', email=f'optdoc{n}@test.com', first_name=f'Doc{n}')
+        doctor = Doctor.objects.create(user=user, hospital=self.hospital, department=self.department, license_number=f'OPTD{n}', specialization='Neuro', is_verified=True)
+        patient_user = User.objects.create_user(username=f'optpat{n}', password='pw', role='PATIENT', email=f'optpat{n}@test.com')
+        Consultation.objects.create(doctor=doctor, patient=Patient.objects.get(user=patient_user), consultation_date=timezone.now(), chief_complaint='Headache')
+
+    def _get(self, user, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response.data
+
+    def test_nested_lists_cost_a_fixed_number_of_queries(self):
+        endpoints = [
+            (self.staff, '/api/admin/doctors/'),
+            (self.staff, '/api/doctors/verified/'),
+            (self.admin_user, '/api/doctors/hospitals/doctors/'),
+            (self.admin_user, '/api/doctors/hospitals/visit-logs/'),
+        ]
+        self._add_doctor()
+        before = {url: self._get(user, url)[0] for user, url in endpoints}
+        for _ in range(3):
+            self._add_doctor()
+        for user, url in endpoints:
+            queries, data = self._get(user, url)
+            self.assertEqual(queries, before[url], url)
+            self.assertEqual(len(data), 4, url)
+
+    def test_optimized_output_matches_plain_serialization(self):
+        from .models import Consultation
+        from .serializers import ConsultationSerializer
+        from utils.query_optimizer import optimize_queryset
+
+        self._add_doctor()
+        self._add_doctor()
+        plain = Consultation.objects.order_by('pk')
+        optimized = optimize_queryset(plain, ConsultationSerializer())
+        self.assertEqual(ConsultationSerializer(optimized, many=True).data, ConsultationSerializer(plain, many=True).data)
+        self.assertIn('doctor__hospital', [getattr(p, 'prefetch_to', p) for p in optimized._prefetch_related_lookups])
+
+
+class GenerateLoadDatasetTest(TestCase):
+    def _generate(self, prefix, seed=7):
+        from django.core.management import call_command
+        from io import StringIO
+
+        out = StringIO()
+        call_command(
+            'generate_load_dataset', patients=200, hospitals=2, doctors=10, labs=2, technicians=4,
+            seed=seed, prefix=prefix, chunk_size=64, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_generates_requested_sizes_and_consistent_side_tables(self):
+        from django.core.management.base import CommandError
+        from audit.integrity import verify_tail
+        from labs.models import LabReport
+        from .counters import reconcile_counters
+        from .models import Consultation
+
+        self.assertIn('Generated', self._generate('lds'))
+        self.assertEqual(Patient.objects.filter(user__username__startswith='lds_').count(), 200)
+        self.assertEqual(Doctor.objects.count(), 10)
+        self.assertEqual(Consultation.objects.count(), 400)
+        self.assertEqual(LabReport.objects.count(), 200)
+        # One grant per doctor and patient, as OTPVerifyView's get_or_create expects
+        from django.db.models import Count
+        from patients.models import SharingPermission
+        self.assertEqual(SharingPermission.objects.count(), 100)
+        self.assertFalse(SharingPermission.objects.values('doctor', 'patient').annotate(n=Count('pk')).filter(n__gt=1).exists())
+        # Health IDs allocated, QR rendering left for later
+        self.assertFalse(Patient.objects.filter(health_id='').exists())
+        self.assertFalse(Patient.objects.exclude(qr_code='').exclude(qr_code__isnull=True).exists())
+        # Counters reconciled, hash chain intact
+        self.assertEqual(reconcile_counters(dry_run=True), {})
+        self.assertEqual(verify_tail().failures, [])
+
+        # The busiest doctor (index 0 of the hot 1%) sees far more than an even share
+        busiest = Consultation.objects.values('doctor').annotate(n=Count('pk')).order_by('-n').first()
+        self.assertGreater(busiest['n'], 400 / 10 * 2)
+
+        with self.assertRaises(CommandError):
+            self._generate('lds')
+
+    def test_deterministic_for_a_seed(self):
+        from .models import Consultation
+
+        def snapshot(prefix):
+            self._generate(prefix)
+            rows = list(
+                Consultation.objects.filter(doctor__user__username__startswith=f'{prefix}_')
+                .order_by('pk').values_list('doctor__user__username', 'patient__user__username', 'chief_complaint')
+            )
+            return [(d.split('_', 1)[1], p.split('_', 1)[1], c) for d, p, c in rows]
+
+        self.assertEqual(snapshot('ldsa'), snapshot('ldsb'))
@@ -1,8 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
+from .views import (
+    HospitalViewSet, DoctorRegisterView, DoctorProfileView, DoctorRegisterPatientView,
+    VerifiedDoctorListView, ConsultationViewSet, PatientHistoryView, AppointmentViewSet,
     HospitalMeView, HospitalDoctorListView, HospitalLabListView, HospitalStatsView,
     HospitalTechnicianListView, HospitalTechnicianCreateView,
-    DepartmentViewSet, HospitalVisitationLogsView
+    DepartmentViewSet, HospitalVisitationLogsView, HospitalPatientExportView
 )
 
 router = SimpleRouter()
@@ -19,6 +22,7 @@ urlpatterns = [
     path('hospitals/technicians/create/', HospitalTechnicianCreateView.as_view(), name='hospital-technician-create'),
     path('hospitals/stats/', HospitalStatsView.as_view(), name='hospital-stats'),
     path('hospitals/visit-logs/', HospitalVisitationLogsView.as_view(), name='hospital-visit-logs'),
+    path('hospitals/patients/export/', HospitalPatientExportView.as_view(), name='hospital-patient-export'),
     path('', include(router.urls)),
     path('register/', DoctorRegisterView.as_view(), name='doctor-register'),
     path('me/', DoctorProfileView.as_view(), name='doctor-profile'),
@@ -2,9 +2,11 @@ from rest_framework import viewsets, generics, permissions, status, decorators
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
+from .models import Hospital, HospitalAdmin, Department, Doctor, Consultation, Appointment
+from .serializers import (
     HospitalSerializer, HospitalDetailSerializer, HospitalRegisterSerializer,
     DoctorSerializer, DoctorRegisterSerializer,
-    DepartmentSerializer,
+    DepartmentSerializer, annotate_departments, annotate_hospitals,
     ConsultationSerializer, ConsultationCreateSerializer,
     AppointmentSerializer
 )
@@ -12,7 +14,17 @@ from role_permissions.roles import IsDoctor, IsHospitalAdmin
 from patients.models import Patient
 from accounts.serializers import UserSerializer
 from labs.models import DiagnosticLab, LabTechnician
-from labs.serializers import LabTechnicianSerializer, LabTechnicianRegisterSerializer
+from labs.serializers import LabTechnicianSerializer, LabTechnicianRegisterSerializer, annotate_technicians
+from audit.models import AccessLog
+from audit.writer import log_access, write_access_logs
+from .counters import hospital_scope, read_counters
+from utils.query_optimizer import OptimizedQuerysetMixin
+from patients.pdf_export import stream_pdf_zip, ExportBusy
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
 
 
 class HospitalViewSet(viewsets.ModelViewSet):
@@ -32,12 +44,21 @@ class HospitalViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action == 'create':
             return HospitalRegisterSerializer
-        return HospitalSerializer
-    
         if self.action == 'retrieve':
             return HospitalDetailSerializer
-        # Non-admin users only see verified hospitals
-        return Hospital.objects.filter(is_verified=True)
+        return HospitalSerializer
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            queryset = Hospital.objects.all()
+        else:
+            # Non-admin users only see verified hospitals
+            queryset = Hospital.objects.filter(is_verified=True)
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch('departments', queryset=annotate_departments(Department.objects.all()))
+            )
+        return annotate_hospitals(queryset)
 
 
 class DepartmentViewSet(viewsets.ModelViewSet):
@@ -47,7 +68,7 @@ class DepartmentViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         admin_profile = get_object_or_404(HospitalAdmin, user=self.request.user)
-        return admin_profile.hospital.departments.all()
+        return annotate_departments(Department.objects.filter(hospital_id=admin_profile.hospital_id))
 
     def perform_create(self, serializer):
         admin_profile = get_object_or_404(HospitalAdmin, user=self.request.user)
@@ -106,26 +127,26 @@ class DoctorRegisterPatientView(generics.CreateAPIView):
         patient = Patient.objects.create(user=user, **patient_data)
         
         # Log the action
-        from audit.models import AccessLog
-        AccessLog.objects.create(
+        log_access(
             actor=request.user,
             patient=patient,
             action=AccessLog.Action.CREATE_HEALTH_ID,
-            details=f"Doctor registered patient with Health ID: {patient.health_id}"
+            details=f"Doctor registered patient with Health ID: {patient.health_id}",
+            sync=True
         )
         
         serializer = PatientSerializer(patient)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class DoctorListView(generics.ListAPIView):
+class DoctorListView(OptimizedQuerysetMixin, generics.ListAPIView):
     """View for admins to list all doctors (verified and unverified)."""
     permission_classes = [permissions.IsAdminUser]
     serializer_class = DoctorSerializer
     queryset = Doctor.objects.all().order_by('-user__date_joined')
 
 
-class VerifiedDoctorListView(generics.ListAPIView):
+class VerifiedDoctorListView(OptimizedQuerysetMixin, generics.ListAPIView):
     """View for patients to list verified doctors."""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = DoctorSerializer
@@ -174,7 +195,7 @@ class HospitalListView(generics.ListAPIView):
     """View for admins to list all hospitals."""
     permission_classes = [permissions.IsAdminUser]
     serializer_class = HospitalSerializer
-    queryset = Hospital.objects.all().order_by('name')
+    queryset = annotate_hospitals(Hospital.objects.all()).order_by('name')
 
 
 class HospitalVerificationView(generics.UpdateAPIView):
@@ -197,7 +218,7 @@ class HospitalVerificationView(generics.UpdateAPIView):
 
 from utils.notifications import send_record_uploaded_email
 
-class ConsultationViewSet(viewsets.ModelViewSet):
+class ConsultationViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Consultation CRUD operations."""
     permission_classes = [IsDoctor]
     
@@ -221,7 +242,7 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         consultation = serializer.save()
         
         # Log the action
-        AccessLog.objects.create(
+        log_access(
             actor=self.request.user,
             patient=consultation.patient,
             action=AccessLog.Action.CREATE_CONSULTATION,
@@ -243,7 +264,7 @@ class PatientHistoryView(generics.ListAPIView):
         patient = get_object_or_404(Patient, health_id=health_id)
         
         # Log access
-        AccessLog.objects.create(
+        log_access(
             actor=self.request.user,
             patient=patient,
             action=AccessLog.Action.VIEW_RECORDS,
@@ -253,7 +274,7 @@ class PatientHistoryView(generics.ListAPIView):
         return Consultation.objects.filter(patient=patient)
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Appointment booking and management."""
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -289,7 +310,7 @@ class HospitalMeView(generics.RetrieveUpdateAPIView):
         return admin_profile.hospital
 
 
-class HospitalDoctorListView(generics.ListAPIView):
+class HospitalDoctorListView(OptimizedQuerysetMixin, generics.ListAPIView):
     """List all doctors affiliated with the current hospital."""
     permission_classes = [IsHospitalAdmin]
     serializer_class = DoctorSerializer
@@ -309,8 +330,9 @@ class HospitalLabListView(generics.ListAPIView):
 
     def get_queryset(self):
         from labs.models import DiagnosticLab
+        from labs.serializers import annotate_labs
         admin_profile = get_object_or_404(HospitalAdmin, user=self.request.user)
-        return DiagnosticLab.objects.filter(hospital=admin_profile.hospital)
+        return annotate_labs(DiagnosticLab.objects.filter(hospital_id=admin_profile.hospital_id))
 
 
 class HospitalTechnicianListView(generics.ListAPIView):
@@ -320,7 +342,7 @@ class HospitalTechnicianListView(generics.ListAPIView):
 
     def get_queryset(self):
         admin_profile = get_object_or_404(HospitalAdmin, user=self.request.user)
-        return LabTechnician.objects.filter(lab__hospital=admin_profile.hospital)
+        return annotate_technicians(LabTechnician.objects.filter(lab__hospital_id=admin_profile.hospital_id))
 
 
 class HospitalTechnicianCreateView(generics.CreateAPIView):
@@ -343,17 +365,85 @@ class HospitalTechnicianCreateView(generics.CreateAPIView):
 
 
 class HospitalStatsView(APIView):
+    """Summary statistics for the current hospital admin's dashboard."""
     permission_classes = [IsHospitalAdmin]
 
+    def get(self, request):
+        admin_profile = get_object_or_404(HospitalAdmin, user=request.user)
+
+        counters = read_counters(
+            ['doctors', 'pending_doctors', 'labs', 'consultations'], scope=hospital_scope(admin_profile.hospital_id)
+        )
+
         return Response({
-            'total_doctors': doctors_count,
-            'pending_doctors': pending_doctors,
-            'total_labs': labs_count,
-            'total_consultations': consultations_count
+            'total_doctors': counters['doctors'],
+            'pending_doctors': counters['pending_doctors'],
+            'total_labs': counters['labs'],
+            'total_consultations': counters['consultations']
         })
 
 
-class HospitalVisitationLogsView(generics.ListAPIView):
+class HospitalPatientExportView(APIView):
+    """
+    Stream a ZIP of medical-history PDFs (discharge packets) for a set of patients.
+    Hospital admins can export patients seen by their hospital's doctors; site admins anyone.
+    """
+    permission_classes = [IsHospitalAdmin | permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Export medical-history PDFs for many patients as a streamed ZIP.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'health_ids': openapi.Schema(
+                    type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING),
+                    description='Patients to export; omit for every patient in scope'
+                ),
+            }
+        ),
+        responses={200: 'application/zip stream', 400: 'Bad Request', 503: 'Too many exports running'}
+    )
+    def post(self, request):
+        health_ids = request.data.get('health_ids')
+        if health_ids is not None and not isinstance(health_ids, list):
+            return Response({"error": "health_ids must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+
+        patients = Patient.objects.all()
+        if not request.user.is_staff:
+            hospital = get_object_or_404(HospitalAdmin, user=request.user).hospital
+            patients = patients.filter(
+                Q(consultations__doctor__hospital=hospital) | Q(appointments__doctor__hospital=hospital)
+            )
+        if health_ids is not None:
+            patients = patients.filter(health_id__in=health_ids)
+        patient_ids = list(patients.order_by('pk').values_list('pk', flat=True).distinct())
+        if not patient_ids:
+            return Response({"error": "No patients to export"}, status=status.HTTP_400_BAD_REQUEST)
+
+        def log_exported(exported_ids):
+            write_access_logs([
+                AccessLog(
+                    actor=request.user,
+                    patient_id=patient_id,
+                    action=AccessLog.Action.VIEW_RECORDS,
+                    details="Included in bulk medical history PDF export"
+                )
+                for patient_id in exported_ids
+            ])
+
+        try:
+            chunks = stream_pdf_zip(patient_ids, on_exported=log_exported)
+        except ExportBusy:
+            return Response(
+                {"error": "Too many exports are running; try again shortly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        response = StreamingHttpResponse(chunks, content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="patient_reports_{timezone.now():%Y%m%d_%H%M}.zip"'
+        return response
+
+
+class HospitalVisitationLogsView(OptimizedQuerysetMixin, generics.ListAPIView):
     """List all consultations affiliated with doctors in the current hospital."""
     permission_classes = [IsHospitalAdmin]
     serializer_class = ConsultationSerializer
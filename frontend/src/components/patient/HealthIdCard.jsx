@@ -87,9 +87,9 @@ const HealthIdCard = ({ patient, onDownloadQR, onDownloadCard }) => {
                   )}
                 </div>
               </div>
-              {patient?.qr_code && (
+              {patient?.qr_code_url && (
                 <div style={{ background: '#fff', padding: 4, borderRadius: 8 }}>
-                  <img src={patient.qr_code} alt="QR" style={{ width: 56, height: 56, display: 'block' }} />
+                  <img src={`${patient.qr_code_url}?size=112`} alt="QR" style={{ width: 56, height: 56, display: 'block' }} />
                 </div>
               )}
             </div>
@@ -168,8 +168,8 @@ const OverviewTab = ({
               <div style={{ fontSize: 11, color: '#fff', fontWeight: 600 }}>{patient?.user?.first_name} {patient?.user?.last_name}</div>
               <div style={{ fontSize: 9, color: 'rgba(255,255,255,0.7)', marginTop: 2 }}>{patient?.blood_group} • {patient?.organ_donor ? (patient?.is_organ_donor_verified ? 'Donor' : 'Donor (Pending)') : 'Non-Donor'}</div>
             </div>
-            {patient?.qr_code && (
-              <img src={patient.qr_code} alt="QR" style={{ width: 44, height: 44, borderRadius: 4, background: '#fff', padding: 2 }} />
+            {patient?.qr_code_url && (
+              <img src={`${patient.qr_code_url}?size=88`} alt="QR" style={{ width: 44, height: 44, borderRadius: 4, background: '#fff', padding: 2 }} />
             )}
           </div>
         </div>
@@ -161,7 +161,6 @@ const DoctorDashboard = () => {
         try {
             const res = await PatientService.requestOTP(patientResult.health_id);
             toast.success(res.message);
-            if (res.dev_note) console.info(res.dev_note);
             setIsOTPModalOpen(true);
         } catch (err) {
             console.error(err);
@@ -224,7 +224,7 @@ const PatientDashboard = () => {
     } catch (err) { alert('Revoke failed.'); }
   };
 
-  const handleDownloadQR = () => { if (patient?.qr_code) { const link = document.createElement('a'); link.href = patient.qr_code; link.download = 'HealthID_QR.png'; link.click(); } };
+  const handleDownloadQR = () => { if (patient?.qr_code_url) { const link = document.createElement('a'); link.href = `${patient.qr_code_url}?size=1024`; link.download = 'HealthID_QR.png'; link.click(); } };
   const handleDownloadCard = async () => {
     // Try PDF Download first
     try {
@@ -55,7 +55,7 @@ const PatientService = {
 
     getAccessHistory: async () => {
         const res = await api.get('patients/sharing-history/');
-        return res.data;
+        return res.data.results || res.data;
     },
 
     revokeAccess: async (id) => {
@@ -120,7 +120,16 @@ const PatientService = {
     },
 
     downloadPdf: async () => {
-        return api.get('patients/me/download-pdf/', { responseType: 'blob' });
+        // PDF exports render in the background: queue (or reuse) one, poll, then fetch the file
+        let { data: job } = await api.post('patients/pdf-exports/');
+        while (job.status === 'PENDING' || job.status === 'RUNNING') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            ({ data: job } = await api.get(`patients/pdf-exports/${job.id}/`));
+        }
+        if (job.status !== 'DONE') {
+            throw new Error(job.error || 'PDF export failed');
+        }
+        return api.get(`patients/pdf-exports/${job.id}/download/`, { responseType: 'blob' });
     }
 };
 
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labs', '0003_diagnosticlab_rejection_reason_and_more'),
+        ('patients', '0008_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='labreport',
+            index=models.Index(fields=['patient', '-created_at', '-id'], name='labreport_patient_date_idx'),
+        ),
+    ]
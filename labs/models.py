@@ -111,3 +111,8 @@ class LabReport(models.Model):
 
     def __str__(self):
         return f"Report: {self.test_type.name} for {self.patient.health_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', '-created_at', '-id'], name='labreport_patient_date_idx'),
+        ]
@@ -1,11 +1,27 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Prefetch, Q
 from .models import DiagnosticLab, LabTechnician, LabTest, LabReport
-from doctors.serializers import HospitalSerializer
+from doctors.serializers import HospitalSerializer, hospital_prefetch
 from accounts.serializers import UserSerializer
 
 User = get_user_model()
 
+
+def annotate_labs(queryset):
+    """Technician count and the nested hospital (with its count) for DiagnosticLabSerializer."""
+    return queryset.annotate(
+        num_verified_technicians=Count('technicians', filter=Q(technicians__is_verified=True))
+    ).prefetch_related(hospital_prefetch())
+
+
+def annotate_technicians(queryset):
+    """User and the nested lab (with its counts) for LabTechnicianSerializer."""
+    return queryset.select_related('user').prefetch_related(
+        Prefetch('lab', queryset=annotate_labs(DiagnosticLab.objects.all()))
+    )
+
+
 class DiagnosticLabSerializer(serializers.ModelSerializer):
     """Serializer for DiagnosticLab model."""
     technician_count = serializers.SerializerMethodField()
@@ -21,8 +37,13 @@ class DiagnosticLabSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'is_verified', 'rejection_reason', 'created_at', 'updated_at']
     
+    @classmethod
+    def annotate_queryset(cls, queryset):
+        return annotate_labs(queryset)
+
     def get_technician_count(self, obj):
-        return obj.technicians.filter(is_verified=True).count()
+        count = getattr(obj, 'num_verified_technicians', None)
+        return count if count is not None else obj.technicians.filter(is_verified=True).count()
 
 
 class DiagnosticLabRegisterSerializer(serializers.ModelSerializer):
@@ -101,6 +122,7 @@ class LabReportSerializer(serializers.ModelSerializer):
             'result_data', 'comments', 'created_at'
         ]
         read_only_fields = ['id', 'technician', 'created_at']
+        related_hints = ['patient__user']
 
     def get_patient_name(self, obj):
         return obj.patient.user.get_full_name() or obj.patient.user.username
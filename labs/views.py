@@ -1,15 +1,20 @@
 from rest_framework import viewsets, generics, permissions, status, decorators
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from .models import DiagnosticLab, LabTechnician, LabTest, LabReport
 from patients.models import Patient
+from patients.health_id import is_valid_health_id
 from .serializers import (
     DiagnosticLabSerializer, DiagnosticLabRegisterSerializer,
     LabTechnicianSerializer, LabTechnicianRegisterSerializer,
-    LabTestSerializer, LabReportSerializer
+    LabTestSerializer, LabReportSerializer,
+    annotate_labs, annotate_technicians,
 )
 from role_permissions.roles import IsLabTech
 from audit.models import AccessLog
+from audit.writer import log_access
+from utils.query_optimizer import OptimizedQuerysetMixin
 
 class DiagnosticLabViewSet(viewsets.ModelViewSet):
     """ViewSet for DiagnosticLab CRUD operations."""
@@ -30,8 +35,8 @@ class DiagnosticLabViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         if self.request.user.is_staff:
-            return DiagnosticLab.objects.all()
-        return DiagnosticLab.objects.filter(is_verified=True)
+            return annotate_labs(DiagnosticLab.objects.all())
+        return annotate_labs(DiagnosticLab.objects.filter(is_verified=True))
 
 
 class LabTechnicianRegisterView(generics.CreateAPIView):
@@ -56,7 +61,7 @@ class LabTestListView(generics.ListAPIView):
     queryset = LabTest.objects.all()
 
 
-class LabReportViewSet(viewsets.ModelViewSet):
+class LabReportViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for LabReport CRUD operations."""
     permission_classes = [IsLabTech]
     serializer_class = LabReportSerializer
@@ -70,7 +75,7 @@ class LabReportViewSet(viewsets.ModelViewSet):
         report = serializer.save(technician=technician)
         
         # Log the action
-        AccessLog.objects.create(
+        log_access(
             actor=self.request.user,
             patient=report.patient,
             action=AccessLog.Action.VIEW_RECORDS, # Or add a new action type if needed
@@ -78,7 +83,7 @@ class LabReportViewSet(viewsets.ModelViewSet):
         )
 
 
-class LabRecentUploadsView(generics.ListAPIView):
+class LabRecentUploadsView(OptimizedQuerysetMixin, generics.ListAPIView):
     """View for technicians to see their recent uploads."""
     permission_classes = [IsLabTech]
     serializer_class = LabReportSerializer
@@ -88,13 +93,15 @@ class LabRecentUploadsView(generics.ListAPIView):
         return LabReport.objects.filter(technician=technician).order_by('-created_at')
 
 
-class PatientLabReportsView(generics.ListAPIView):
+class PatientLabReportsView(OptimizedQuerysetMixin, generics.ListAPIView):
     """Allows a verified lab tech to view all lab reports for a patient by health_id."""
     permission_classes = [IsLabTech]
     serializer_class = LabReportSerializer
 
     def get_queryset(self):
         health_id = self.kwargs['health_id']
+        if not is_valid_health_id(health_id):
+            raise Http404
         patient = get_object_or_404(Patient, health_id=health_id)
         return LabReport.objects.filter(patient=patient).order_by('-created_at')
 
@@ -104,7 +111,7 @@ class LabListView(generics.ListAPIView):
     """View for admins to list all diagnostic labs."""
     permission_classes = [permissions.IsAdminUser]
     serializer_class = DiagnosticLabSerializer
-    queryset = DiagnosticLab.objects.all()
+    queryset = annotate_labs(DiagnosticLab.objects.all())
 
 
 class LabVerificationView(generics.UpdateAPIView):
@@ -133,7 +140,7 @@ class TechnicianListView(generics.ListAPIView):
     """View for admins to list all lab technicians."""
     permission_classes = [permissions.IsAdminUser]
     serializer_class = LabTechnicianSerializer
-    queryset = LabTechnician.objects.all()
+    queryset = annotate_technicians(LabTechnician.objects.all())
 
 
 class TechnicianVerificationView(generics.UpdateAPIView):
@@ -0,0 +1,19 @@
+"""
+HTTP load driver for the core flows: QR scan, OTP request/verify, consultation create,
+lab report upload, patient dashboard and PDF download. Standard library only, so it runs
+from any checkout (or CI box) against a local or remote server.
+
+    python manage.py generate_load_dataset --patients 100000
+    python -m loadtest run --duration 60 --concurrency 20 --out before.json
+    python -m loadtest run --duration 60 --concurrency 20 --out after.json
+    python -m loadtest diff before.json after.json
+
+Without --url a `runserver` is started on a free port with patients.otp.FileOTPSender, and
+the OTP codes it writes are read back from its outbox file; against --url the OTP scenario
+is left out. Accounts are the ones
+generate_load_dataset creates (--prefix, --password).
+"""
+from .runner import parse_mix, run_load
+from .stats import diff_reports, format_diff, format_report
+
+__all__ = ['run_load', 'parse_mix', 'diff_reports', 'format_diff', 'format_report']
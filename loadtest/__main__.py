@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from .runner import parse_mix, run_load
+from .scenarios import SCENARIOS
+from .server import LocalServer
+from .stats import diff_reports, format_diff, format_report
+
+
+async def _run(args):
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = await LocalServer(port=args.port, log_path=args.server_log).start()
+        base_url = server.url
+        print(f"Started server at {base_url}", file=sys.stderr)
+    try:
+        return await run_load(
+            base_url, parse_mix(args.mix), concurrency=args.concurrency, duration=args.duration,
+            iterations=args.iterations, seed=args.seed, think=args.think, label=args.label,
+            prefix=args.prefix, password=args.password,
+            accounts={'PATIENT': args.patients, 'DOCTOR': args.doctors, 'LAB_TECH': args.lab_techs},
+            mailbox=server.mailbox if server else None,
+        )
+    finally:
+        if server:
+            await server.stop()
+
+
+def run(args):
+    report = asyncio.run(_run(args))
+    print(format_report(report))
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(report, out, indent=2)
+        print(f"Saved {args.out}", file=sys.stderr)
+    return 0
+
+
+def diff(args):
+    with open(args.before) as before, open(args.after) as after:
+        rows = diff_reports(json.load(before), json.load(after), threshold=args.threshold / 100)
+    print(format_diff(rows))
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"\n{regressions} regression(s) over {args.threshold:g}%", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description='Load-test the core API flows')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run a load test and report latencies')
+    run_parser.add_argument('--url', help='Server to test; default: start runserver locally')
+    run_parser.add_argument('--port', type=int, help='Port for the local server (default: a free one)')
+    run_parser.add_argument('--server-log', help="Save the local server's console output here")
+    run_parser.add_argument('--mix', default='', help=f"Weights, e.g. qr_scan=50,otp=0. Scenarios: {', '.join(SCENARIOS)}")
+    run_parser.add_argument('--concurrency', type=int, default=10, help='Virtual users')
+    run_parser.add_argument('--duration', type=float, default=30, help='Seconds')
+    run_parser.add_argument('--iterations', type=int, help='Stop after this many scenario runs')
+    run_parser.add_argument('--think', type=float, default=0.0, help='Mean pause between scenarios, seconds')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--prefix', default='load', help='Account prefix used by generate_load_dataset')
+    run_parser.add_argument('--password', default='loadtest123')
+    run_parser.add_argument('--patients', type=int, default=50, help='Patient accounts to log in')
+    run_parser.add_argument('--doctors', type=int, default=20, help='Doctor accounts to log in')
+    run_parser.add_argument('--lab-techs', type=int, default=10, help='Lab technician accounts to log in')
+    run_parser.add_argument('--label', default='', help='Recorded in the report, e.g. the release')
+    run_parser.add_argument('--out', help='Save the report as JSON')
+    run_parser.set_defaults(func=run)
+
+    diff_parser = commands.add_parser('diff', help='Compare two saved reports')
+    diff_parser.add_argument('before')
+    diff_parser.add_argument('after')
+    diff_parser.add_argument('--threshold', type=float, default=10, help='Percent change that counts as a regression')
+    diff_parser.set_defaults(func=diff)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import asyncio
+import itertools
+
+LOGIN_PATH = '/api/auth/login/'
+REFRESH_PATH = '/api/auth/refresh/'
+
+
+class LoginError(Exception):
+    pass
+
+
+class Account:
+    def __init__(self, username, role):
+        self.username = username
+        self.role = role
+        self.access = None
+        self.refresh = None
+        self.profile = {}
+        self._refreshing = None
+
+    @property
+    def headers(self):
+        return {'Authorization': f'Bearer {self.access}'}
+
+
+class TokenPool:
+    """
+    JWTs for a pool of accounts per role. Every account logs in once before the run (password
+    hashing is deliberately slow and would otherwise dominate the numbers); virtual users then
+    take accounts round robin and share their tokens. An expired access token is refreshed
+    once, however many requests notice it at the same time.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.accounts = {}
+        self._cycles = {}
+        self.login_times = []
+
+    async def login(self, role, usernames, password, concurrency=10):
+        slots = asyncio.Semaphore(concurrency)
+
+        async def login_one(username):
+            async with slots:
+                account = Account(username, role)
+                loop = asyncio.get_running_loop()
+                started = loop.time()
+                response = await self.client.request('POST', LOGIN_PATH, json_body={'username': username, 'password': password})
+                self.login_times.append(loop.time() - started)
+                if response.status != 200:
+                    raise LoginError(f"{username}: HTTP {response.status} {response.body[:200]!r}")
+                tokens = response.json()
+                account.access, account.refresh = tokens['access'], tokens['refresh']
+                return account
+
+        accounts = await asyncio.gather(*(login_one(u) for u in usernames))
+        self.accounts[role] = accounts
+        self._cycles[role] = itertools.cycle(accounts)
+        return accounts
+
+    def take(self, role):
+        if not self.accounts.get(role):
+            raise LoginError(f"No {role} accounts logged in")
+        return next(self._cycles[role])
+
+    async def refresh(self, account):
+        if account._refreshing is None:
+            account._refreshing = asyncio.ensure_future(self._refresh(account))
+        try:
+            return await account._refreshing
+        finally:
+            account._refreshing = None
+
+    async def _refresh(self, account):
+        response = await self.client.request('POST', REFRESH_PATH, json_body={'refresh': account.refresh})
+        if response.status != 200:
+            return False
+        account.access = response.json()['access']
+        return True
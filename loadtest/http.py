@@ -0,0 +1,145 @@
+import asyncio
+import json
+import ssl
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+
+class HttpError(Exception):
+    """The request never got a response: refused, reset, timed out, malformed."""
+
+
+class Response:
+    __slots__ = ('status', 'reason', 'headers', 'body')
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+    def __repr__(self):
+        return f"<Response {self.status} {self.reason} ({len(self.body)} bytes)>"
+
+
+def multipart(fields, files):
+    """
+    Encode form `fields` ({name: value}) and `files` ({name: (filename, bytes, content_type)})
+    as multipart/form-data. Returns (body, content_type).
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    """
+    Minimal HTTP/1.1 client on asyncio streams with a keep-alive connection pool, so the
+    driver measures the server rather than connection setup. At most `pool_size` requests
+    are in flight; an idle connection the server has closed is retried once on a new one.
+    """
+
+    def __init__(self, base_url, pool_size=100, timeout=30.0):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == 'https' else None
+        self.prefix = url.path.rstrip('/')
+        self.netloc = url.netloc
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def request(self, method, path, headers=None, params=None, json_body=None, body=b'', content_type=None):
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        if json_body is not None:
+            body, content_type = json.dumps(json_body).encode(), 'application/json'
+        head = [f"{method} {self.prefix}{path} HTTP/1.1", f"Host: {self.netloc}", f"Content-Length: {len(body)}"]
+        if content_type:
+            head.append(f"Content-Type: {content_type}")
+        head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        payload = ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+        async with self._slots:
+            reused = bool(self._idle)
+            try:
+                return await self._send(payload, method, reused)
+            except HttpError:
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection under us
+                return await self._send(payload, method, False)
+
+    async def _send(self, payload, method, reuse):
+        try:
+            if reuse and self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout
+                )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise HttpError(f"connect: {e or type(e).__name__}") from e
+        try:
+            writer.write(payload)
+            await writer.drain()
+            response, keep_alive = await asyncio.wait_for(self._read(reader, method), self.timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            writer.close()
+            raise HttpError(f"{type(e).__name__}: {e}") from e
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return response
+
+    async def _read(self, reader, method):
+        status_line = (await reader.readuntil(b'\r\n')).decode('latin-1').rstrip()
+        version, status, reason = (status_line.split(' ', 2) + [''])[:3]
+        headers = {}
+        while True:
+            line = (await reader.readuntil(b'\r\n')).decode('latin-1').rstrip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        status = int(status)
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if not size:
+                    # Trailers, if any, end with a blank line
+                    while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return Response(status, reason, headers, body), keep_alive
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
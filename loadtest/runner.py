@@ -0,0 +1,108 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+
+from .auth import TokenPool
+from .http import Client
+from .scenarios import DASHBOARD, SCENARIOS, Session, StepFailed, World
+from .stats import Recorder, percentile
+
+ROLES = ('PATIENT', 'DOCTOR', 'LAB_TECH')
+
+
+def parse_mix(text):
+    """'qr_scan=50,otp=0' -> weights for every scenario, the named ones overridden."""
+    weights = {name: s.weight for name, s in SCENARIOS.items()}
+    for item in filter(None, (text or '').split(',')):
+        name, _, weight = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name.strip()!r}; known: {', '.join(SCENARIOS)}")
+        weights[name.strip()] = float(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def usernames(prefix, role, count):
+    """The accounts generate_load_dataset creates: load_doctor0, load_patient0, load_lab_tech0, ..."""
+    return [f"{prefix}_{role.lower()}{i}" for i in range(count)]
+
+
+async def _setup(world, mix, accounts, prefix, password):
+    roles = {'PATIENT'} | {SCENARIOS[name].role for name in mix}
+    for role in ROLES:
+        if role in roles:
+            await world.pool.login(role, usernames(prefix, role, accounts[role]), password)
+
+    # The patients everyone else acts on, as the patients themselves see them
+    for account in world.pool.accounts['PATIENT']:
+        profile = (await world.client.request('GET', '/api/patients/me/', headers=account.headers)).json()
+        account.profile = profile
+        world.patients.append({'id': profile['id'], 'health_id': profile['health_id']})
+
+    if 'lab_report_upload' in mix:
+        account = world.pool.take('LAB_TECH')
+        tests = (await world.client.request('GET', '/api/labs/tests/', headers=account.headers)).json()
+        world.test_types = [t['id'] for t in (tests['results'] if isinstance(tests, dict) else tests)]
+        if not world.test_types:
+            raise RuntimeError("No lab tests defined; lab_report_upload needs at least one")
+
+
+async def _virtual_user(world, mix, deadline, budget, think):
+    loop = asyncio.get_running_loop()
+    names, weights = list(mix), list(mix.values())
+    while loop.time() < deadline and budget[0] > 0:
+        budget[0] -= 1
+        chosen = SCENARIOS[world.rng.choices(names, weights)[0]]
+        session = Session(world, world.pool.take(chosen.role))
+        started = loop.time()
+        try:
+            await chosen.run(session)
+            ok = True
+        except StepFailed:
+            ok = False
+        world.recorder.record_flow(chosen.name, loop.time() - started, ok)
+        if think:
+            await asyncio.sleep(world.rng.uniform(0, 2 * think))
+
+
+async def run_load(base_url, mix, concurrency=10, duration=30.0, iterations=None, accounts=None,
+                   prefix='load', password='loadtest123', seed=0, think=0.0, mailbox=None, label=''):
+    """
+    Drive `base_url` with `concurrency` virtual users, each running scenarios picked by the
+    `mix` weights back to back (plus `think` seconds of pause on average), until `duration`
+    seconds have passed or `iterations` scenarios have run. Returns the report dict.
+    """
+    accounts = dict({'PATIENT': 50, 'DOCTOR': 20, 'LAB_TECH': 10}, **(accounts or {}))
+    if mailbox is None:
+        mix = {name: weight for name, weight in mix.items() if not SCENARIOS[name].needs_otp}
+    if not mix:
+        raise ValueError("Nothing to run: every scenario in the mix has weight 0")
+
+    # The dashboard fans out the most requests at once
+    client = Client(base_url, pool_size=concurrency * len(DASHBOARD))
+    recorder = Recorder()
+    world = World(client, TokenPool(client), recorder, random.Random(seed), mailbox)
+    try:
+        await _setup(world, mix, accounts, prefix, password)
+        loop = asyncio.get_running_loop()
+        started_at = datetime.now(timezone.utc)
+        started = loop.time()
+        budget = [iterations if iterations is not None else float('inf')]
+        await asyncio.gather(*(
+            _virtual_user(world, mix, started + duration, budget, think) for _ in range(concurrency)
+        ))
+        elapsed = loop.time() - started
+    finally:
+        await client.close()
+
+    logins = sorted(world.pool.login_times)
+    return recorder.report(elapsed, meta={
+        'label': label,
+        'base_url': base_url,
+        'started_at': started_at.isoformat(),
+        'concurrency': concurrency,
+        'think': think,
+        'seed': seed,
+        'mix': mix,
+        'accounts': {role: len(a) for role, a in world.pool.accounts.items()},
+        'login_p50_ms': round(percentile(logins, 50) * 1000, 2) if logins else None,
+    })
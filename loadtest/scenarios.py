@@ -0,0 +1,178 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from .http import HttpError, multipart
+
+# A scenario is one user-visible flow, run by a virtual user with an account of `role`.
+# Requests inside it are recorded under their own names, the flow as a whole under the
+# scenario's name.
+Scenario = namedtuple('Scenario', ['name', 'role', 'weight', 'run', 'needs_otp'])
+SCENARIOS = {}
+
+
+def scenario(name, role, weight, needs_otp=False):
+    def register(fn):
+        SCENARIOS[name] = Scenario(name, role, weight, fn, needs_otp)
+        return fn
+    return register
+
+
+class StepFailed(Exception):
+    pass
+
+
+class World:
+    """What the scenarios share: the token pool, the patients to act on, lookup data."""
+
+    def __init__(self, client, pool, recorder, rng, mailbox=None):
+        self.client = client
+        self.pool = pool
+        self.recorder = recorder
+        self.rng = rng
+        self.mailbox = mailbox
+        self.patients = []
+        self.test_types = []
+        self.otp_busy = set()
+
+    def patient(self):
+        return self.rng.choice(self.patients)
+
+
+class Session:
+    """One scenario run: requests go out with the account's token and are recorded."""
+
+    def __init__(self, world, account):
+        self.world = world
+        self.account = account
+
+    async def call(self, name, method, path, expect=(200,), **kwargs):
+        """Make a request and record it; raises StepFailed unless the status is in `expect`."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            response = await self.world.client.request(method, path, headers=self.account.headers, **kwargs)
+            if response.status == 401 and await self.world.pool.refresh(self.account):
+                response = await self.world.client.request(method, path, headers=self.account.headers, **kwargs)
+        except HttpError as e:
+            self.world.recorder.record(name, loop.time() - started, error=str(e).split(':')[0])
+            raise StepFailed(f"{name}: {e}")
+        elapsed = loop.time() - started
+        queries = response.headers.get('x-db-query-count')
+        ok = response.status in expect
+        self.world.recorder.record(
+            name, elapsed, status=response.status, error=None if ok else f"HTTP {response.status}",
+            queries=int(queries) if queries else None,
+        )
+        if not ok:
+            raise StepFailed(f"{name}: HTTP {response.status}")
+        return response
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+@scenario('qr_scan', 'DOCTOR', 30)
+async def qr_scan(session):
+    """A doctor scans a patient's QR code: PatientViewSet.retrieve by Health ID."""
+    patient = session.world.patient()
+    await session.call('qr_scan', 'GET', f"/api/patients/{patient['health_id']}/")
+
+
+@scenario('otp', 'DOCTOR', 10, needs_otp=True)
+async def otp(session):
+    """Request an OTP for a patient, read it from the mailbox, verify it."""
+    world = session.world
+    # Codes are matched to requests by Health ID: never have two in flight for one patient
+    free = [p for p in world.patients if p['health_id'] not in world.otp_busy]
+    while not free:
+        await asyncio.sleep(0.05)
+        free = [p for p in world.patients if p['health_id'] not in world.otp_busy]
+    health_id = world.rng.choice(free)['health_id']
+    world.otp_busy.add(health_id)
+    try:
+        code = world.mailbox.expect(health_id)
+        await session.call('otp.request', 'POST', '/api/patients/otp/request/', json_body={'health_id': health_id})
+        try:
+            code = await asyncio.wait_for(code, 10)
+        except asyncio.TimeoutError:
+            raise StepFailed('otp: code never reached the mailbox')
+        await session.call('otp.verify', 'POST', '/api/patients/otp/verify/', json_body={'health_id': health_id, 'otp_code': code})
+    finally:
+        world.mailbox.discard(health_id)
+        world.otp_busy.discard(health_id)
+
+
+@scenario('consultation_create', 'DOCTOR', 15)
+async def consultation_create(session):
+    patient = session.world.patient()
+    await session.call('consultation.create', 'POST', '/api/doctors/consultations/', expect=(201,), json_body={
+        'patient_health_id': patient['health_id'],
+        'consultation_date': _now(),
+        'chief_complaint': 'Load test visit',
+        'diagnosis': 'Routine check',
+        'medicines': [{'name': 'Paracetamol', 'dosage': '500mg', 'frequency': 'twice daily'}],
+    })
+
+
+# A small but well-formed PDF, so uploads pay for a real file write
+REPORT_PDF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj 2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj "
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\ntrailer<</Root 1 0 R>>\n%%EOF\n"
+) + b"%" + b"0" * 16 * 1024 + b"\n"
+
+
+@scenario('lab_report_upload', 'LAB_TECH', 10)
+async def lab_report_upload(session):
+    world = session.world
+    patient = world.patient()
+    body, content_type = multipart(
+        {'patient': patient['id'], 'test_type': world.rng.choice(world.test_types), 'comments': 'Load test'},
+        {'file': ('report.pdf', REPORT_PDF, 'application/pdf')},
+    )
+    await session.call('lab_report.upload', 'POST', '/api/labs/reports/', expect=(201,), body=body, content_type=content_type)
+
+
+# What PatientDashboard.jsx fetches in parallel on load. labs/reports/ is left out: it is
+# lab-technician only and the page swallows its 403.
+DASHBOARD = [
+    ('dashboard.profile', '/api/patients/me/'),
+    ('dashboard.records', '/api/records/'),
+    ('dashboard.appointments', '/api/doctors/appointments/'),
+    ('dashboard.documents', '/api/patients/documents/'),
+    ('dashboard.access_history', '/api/patients/sharing-history/'),
+    ('dashboard.sharing', '/api/patients/sharing/'),
+    ('dashboard.emergency_contacts', '/api/patients/emergency-contacts/'),
+    ('dashboard.prescriptions', '/api/patients/prescriptions/'),
+    ('dashboard.doctors', '/api/doctors/verified/'),
+    ('dashboard.tickets', '/api/support/tickets/'),
+]
+
+
+@scenario('patient_dashboard', 'PATIENT', 25)
+async def patient_dashboard(session):
+    results = await asyncio.gather(
+        *(session.call(name, 'GET', path) for name, path in DASHBOARD), return_exceptions=True
+    )
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        raise StepFailed(str(failed[0]))
+
+
+@scenario('download_pdf', 'PATIENT', 10)
+async def download_pdf(session):
+    """The PDF button: queue an export if the history changed, poll it, fetch the file."""
+    response = await session.call('download_pdf', 'GET', '/api/patients/me/download-pdf/', expect=(200, 202))
+    if response.status == 200:
+        return
+    job = response.json()
+    for _ in range(120):
+        if job['status'] in ('DONE', 'FAILED'):
+            break
+        await asyncio.sleep(0.25)
+        job = (await session.call('download_pdf.poll', 'GET', f"/api/patients/pdf-exports/{job['id']}/")).json()
+    if job['status'] != 'DONE':
+        raise StepFailed(f"download_pdf: export {job['status']}")
+    # This job's file: the history may have changed again while it was rendering
+    await session.call('download_pdf.fetch', 'GET', f"/api/patients/pdf-exports/{job['id']}/download/")
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+from collections import deque
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# The local server is for measuring, not for exercising rate limits: a load run would
+# exhaust the per-doctor and per-patient OTP budgets and DRF's daily anon/user budgets in
+# seconds. Set them in the environment to test throttling on purpose. SQLite writers queue
+# for the database lock instead of failing with "database is locked", and OTP codes go to
+# a file the driver reads (OTP_OUTBOX_FILE is set per server). runserver only speaks HTTP.
+SERVER_ENV = {
+    'OTP_DOCTOR_RATE': '1000000/hour',
+    'OTP_PATIENT_RATE': '1000000/hour',
+    'THROTTLE_ANON_RATE': '1000000/min',
+    'THROTTLE_USER_RATE': '1000000/min',
+    'SQLITE_IMMEDIATE_TRANSACTIONS': 'True',
+    'OTP_SENDER': 'patients.otp.FileOTPSender',
+    'SECURE_SSL_REDIRECT': 'False',
+    'PYTHONUNBUFFERED': '1',
+}
+
+
+class OtpMailbox:
+    """
+    OTP codes read from the file patients.otp.FileOTPSender appends them to, in lieu of the
+    patient's inbox. Register interest with expect() before requesting the code.
+    """
+
+    def __init__(self, path, poll_interval=0.02):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._waiting = {}
+        self._reader = None
+
+    def expect(self, health_id):
+        if self._reader is None:
+            self._reader = asyncio.ensure_future(self._read())
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[health_id] = future
+        return future
+
+    async def _read(self):
+        offset, partial = 0, b''
+        while True:
+            try:
+                with open(self.path, 'rb') as outbox:
+                    outbox.seek(offset)
+                    data = outbox.read()
+            except FileNotFoundError:
+                data = b''
+            offset += len(data)
+            *lines, partial = (partial + data).split(b'\n')
+            for line in lines:
+                health_id, _, code = line.decode().partition(' ')
+                self.deliver(health_id, code)
+            await asyncio.sleep(self.poll_interval)
+
+    def close(self):
+        if self._reader:
+            self._reader.cancel()
+
+    def deliver(self, health_id, code):
+        future = self._waiting.pop(health_id, None)
+        if future is not None and not future.done():
+            future.set_result(code)
+
+    def discard(self, health_id):
+        self._waiting.pop(health_id, None)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """`manage.py runserver` in a subprocess, sending OTP codes to an OtpMailbox."""
+
+    def __init__(self, port=None, env=None, log_path=None):
+        self.port = port or free_port()
+        self.log_path = log_path
+        fd, self.outbox = tempfile.mkstemp(prefix='loadtest-otp-', suffix='.txt')
+        os.close(fd)
+        self.env = dict(
+            os.environ, **{k: v for k, v in SERVER_ENV.items() if k not in os.environ},
+            OTP_OUTBOX_FILE=self.outbox, **(env or {}),
+        )
+        self.mailbox = OtpMailbox(self.outbox)
+        self.tail = deque(maxlen=40)
+        self.process = None
+        self._drain = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, timeout=60):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, 'manage.py', 'runserver', '--noreload', '--skip-checks', f'127.0.0.1:{self.port}',
+            cwd=BASE_DIR, env=self.env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        )
+        self._drain = asyncio.ensure_future(self._read_console())
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            if self.process.returncode is not None:
+                raise RuntimeError("Server exited during startup:\n" + '\n'.join(self.tail))
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                writer.close()
+                return self
+            except OSError:
+                if asyncio.get_running_loop().time() > deadline:
+                    await self.stop()
+                    raise RuntimeError("Server did not start listening:\n" + '\n'.join(self.tail))
+                await asyncio.sleep(0.2)
+
+    async def _read_console(self):
+        # Keep reading even when nothing is of interest: a full pipe would stall the server
+        log = open(self.log_path, 'w') if self.log_path else None
+        try:
+            async for raw in self.process.stdout:
+                line = raw.decode(errors='replace').rstrip()
+                self.tail.append(line)
+                if log:
+                    log.write(line + '\n')
+        finally:
+            if log:
+                log.close()
+
+    async def stop(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 10)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        if self._drain:
+            self._drain.cancel()
+        self.mailbox.close()
+        if os.path.exists(self.outbox):
+            os.remove(self.outbox)
@@ -0,0 +1,136 @@
+import math
+from collections import Counter, defaultdict
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    """
+    Latency samples, status codes and failures per request name (e.g. 'qr_scan') and per
+    scenario run. Everything is kept in memory: a run of a few minutes is a few hundred
+    thousand floats.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = defaultdict(Counter)
+        self.queries = defaultdict(list)
+        self.flows = defaultdict(list)
+        self.flow_errors = Counter()
+
+    def record(self, name, seconds, status=None, error=None, queries=None):
+        """One request. `error` is None for a success, otherwise a short reason."""
+        self.samples[name].append(seconds)
+        if status is not None:
+            self.statuses[name][str(status)] += 1
+        if error:
+            self.errors[name][error] += 1
+        if queries is not None:
+            self.queries[name].append(queries)
+
+    def record_flow(self, name, seconds, ok):
+        """One whole scenario run, e.g. every request of a dashboard load."""
+        self.flows[name].append(seconds)
+        if not ok:
+            self.flow_errors[name] += 1
+
+    def _summary(self, samples, errors, duration):
+        ordered = sorted(samples)
+        count = len(ordered)
+        summary = {
+            'count': count,
+            'errors': errors,
+            'error_rate': round(errors / count, 4) if count else 0.0,
+            'throughput': round(count / duration, 2) if duration else 0.0,
+            'mean_ms': round(sum(ordered) / count * 1000, 2) if count else None,
+            'max_ms': round(ordered[-1] * 1000, 2) if count else None,
+        }
+        for p in PERCENTILES:
+            value = percentile(ordered, p)
+            summary[f'p{p}_ms'] = round(value * 1000, 2) if value is not None else None
+        return summary
+
+    def report(self, duration, meta=None):
+        requests = {}
+        for name, samples in sorted(self.samples.items()):
+            summary = self._summary(samples, sum(self.errors[name].values()), duration)
+            summary['statuses'] = dict(self.statuses[name])
+            summary['failures'] = dict(self.errors[name])
+            if self.queries[name]:
+                summary['db_queries_mean'] = round(sum(self.queries[name]) / len(self.queries[name]), 2)
+            requests[name] = summary
+        scenarios = {
+            name: self._summary(samples, self.flow_errors[name], duration)
+            for name, samples in sorted(self.flows.items())
+        }
+        every = [s for samples in self.samples.values() for s in samples]
+        total = self._summary(every, sum(sum(c.values()) for c in self.errors.values()), duration)
+        return {'meta': dict(meta or {}, duration=round(duration, 2)), 'total': total, 'scenarios': scenarios, 'requests': requests}
+
+
+# --- Reports -------------------------------------------------------------------------------
+
+COLUMNS = ('count', 'throughput', 'error_rate', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+
+
+def _fmt(value):
+    return '-' if value is None else str(value)
+
+
+def format_report(report):
+    rows = [('', *COLUMNS)]
+    for section in ('scenarios', 'requests'):
+        for name, summary in report[section].items():
+            rows.append((f"{section[:-1]} {name}", *(_fmt(summary[c]) for c in COLUMNS)))
+    rows.append(('total', *(_fmt(report['total'][c]) for c in COLUMNS)))
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(str(cell).ljust(w) if i == 0 else str(cell).rjust(w) for i, (cell, w) in enumerate(zip(row, widths)))
+        for row in rows
+    )
+
+
+def _change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before
+
+
+def diff_reports(before, after, threshold=0.10):
+    """
+    Compare two saved reports. Returns rows of (name, metric, before, after, change,
+    regressed): latency percentiles regress when they grow by more than `threshold`,
+    throughput when it drops by more than that, the error rate whenever it grows.
+    """
+    rows = []
+    for section in ('scenarios', 'requests'):
+        for name in sorted(set(before.get(section, {})) | set(after.get(section, {}))):
+            old, new = before.get(section, {}).get(name), after.get(section, {}).get(name)
+            label = f"{section[:-1]} {name}"
+            if old is None or new is None:
+                rows.append((label, 'present', old is not None, new is not None, None, False))
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                change = _change(old[metric], new[metric])
+                rows.append((label, metric, old[metric], new[metric], change, change is not None and change > threshold))
+            change = _change(old['throughput'], new['throughput'])
+            rows.append((label, 'throughput', old['throughput'], new['throughput'], change, change is not None and change < -threshold))
+            rows.append((label, 'error_rate', old['error_rate'], new['error_rate'], None, new['error_rate'] > old['error_rate']))
+    return rows
+
+
+def format_diff(rows):
+    lines = []
+    for label, metric, old, new, change, regressed in rows:
+        delta = f"{change:+.1%}" if change is not None else ''
+        flag = '  REGRESSION' if regressed else ''
+        lines.append(f"{label:<40} {metric:<11} {_fmt(old):>10} -> {_fmt(new):<10} {delta:>8}{flag}")
+    return '\n'.join(lines)
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SharingPermission
+
+AccessDecision = namedtuple('AccessDecision', [
+    'access_types', 'can_view_records', 'can_view_documents', 'can_add_records', 'expires_at',
+])
+NO_ACCESS = AccessDecision((), False, False, False, None)
+
+
+# Decisions are keyed on the doctor's user id, which every request already carries,
+# so authorizing never needs the doctor profile row.
+def _cache_key(doctor_user_id, patient_id):
+    return f"access:{doctor_user_id}:{patient_id}"
+
+
+class _LocalDecisions:
+    """Small thread-safe LRU of decisions with per-entry deadlines (time.time() seconds)."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            decision, deadline = entry
+            if deadline <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return decision
+
+    def set(self, key, decision, deadline):
+        with self._lock:
+            self._entries[key] = (decision, deadline)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.ACCESS_CACHE_LOCAL_SIZE:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = _LocalDecisions()
+
+
+def load_access(doctor_user_id, patient_id):
+    """
+    Resolve the decision from the database: the union of the doctor's active, unexpired
+    permissions for the patient. It stays valid until the earliest of them expires.
+    """
+    now = timezone.now()
+    rows = (
+        SharingPermission.objects
+        .filter(doctor__user_id=doctor_user_id, patient_id=patient_id, is_active=True)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .values_list('access_type', 'can_view_records', 'can_view_documents', 'can_add_records', 'expires_at')
+    )
+    decision = NO_ACCESS
+    for access_type, records, documents, add_records, expires_at in rows:
+        earliest = decision.expires_at
+        if expires_at is not None and (earliest is None or expires_at < earliest):
+            earliest = expires_at
+        decision = AccessDecision(
+            access_types=tuple(sorted(set(decision.access_types) | {access_type})),
+            can_view_records=decision.can_view_records or records,
+            can_view_documents=decision.can_view_documents or documents,
+            can_add_records=decision.can_add_records or add_records,
+            expires_at=earliest,
+        )
+    return decision
+
+
+def _cache_is_shared():
+    # A per-process cache cannot see another worker's invalidation; trusting it would
+    # keep serving a revoked decision for up to ACCESS_CACHE_TTL
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_access(doctor_user_id, patient_id):
+    """
+    What a doctor may currently do with a patient's data.
+    Looked up in-process first, then in the shared cache, then in the database. Entries
+    never outlive the permission they came from: the shared entry's timeout ends at
+    expires_at, and in-process entries are further capped at ACCESS_CACHE_LOCAL_TTL so a
+    revoke made by another worker is picked up within that window. Without a shared
+    cache backend only the in-process layer is used, so that window still holds.
+    """
+    key = _cache_key(doctor_user_id, patient_id)
+    decision = _local.get(key)
+    if decision is not None:
+        return decision
+
+    now = time.time()
+    shared = _cache_is_shared()
+    decision = cache.get(key) if shared else None
+    if decision is None or (decision.expires_at and decision.expires_at.timestamp() <= now):
+        decision = load_access(doctor_user_id, patient_id)
+        timeout = settings.ACCESS_CACHE_TTL
+        if decision.expires_at:
+            timeout = min(timeout, decision.expires_at.timestamp() - now)
+        if shared and timeout > 0:
+            cache.set(key, decision, timeout)
+
+    deadline = now + settings.ACCESS_CACHE_LOCAL_TTL
+    if decision.expires_at:
+        deadline = min(deadline, decision.expires_at.timestamp())
+    _local.set(key, decision, deadline)
+    return decision
+
+
+def invalidate_access(doctor_user_id, patient_id):
+    """Drop the cached decision after a grant, revoke or expiry change."""
+    key = _cache_key(doctor_user_id, patient_id)
+    _local.discard(key)
+    cache.delete(key)
+
+
+def clear_local_access_cache():
+    """Forget every in-process decision (the shared cache expires on its own)."""
+    _local.clear()
+
+
+def doctor_access(user, patient):
+    """Access decision for a user acting as a doctor; NO_ACCESS for anyone else."""
+    if user.role != 'DOCTOR':
+        return NO_ACCESS
+    return get_access(user.pk, patient.pk)
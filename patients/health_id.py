@@ -0,0 +1,117 @@
+import re
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+HEALTH_ID_PREFIX = 'HID-'
+SEQUENCE_NAME = 'health_id'
+
+# HID- + 9 scrambled digits + 1 Damm check digit
+HEALTH_ID_RE = re.compile(r'^HID-(\d{9})(\d)$')
+# IDs issued before check digits existed: HID- + 8 random upper-case hex digits
+LEGACY_HEALTH_ID_RE = re.compile(r'^HID-[0-9A-F]{8}$')
+
+NUMBER_SPACE = 10 ** 9
+# Multiplier coprime with 10, so n -> (n * M + C) mod 10^9 is a bijection:
+# sequential allocation stays collision-free but issued IDs are not consecutive.
+SCRAMBLE_MULTIPLIER = 387420489
+SCRAMBLE_OFFSET = 104729
+
+_DAMM_TABLE = (
+    (0, 3, 1, 7, 5, 9, 8, 6, 4, 2),
+    (7, 0, 9, 2, 1, 5, 4, 8, 6, 3),
+    (4, 2, 0, 6, 8, 7, 1, 3, 5, 9),
+    (1, 7, 5, 0, 9, 8, 3, 4, 2, 6),
+    (6, 1, 2, 3, 0, 4, 5, 9, 7, 8),
+    (3, 6, 7, 4, 2, 0, 9, 5, 8, 1),
+    (5, 8, 6, 9, 7, 2, 0, 1, 3, 4),
+    (8, 9, 4, 5, 3, 6, 2, 0, 1, 7),
+    (9, 4, 3, 8, 6, 1, 7, 2, 0, 5),
+    (2, 5, 8, 1, 4, 3, 6, 7, 9, 0),
+)
+
+
+def damm_check_digit(digits):
+    """Damm check digit for a string of decimal digits (catches all single-digit and adjacent-swap typos)."""
+    interim = 0
+    for digit in digits:
+        interim = _DAMM_TABLE[interim][int(digit)]
+    return interim
+
+
+def format_health_id(number):
+    """Turn an allocated sequence number into a printable Health ID."""
+    digits = f"{(number * SCRAMBLE_MULTIPLIER + SCRAMBLE_OFFSET) % NUMBER_SPACE:09d}"
+    return f"{HEALTH_ID_PREFIX}{digits}{damm_check_digit(digits)}"
+
+
+def is_valid_health_id(value):
+    """
+    Cheap syntactic check, no database access.
+    Accepts check-digit IDs and, unless HEALTH_ID_ACCEPT_LEGACY is off, older random-hex
+    IDs. A check-digit ID with a wrong check digit is always rejected.
+    """
+    if not isinstance(value, str):
+        return False
+    match = HEALTH_ID_RE.match(value)
+    if match:
+        return damm_check_digit(match.group(1)) == int(match.group(2))
+    return settings.HEALTH_ID_ACCEPT_LEGACY and bool(LEGACY_HEALTH_ID_RE.match(value))
+
+
+def reserve_block(size):
+    """
+    Reserve `size` consecutive sequence numbers and return them as a range.
+    The increment runs before the read, so the row lock (or SQLite's write lock)
+    makes concurrent reservations from other workers wait instead of overlapping.
+    """
+    from .models import HealthIdSequence
+
+    HealthIdSequence.objects.get_or_create(name=SEQUENCE_NAME)
+    with transaction.atomic():
+        HealthIdSequence.objects.filter(name=SEQUENCE_NAME).update(next_value=F('next_value') + size)
+        end = HealthIdSequence.objects.values_list('next_value', flat=True).get(name=SEQUENCE_NAME)
+    if end > NUMBER_SPACE:
+        raise RuntimeError("Health ID number space exhausted")
+    return range(end - size, end)
+
+
+class HealthIdAllocator:
+    """
+    Hands out Health IDs from a per-process block, reserving a new block when it runs dry.
+    Blocks are only cached when reserved outside a transaction: inside one, a rollback
+    would undo the reservation while this process kept the numbers, and another worker
+    would be handed them again. There, just the number needed is reserved, and it rolls
+    back together with the row that uses it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._block = iter(())
+
+    def allocate(self):
+        with self._lock:
+            number = next(self._block, None)
+            if number is None and connection.in_atomic_block:
+                number = reserve_block(1)[0]
+            elif number is None:
+                self._block = iter(reserve_block(settings.HEALTH_ID_BLOCK_SIZE))
+                number = next(self._block)
+        return format_health_id(number)
+
+
+_allocator = HealthIdAllocator()
+
+
+def allocate_health_id():
+    """Allocate one Health ID."""
+    return _allocator.allocate()
+
+
+def allocate_health_ids(count):
+    """
+    Allocate `count` Health IDs in a single reservation (bulk imports, data generators).
+    Nothing is cached, so the reservation may safely roll back with the caller's transaction.
+    """
+    return [format_health_id(number) for number in reserve_block(count)]
@@ -0,0 +1,262 @@
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from audit.models import AccessLog
+from audit.writer import write_access_logs
+from doctors.counters import count_created
+from utils import background
+from utils.processes import init_django_worker, hash_password
+from .health_id import allocate_health_ids
+from .models import Patient, EmergencyContact, PatientImportJob
+from .serializers import PatientImportRowSerializer
+
+User = get_user_model()
+
+PATIENT_FIELDS = [
+    'date_of_birth', 'gender', 'blood_group', 'contact_number', 'address',
+    'allergies', 'chronic_conditions', 'organ_donor',
+]
+CSV_CONTACT_COLUMNS = {
+    'emergency_contact_name': 'name',
+    'emergency_contact_relationship': 'relationship',
+    'emergency_contact_phone': 'phone',
+}
+
+
+def detect_format(filename):
+    """Guess the import format from a file name."""
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+def _normalize_csv_row(row):
+    # Empty cells mean "not provided", not "blank value"
+    data = {k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip() != ''}
+    contact = {
+        field: data.pop(column)
+        for column, field in CSV_CONTACT_COLUMNS.items()
+        if column in data
+    }
+    if contact:
+        data['emergency_contacts'] = [contact]
+    return data
+
+
+def iter_rows(fileobj, fmt='csv'):
+    """
+    Stream rows from a CSV or NDJSON file without loading it into memory.
+    Yields (row_number, data); data is None for lines that could not be parsed.
+    """
+    if isinstance(fileobj, io.TextIOBase):
+        stream = fileobj
+    else:
+        stream = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+    if fmt == 'ndjson':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                data = None
+            yield number, data if isinstance(data, dict) else None
+    else:
+        reader = csv.DictReader(stream)
+        # Row 1 is the header
+        for number, row in enumerate(reader, start=2):
+            yield number, _normalize_csv_row(row)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class PatientImporter:
+    """
+    Bulk patient onboarding from CSV/NDJSON.
+    Rows are validated and written in chunks: one transaction and a handful of
+    bulk INSERTs per chunk, with password hashing fanned out to a process pool.
+    Inside a web server pass use_processes=False: forking a threaded process is unsafe,
+    and the hashing (PBKDF2 in OpenSSL) releases the GIL, so threads still run it in parallel.
+    """
+
+    def __init__(self, chunk_size=1000, workers=None, actor=None, stdout=None, use_processes=True):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.use_processes = use_processes
+        self.actor = actor
+        self.stdout = stdout
+        self.created = 0
+        self.errors = []
+        self._seen_usernames = set()
+        self._seen_emails = set()
+
+    def run(self, fileobj, fmt='csv'):
+        if self.use_processes:
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_django_worker)
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import-hash')
+        with pool:
+            for chunk in chunked(iter_rows(fileobj, fmt), self.chunk_size):
+                self._import_chunk(chunk, pool)
+                if self.stdout:
+                    self.stdout.write(f"  {self.created} imported, {len(self.errors)} rejected")
+        return self.report()
+
+    def report(self):
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': sorted(self.errors, key=lambda e: e['row']),
+        }
+
+    def _reject(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def _validate_chunk(self, chunk):
+        valid = []
+        for row_number, data in chunk:
+            if data is None:
+                self._reject(row_number, {'non_field_errors': ['Row could not be parsed.']})
+                continue
+            serializer = PatientImportRowSerializer(data=data)
+            if not serializer.is_valid():
+                self._reject(row_number, serializer.errors)
+                continue
+            valid.append((row_number, serializer.validated_data))
+
+        # Uniqueness: one query per column for the whole chunk, plus rows seen earlier in the file
+        usernames = [row['username'] for _, row in valid]
+        emails = [row['email'] for _, row in valid]
+        taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+
+        unique = []
+        for row_number, row in valid:
+            errors = {}
+            if row['username'] in taken_usernames or row['username'] in self._seen_usernames:
+                errors['username'] = ['A user with that username already exists.']
+            if row['email'] in taken_emails or row['email'] in self._seen_emails:
+                errors['email'] = ['A user with this email already exists.']
+            if errors:
+                self._reject(row_number, errors)
+                continue
+            self._seen_usernames.add(row['username'])
+            self._seen_emails.add(row['email'])
+            unique.append((row_number, row))
+        return unique
+
+    def _import_chunk(self, chunk, pool):
+        rows = self._validate_chunk(chunk)
+        if not rows:
+            return
+
+        raw_passwords = [row.get('password') for _, row in rows]
+        to_hash = [p for p in raw_passwords if p]
+        hashed = iter(pool.map(hash_password, to_hash, chunksize=max(1, len(to_hash) // 32)))
+        # Rows without a password get an unusable one and must go through a reset
+        passwords = [next(hashed) if p else make_password(None) for p in raw_passwords]
+        health_ids = allocate_health_ids(len(rows))
+
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        username=row['username'],
+                        email=row['email'],
+                        password=password,
+                        first_name=row.get('first_name', ''),
+                        last_name=row.get('last_name', ''),
+                        role=User.Role.PATIENT,
+                    )
+                    for (_, row), password in zip(rows, passwords)
+                ])
+                patients = Patient.objects.bulk_create([
+                    Patient(
+                        user=user,
+                        health_id=health_id,
+                        **{field: row[field] for field in PATIENT_FIELDS if field in row}
+                    )
+                    for user, health_id, (_, row) in zip(users, health_ids, rows)
+                ])
+                EmergencyContact.objects.bulk_create([
+                    EmergencyContact(patient=patient, **contact)
+                    for patient, (_, row) in zip(patients, rows)
+                    for contact in row.get('emergency_contacts', [])
+                ])
+                write_access_logs([
+                    AccessLog(
+                        actor=self.actor,
+                        patient=patient,
+                        action=AccessLog.Action.CREATE_HEALTH_ID,
+                        details=f"Bulk imported patient with Health ID: {patient.health_id}"
+                    )
+                    for patient in patients
+                ])
+                # bulk_create skips the signals that keep the dashboard counters in step
+                count_created(patients)
+        except Exception as e:
+            # A concurrent registration can still win a unique constraint; fail the chunk, keep going
+            for row_number, row in rows:
+                self._seen_usernames.discard(row['username'])
+                self._seen_emails.discard(row['email'])
+                self._reject(row_number, {'non_field_errors': [f"Chunk rolled back: {e}"]})
+            return
+
+        self.created += len(patients)
+
+
+def run_import_job(job_id):
+    """Run a pending import job. Runs on the 'patient-import' background pool."""
+    claimed = PatientImportJob.objects.filter(pk=job_id, status=PatientImportJob.Status.PENDING).update(
+        status=PatientImportJob.Status.RUNNING
+    )
+    if not claimed:
+        return
+    job = PatientImportJob.objects.select_related('requested_by').get(pk=job_id)
+
+    importer = PatientImporter(
+        actor=job.requested_by,
+        workers=settings.PATIENT_IMPORT_WORKERS,
+        use_processes=False,
+    )
+    try:
+        with job.file.open('rb') as fileobj:
+            report = importer.run(fileobj, job.format)
+        job.status = PatientImportJob.Status.DONE
+    except Exception as e:
+        report = importer.report()
+        job.status = PatientImportJob.Status.FAILED
+        job.error = str(e)
+    job.created, job.failed = report['created'], report['failed']
+    job.errors = report['errors']
+    job.completed_at = timezone.now()
+    # Uploaded rows can carry passwords in clear; only the report is kept
+    job.file.delete(save=False)
+    job.save(update_fields=['file', 'status', 'created', 'failed', 'errors', 'error', 'completed_at'])
+
+
+def queue_import(upload, fmt, user):
+    """Store an uploaded file as a pending import job and run it once the transaction commits."""
+    with transaction.atomic():
+        job = PatientImportJob.objects.create(requested_by=user, format=fmt, file=upload)
+        # One import at a time per process: each already uses PATIENT_IMPORT_WORKERS hashing threads
+        background.submit_on_commit('patient-import', run_import_job, job.pk, max_workers=1)
+    return job
@@ -0,0 +1,32 @@
+"""
+qr_signing_key.py
+Generate an Ed25519 key for signing QR quick-preview payloads, or show the current public key.
+To rotate: add the current public key (--current) to QR_PAYLOAD_RETIRED_PUBLIC_KEYS, then set
+QR_PAYLOAD_PRIVATE_KEY to a freshly generated key.
+Usage: python manage.py qr_signing_key [--current]
+"""
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
+from django.core import signing
+from django.core.management.base import BaseCommand
+from patients.quick_preview import get_private_key, key_id, public_key_bytes
+
+
+class Command(BaseCommand):
+    help = 'Generate a QR quick-preview signing key, or show the current public key'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--current', action='store_true',
+            help='Print the public key of QR_PAYLOAD_PRIVATE_KEY instead of generating a new key'
+        )
+
+    def handle(self, *args, **options):
+        if options['current']:
+            public_key = get_private_key().public_key()
+        else:
+            private_key = Ed25519PrivateKey.generate()
+            raw = private_key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+            self.stdout.write(f'QR_PAYLOAD_PRIVATE_KEY={signing.b64_encode(raw).decode()}')
+            public_key = private_key.public_key()
+        self.stdout.write(f'Public key {signing.b64_encode(public_key_bytes(public_key)).decode()} (key id {key_id(public_key)})')
@@ -0,0 +1,38 @@
+"""
+render_qr_codes.py
+Render QR images for patients that were saved without one (deferred mode, bulk imports).
+Usage: python manage.py render_qr_codes [--batch-size 500] [--workers 4] [--processes]
+"""
+import time
+from django.core.management.base import BaseCommand
+from patients.qr import pending_qr_patients, render_pending_qr_codes
+
+
+class Command(BaseCommand):
+    help = 'Render pending patient QR codes in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Encode PNGs on a process pool instead of threads'
+        )
+
+    def handle(self, *args, **options):
+        pending = pending_qr_patients().count()
+        self.stdout.write(f'{pending} patients waiting for a QR code')
+        if not pending:
+            return
+
+        started = time.monotonic()
+        rendered = render_pending_qr_codes(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            use_processes=options['processes'],
+            stdout=self.stdout,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} QR codes in {elapsed:.1f}s'
+        ))
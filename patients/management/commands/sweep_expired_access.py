@@ -0,0 +1,39 @@
+"""
+sweep_expired_access.py
+Deactivate expired sharing permissions (QR_QUICK and other timed grants) and purge used
+or expired OTPs. Safe to run alongside live traffic; schedule it from cron, e.g. every 15 minutes.
+Usage: python manage.py sweep_expired_access [--batch-size 1000] [--pause 0.05] [--skip-otps]
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from patients.sweeper import deactivate_expired_permissions, purge_stale_otps
+
+
+class Command(BaseCommand):
+    help = 'Deactivate expired sharing permissions and purge stale OTPs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to sleep between batches to leave room for live writes'
+        )
+        parser.add_argument('--skip-permissions', action='store_true')
+        parser.add_argument('--skip-otps', action='store_true')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stdout = self.stdout if options['verbosity'] > 1 else None
+        sweeps = []
+        if not options['skip_permissions']:
+            sweeps.append(('Deactivated expired permissions', deactivate_expired_permissions))
+        if not options['skip_otps']:
+            sweeps.append(('Purged stale OTPs', purge_stale_otps))
+
+        for label, sweep in sweeps:
+            result = sweep(batch_size=options['batch_size'], pause=options['pause'], now=now, stdout=stdout)
+            rate = result.rows / result.seconds if result.seconds else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: {result.rows} rows in {result.batches} batches, '
+                f'{result.seconds:.2f}s ({rate:.0f} rows/s)'
+            ))
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_healthidsequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='oldprescription',
+            index=models.Index(fields=['patient', '-prescription_date', '-id'], name='oldrx_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientdocument',
+            index=models.Index(fields=['patient', '-uploaded_at', '-id'], name='document_patient_date_idx'),
+        ),
+    ]
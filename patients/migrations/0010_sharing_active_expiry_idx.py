@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0009_pdfexportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sharingpermission',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expires_at'], name='sharing_active_expiry_idx'),
+        ),
+    ]
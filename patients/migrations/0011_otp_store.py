@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+def drop_plaintext_otps(apps, schema_editor):
+    # Outstanding codes were stored in clear and live for ten minutes at most;
+    # they cannot be checked against hashes, and duplicates would break the new constraint.
+    apps.get_model('patients', 'OTPRequest').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0009_timeline_indexes'),
+        ('patients', '0010_sharing_active_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_plaintext_otps, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='otprequest',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='otprequest',
+            name='otp_code',
+            field=models.CharField(help_text='Keyed hash of the code (see patients.otp)', max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='otprequest',
+            constraint=models.UniqueConstraint(fields=('doctor', 'patient'), name='unique_otp_per_doctor_patient'),
+        ),
+    ]
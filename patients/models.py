@@ -2,14 +2,14 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-import uuid
-import qrcode
-from io import BytesIO
-from django.core.files import File
+from django.core.files.base import ContentFile
 from datetime import timedelta
+from .qr import get_qr_data, render_qr_png, qr_file_name, enqueue_qr_render
+from .health_id import allocate_health_id
+from utils.dirty_fields import DirtyFieldsMixin
 
 
-class Patient(models.Model):
+class Patient(DirtyFieldsMixin, models.Model):
     """Patient profile with Health ID and QR code for quick access."""
     
     BLOOD_GROUPS = [
@@ -52,38 +52,38 @@ class Patient(models.Model):
         return f"{self.user.username} - {self.health_id}"
 
     def save(self, *args, **kwargs):
-        if self.pk:
-            old_instance = Patient.objects.get(pk=self.pk)
-            if old_instance.organ_donor != self.organ_donor:
-                self.is_organ_donor_verified = False
-                self.organ_donor_rejection_reason = ""
+        if not self._state.adding and self.has_changed('organ_donor'):
+            self.is_organ_donor_verified = False
+            self.organ_donor_rejection_reason = ""
         
         if not self.health_id:
-            # Generate a unique Health ID (Simple version: UUID prefix)
-            self.health_id = f"HID-{uuid.uuid4().hex[:8].upper()}"
+            # Collision-free, check-digit Health ID from this worker's reserved block
+            self.health_id = allocate_health_id()
         
         # Generate QR Code if it doesn't exist
-        if not self.qr_code:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            # Encode the generic URL for fetching this patient's data
-            # In production, use ACTUAL_DOMAIN from settings
-            qr_data = f"http://localhost:8000/api/patients/{self.health_id}/"
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-
-            img = qr.make_image(fill_color="black", back_color="white")
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            file_name = f"qr_{self.health_id}.png"
-            self.qr_code.save(file_name, File(buffer), save=False)
+        render_later = False
+        if not self.qr_code and settings.QR_RENDER_MODE != 'on_demand':
+            if settings.QR_RENDER_MODE == 'deferred':
+                # Commit the row now and let a background worker render the image
+                render_later = self._state.adding
+            else:
+                png = render_qr_png(get_qr_data(self.health_id))
+                self.qr_code.save(qr_file_name(self.health_id), ContentFile(png), save=False)
 
         super().save(*args, **kwargs)
 
+        if render_later:
+            enqueue_qr_render(self.pk)
+
+
+class HealthIdSequence(models.Model):
+    """Counter from which Health ID number blocks are reserved (see patients.health_id)."""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
 
 class EmergencyContact(models.Model):
     """Emergency contacts who can grant access on behalf of the patient."""
@@ -140,6 +140,9 @@ class PatientDocument(models.Model):
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['patient', '-uploaded_at', '-id'], name='document_patient_date_idx'),
+        ]
 
 
 class OldPrescription(models.Model):
@@ -167,21 +170,28 @@ class OldPrescription(models.Model):
         null=True
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Prescription from {self.prescription_date} - {self.patient.health_id}"
 
     class Meta:
         ordering = ['-prescription_date']
+        indexes = [
+            models.Index(fields=['patient', '-prescription_date', '-id'], name='oldrx_patient_date_idx'),
+        ]
 
 
-class SharingPermission(models.Model):
+class SharingPermission(DirtyFieldsMixin, models.Model):
     """Access permissions granted to doctors - QR quick preview or OTP full access."""
     
     class AccessType(models.TextChoices):
         QR_QUICK = 'QR_QUICK', _('QR Quick Preview (24hr)')
         OTP_FULL = 'OTP_FULL', _('OTP Full Access')
         EMERGENCY = 'EMERGENCY', _('Emergency Access')
+
+    # Lifetime of a QR quick preview, both as a permission and as a signed QR payload
+    QUICK_PREVIEW_TTL = timedelta(hours=24)
     
     patient = models.ForeignKey(
         Patient, 
@@ -227,7 +237,7 @@ class SharingPermission(models.Model):
     def save(self, *args, **kwargs):
         # Auto-set expiry for QR_QUICK access (24 hours)
         if self.access_type == self.AccessType.QR_QUICK and not self.expires_at:
-            self.expires_at = timezone.now() + timedelta(hours=24)
+            self.expires_at = timezone.now() + self.QUICK_PREVIEW_TTL
         
         # Set permissions based on access type
         if self.access_type == self.AccessType.QR_QUICK:
@@ -254,10 +264,16 @@ class SharingPermission(models.Model):
 
     class Meta:
         ordering = ['-granted_at']
+        indexes = [
+            # Lets the expiry sweeper find live-but-expired grants without scanning history
+            models.Index(fields=['expires_at'], condition=models.Q(is_active=True), name='sharing_active_expiry_idx'),
+        ]
 
 
 class OTPRequest(models.Model):
     """Temporary storage for OTPs requested by doctors."""
+
+    LIFETIME = timedelta(minutes=10)
     
     doctor = models.ForeignKey(
         'doctors.Doctor', 
@@ -269,14 +285,93 @@ class OTPRequest(models.Model):
         on_delete=models.CASCADE, 
         related_name='otp_requests'
     )
-    otp_code = models.CharField(max_length=6)
+    otp_code = models.CharField(max_length=64, help_text=_("Keyed hash of the code (see patients.otp)"))
     created_at = models.DateTimeField(auto_now_add=True)
     is_verified = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
     
     def __str__(self):
         return f"OTP for {self.patient.health_id} by Dr. {self.doctor.user.username}"
 
     @property
     def is_expired(self):
-        # OTP valid for 10 minutes
-        return timezone.now() > self.created_at + timedelta(minutes=10)
+        return timezone.now() > self.created_at + self.LIFETIME
+
+    class Meta:
+        constraints = [
+            # One outstanding OTP per pair: issue replaces it, verify is a keyed lookup
+            models.UniqueConstraint(fields=['doctor', 'patient'], name='unique_otp_per_doctor_patient'),
+        ]
+
+
+class PdfExportJob(models.Model):
+    """A medical-history PDF export, rendered off the request thread and reused while the history is unchanged."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        RUNNING = 'RUNNING', _('Running')
+        DONE = 'DONE', _('Done')
+        FAILED = 'FAILED', _('Failed')
+
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.CASCADE,
+        related_name='pdf_exports'
+    )
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True
+    )
+    fingerprint = models.CharField(
+        max_length=64,
+        help_text=_("Hash of the history the PDF was rendered from")
+    )
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    file = models.FileField(upload_to='pdf_exports/', blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"PDF export #{self.pk} for {self.patient.health_id} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['patient', 'fingerprint'], name='pdfexport_fingerprint_idx'),
+        ]
+
+
+class PatientImportJob(models.Model):
+    """A bulk patient import from an uploaded file, run off the request thread."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        RUNNING = 'RUNNING', _('Running')
+        DONE = 'DONE', _('Done')
+        FAILED = 'FAILED', _('Failed')
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True
+    )
+    file = models.FileField(
+        upload_to='patient_imports/', blank=True, null=True,
+        help_text=_("The uploaded file; deleted once imported, as it may contain passwords")
+    )
+    format = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    created = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Patient import #{self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
@@ -0,0 +1,148 @@
+import hashlib
+import hmac
+import secrets
+from abc import ABC, abstractmethod
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+from .models import OTPRequest
+
+# verify() outcomes
+OTP_OK = 'ok'
+OTP_INVALID = 'invalid'
+OTP_EXPIRED = 'expired'
+OTP_LOCKED = 'locked'
+OTP_MISSING = 'missing'
+
+
+def generate_otp_code():
+    return f"{secrets.randbelow(10 ** 6):06d}"
+
+
+def hash_otp_code(doctor_id, patient_id, code):
+    """Keyed hash of an OTP, bound to the (doctor, patient) pair; codes are never stored in clear."""
+    message = f"{doctor_id}:{patient_id}:{code}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+class OTPStore(ABC):
+    """
+    Holds at most one outstanding OTP per (doctor, patient), valid for OTPRequest.LIFETIME
+    and for OTP_MAX_ATTEMPTS guesses. Issuing a new code replaces the previous one.
+    """
+
+    @abstractmethod
+    def issue(self, doctor_id, patient_id):
+        """Create (or replace) the OTP for the pair and return the plain code to send."""
+
+    @abstractmethod
+    def verify(self, doctor_id, patient_id, code):
+        """Check and consume a code. Returns one of the OTP_* outcomes."""
+
+
+class DatabaseOTPStore(OTPStore):
+    """One OTPRequest row per pair, found through the (doctor, patient) unique index."""
+
+    def issue(self, doctor_id, patient_id):
+        code = generate_otp_code()
+        OTPRequest.objects.update_or_create(
+            doctor_id=doctor_id,
+            patient_id=patient_id,
+            defaults={
+                'otp_code': hash_otp_code(doctor_id, patient_id, code),
+                'created_at': timezone.now(),
+                'attempts': 0,
+                'is_verified': False,
+            }
+        )
+        return code
+
+    def verify(self, doctor_id, patient_id, code):
+        otp = OTPRequest.objects.filter(doctor_id=doctor_id, patient_id=patient_id, is_verified=False).first()
+        if otp is None:
+            return OTP_MISSING
+        if otp.is_expired:
+            return OTP_EXPIRED
+
+        # Count the attempt first, conditionally, so parallel guesses cannot exceed the limit
+        counted = OTPRequest.objects.filter(
+            pk=otp.pk, attempts__lt=settings.OTP_MAX_ATTEMPTS
+        ).update(attempts=F('attempts') + 1)
+        if not counted:
+            return OTP_LOCKED
+        if not constant_time_compare(otp.otp_code, hash_otp_code(doctor_id, patient_id, code)):
+            return OTP_INVALID
+
+        consumed = OTPRequest.objects.filter(pk=otp.pk, is_verified=False).update(is_verified=True)
+        return OTP_OK if consumed else OTP_MISSING
+
+
+class CacheOTPStore(OTPStore):
+    """OTPs live only in the shared cache and expire there natively; nothing touches the database."""
+
+    def _keys(self, doctor_id, patient_id):
+        return f"otp:{doctor_id}:{patient_id}", f"otp-attempts:{doctor_id}:{patient_id}"
+
+    def issue(self, doctor_id, patient_id):
+        code = generate_otp_code()
+        key, attempts_key = self._keys(doctor_id, patient_id)
+        timeout = OTPRequest.LIFETIME.total_seconds()
+        cache.set_many({key: hash_otp_code(doctor_id, patient_id, code), attempts_key: 0}, timeout)
+        return code
+
+    def verify(self, doctor_id, patient_id, code):
+        key, attempts_key = self._keys(doctor_id, patient_id)
+        stored = cache.get(key)
+        if stored is None:
+            return OTP_MISSING
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            return OTP_MISSING
+        if attempts > settings.OTP_MAX_ATTEMPTS:
+            cache.delete(key)
+            return OTP_LOCKED
+        if not constant_time_compare(stored, hash_otp_code(doctor_id, patient_id, code)):
+            return OTP_INVALID
+        # Only the request that actually removes the key gets to use the code
+        return OTP_OK if cache.delete(key) else OTP_MISSING
+
+
+def get_otp_store():
+    return import_string(settings.OTP_STORE)()
+
+
+class OTPSender(ABC):
+    """Delivers a freshly issued code to the patient, who reads it out to the doctor."""
+
+    @abstractmethod
+    def send(self, patient, doctor, code):
+        """Deliver `code` to `patient`."""
+
+
+class EmailOTPSender(OTPSender):
+    """Emails the code to the patient's registered address."""
+
+    def send(self, patient, doctor, code):
+        from utils.notifications import send_otp_email
+        send_otp_email(patient, doctor, code)
+
+
+class FileOTPSender(OTPSender):
+    """
+    Appends '<health id> <code>' lines to OTP_OUTBOX_FILE, where the load-test harness reads
+    them. Codes are written in clear: never select it on a real deployment.
+    """
+
+    def send(self, patient, doctor, code):
+        # One write per line, so lines from concurrent requests do not interleave
+        with open(settings.OTP_OUTBOX_FILE, 'a') as outbox:
+            outbox.write(f"{patient.health_id} {code}\n")
+
+
+def get_otp_sender():
+    return import_string(settings.OTP_SENDER)()
@@ -0,0 +1,247 @@
+import hashlib
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from utils import background
+from utils.processes import init_django_worker
+
+# Bump when the PDF layout changes so cached exports are re-rendered
+PDF_LAYOUT_VERSION = 2
+
+
+def history_fingerprint(patient):
+    """
+    Hash of everything that appears in the PDF, computed from a few aggregate queries.
+    Counts catch deletions that a max(updated_at) alone would miss. Doctor and test names
+    live on rows that have no updated_at of their own, so the names themselves go in.
+    """
+    from doctors.models import Consultation
+    from labs.models import LabReport
+    from .models import OldPrescription
+
+    parts = [
+        PDF_LAYOUT_VERSION,
+        patient.health_id,
+        patient.updated_at.isoformat(),
+        patient.user.get_full_name(),
+    ]
+    for model in (Consultation, OldPrescription, LabReport):
+        stats = model.objects.filter(patient=patient).aggregate(n=Count('pk'), latest=Max('updated_at'))
+        parts += [stats['n'], stats['latest'].isoformat() if stats['latest'] else '']
+    parts += Consultation.objects.filter(patient=patient).values_list(
+        'doctor__user__first_name', 'doctor__user__last_name', 'doctor__user__username',
+    ).order_by('doctor__user__username').distinct()
+    parts += LabReport.objects.filter(patient=patient).values_list('test_type__name', flat=True).order_by('test_type__name').distinct()
+    return hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def render_history_pdf(patient):
+    """Build the medical-history PDF for a patient and return its bytes."""
+    from utils.pdf_generator import generate_patient_pdf
+    from utils.report_data import load_patient_report
+
+    return generate_patient_pdf(load_patient_report(patient.pk)).getvalue()
+
+
+def run_export(job_id):
+    """Render a pending export job. Runs on the 'pdf-export' background pool."""
+    from .models import PdfExportJob
+
+    claimed = PdfExportJob.objects.filter(pk=job_id, status=PdfExportJob.Status.PENDING).update(
+        status=PdfExportJob.Status.RUNNING
+    )
+    if not claimed:
+        return
+    job = PdfExportJob.objects.select_related('patient__user').get(pk=job_id)
+
+    try:
+        pdf = render_history_pdf(job.patient)
+        job.file.save(f"{job.patient.health_id}_{job.fingerprint[:16]}.pdf", ContentFile(pdf), save=False)
+        job.status = PdfExportJob.Status.DONE
+    except Exception as e:
+        job.status = PdfExportJob.Status.FAILED
+        job.error = str(e)
+    job.completed_at = timezone.now()
+    job.save(update_fields=['file', 'status', 'error', 'completed_at'])
+
+    if job.status == PdfExportJob.Status.DONE:
+        # Only the newest export of a patient's history is worth keeping on disk
+        for old in PdfExportJob.objects.filter(patient=job.patient, status=PdfExportJob.Status.DONE).exclude(pk=job.pk):
+            if old.file:
+                old.file.delete(save=False)
+            old.delete()
+
+
+def request_export(patient, user):
+    """
+    Return an export job for the patient's current history, creating and queueing one if needed.
+    A finished export of an unchanged history is reused as-is; an identical export already
+    in flight is shared instead of rendered twice. Returns (job, created).
+    """
+    from .models import PdfExportJob
+
+    fingerprint = history_fingerprint(patient)
+    stale_before = timezone.now() - timedelta(seconds=settings.PDF_EXPORT_STALE_AFTER)
+    existing = (
+        PdfExportJob.objects
+        .filter(patient=patient, fingerprint=fingerprint)
+        .exclude(status=PdfExportJob.Status.FAILED)
+        .order_by('-created_at')
+        .first()
+    )
+    if existing is not None:
+        if existing.status == PdfExportJob.Status.DONE and existing.file and existing.file.storage.exists(existing.file.name):
+            return existing, False
+        if existing.status != PdfExportJob.Status.DONE and existing.created_at > stale_before:
+            return existing, False
+
+    with transaction.atomic():
+        job = PdfExportJob.objects.create(patient=patient, requested_by=user, fingerprint=fingerprint)
+        background.submit_on_commit(
+            'pdf-export', run_export, job.pk,
+            max_workers=settings.PDF_EXPORT_WORKERS
+        )
+    return job, True
+
+
+class _ZipStream:
+    """Write-only sink for ZipFile; whatever has been written is handed out by drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportBusy(Exception):
+    """Every bulk-export slot in this process is taken."""
+
+
+_active_bulk_exports = 0
+_bulk_exports_lock = threading.Lock()
+
+
+def _claim_bulk_export():
+    global _active_bulk_exports
+    with _bulk_exports_lock:
+        if _active_bulk_exports >= settings.PDF_BULK_EXPORT_CONCURRENCY:
+            raise ExportBusy()
+        _active_bulk_exports += 1
+
+
+def _release_bulk_export():
+    global _active_bulk_exports
+    with _bulk_exports_lock:
+        _active_bulk_exports -= 1
+
+
+class _BulkExportStream:
+    """
+    Iterator over one export's chunks that gives its slot back once exhausted, failed or
+    closed. Closing a generator that never started skips its finally, hence the wrapper.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._chunks.close()
+            _release_bulk_export()
+
+
+def stream_pdf_zip(patient_ids, workers=None, use_processes=None, on_exported=None):
+    """
+    Return an iterator of bytes chunks making up a ZIP archive of medical-history PDFs,
+    one entry per patient. Each export starts its own pool of `workers`, so at most
+    PDF_BULK_EXPORT_CONCURRENCY exports run per process; beyond that ExportBusy is raised
+    before any work starts. The slot is held until the stream is exhausted or closed.
+    """
+    _claim_bulk_export()
+    return _BulkExportStream(_pdf_zip_chunks(patient_ids, workers, use_processes, on_exported))
+
+
+def _pdf_zip_chunks(patient_ids, workers, use_processes, on_exported):
+    """
+    Report data is loaded here (a fixed handful of queries per patient); only the
+    CPU-bound rendering runs on the pool. At most 2 * workers PDFs are in flight and each
+    is written out as soon as it finishes, so memory stays flat however long the list is.
+    `on_exported` receives the patient ids of each written batch (for access logging).
+    """
+    from utils.pdf_generator import render_patient_pdf_bytes
+    from utils.report_data import load_patient_report
+
+    workers = workers or settings.PDF_BULK_EXPORT_WORKERS
+    if use_processes is None:
+        use_processes = settings.PDF_BULK_EXPORT_PROCESSES
+    if use_processes:
+        # Forked children must not share this process's database sockets
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_django_worker)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED)
+    pending = {}
+
+    def write_done(done):
+        exported = []
+        for future in done:
+            patient_id, health_id = pending.pop(future)
+            try:
+                archive.writestr(f"{health_id}.pdf", future.result())
+                exported.append(patient_id)
+            except Exception as e:
+                archive.writestr(f"{health_id}.error.txt", f"PDF generation failed: {e}\n")
+        if exported and on_exported:
+            on_exported(exported)
+        return stream.drain()
+
+    try:
+        for patient_id in patient_ids:
+            report = load_patient_report(patient_id)
+            pending[pool.submit(render_patient_pdf_bytes, report)] = (patient_id, report.patient.health_id)
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                chunk = write_done(done)
+                if chunk:
+                    yield chunk
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            chunk = write_done(done)
+            if chunk:
+                yield chunk
+        archive.close()
+        yield stream.drain()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,173 @@
+import hashlib
+import qrcode
+import qrcode.image.svg
+from functools import lru_cache
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+
+from utils import background
+from utils.metrics import QR_RENDER
+
+
+def get_qr_data(health_id):
+    """URL encoded into a patient's QR code."""
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}/api/patients/{health_id}/"
+
+
+@QR_RENDER.time(format='png')
+def render_qr_png(data):
+    """Render `data` as a QR code and return the PNG bytes."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+QR_BORDER = 4
+QR_MIN_SIZE = 64
+QR_MAX_SIZE = 1024
+QR_DEFAULT_SIZE = 300
+
+
+def clamp_qr_size(size):
+    """Parse a requested pixel size, falling back to the default and clamping to sane bounds."""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return QR_DEFAULT_SIZE
+    return max(QR_MIN_SIZE, min(QR_MAX_SIZE, size))
+
+
+def _render_qr_image(data, size, fmt):
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=QR_BORDER,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    if fmt == 'svg':
+        # Vector output scales itself; the pixel size only matters for PNG
+        return qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).to_string()
+
+    # Largest whole-pixel module size that fits the requested width keeps edges crisp
+    qr.box_size = max(1, size // (qr.modules_count + 2 * QR_BORDER))
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _render_qr_image_timed(data, size, fmt):
+    with QR_RENDER.time(format=fmt):
+        return _render_qr_image(data, size, fmt)
+
+
+# Cache hits are not timed: qr_render_seconds counts actual renders
+_render_qr_image_cached = lru_cache(maxsize=settings.QR_IMAGE_CACHE_SIZE)(_render_qr_image_timed)
+
+
+def render_qr_image(health_id, size=QR_DEFAULT_SIZE, fmt='png'):
+    """
+    Render a patient's QR code on demand.
+    Output depends only on the health ID, PUBLIC_BASE_URL, size and format, so results
+    are kept in a bounded in-memory LRU; clients revalidate them by ETag.
+    """
+    if fmt == 'svg':
+        size = None
+    return _render_qr_image_cached(get_qr_data(health_id), size, fmt)
+
+
+def qr_image_etag(health_id, size=QR_DEFAULT_SIZE, fmt='png'):
+    """Strong ETag for a rendered QR image, computable without rendering it."""
+    if fmt == 'svg':
+        size = None
+    key = f"{get_qr_data(health_id)}|{size}|{fmt}"
+    return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def qr_file_name(health_id):
+    return f"qr_{health_id}.png"
+
+
+def pending_qr_patients():
+    """Patients whose row is committed but whose QR image has not been rendered yet."""
+    from .models import Patient
+    return Patient.objects.filter(Q(qr_code='') | Q(qr_code__isnull=True))
+
+
+def attach_qr_code(patient, png):
+    """
+    Store a rendered QR image for an already-saved patient.
+    Writes only the qr_code column so concurrent profile edits are not clobbered.
+    Returns True if this call attached the image.
+    """
+    patient.qr_code.save(qr_file_name(patient.health_id), ContentFile(png), save=False)
+    updated = pending_qr_patients().filter(pk=patient.pk).update(qr_code=patient.qr_code.name)
+    if not updated:
+        # Another worker got there first; drop our copy.
+        patient.qr_code.storage.delete(patient.qr_code.name)
+    return bool(updated)
+
+
+def render_patient_qr(patient_pk):
+    """Render and attach the QR image for a single patient if it is still pending."""
+    patient = pending_qr_patients().only('pk', 'health_id', 'qr_code').filter(pk=patient_pk).first()
+    if patient is None:
+        return False
+    return attach_qr_code(patient, render_qr_png(get_qr_data(patient.health_id)))
+
+
+def enqueue_qr_render(patient_pk):
+    """Hand a freshly committed patient to the background QR render pool."""
+    background.submit_on_commit(
+        'qr-render', render_patient_qr, patient_pk,
+        max_workers=settings.QR_RENDER_WORKERS
+    )
+
+
+def render_pending_qr_codes(batch_size=500, workers=None, use_processes=False, stdout=None):
+    """
+    Drain the pending-render queue in primary-key order.
+    PNG encoding runs on a thread or process pool; storage writes stay in this process.
+    Returns the number of images attached.
+    """
+    workers = workers or settings.QR_RENDER_WORKERS
+    pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    rendered = 0
+    last_pk = 0
+
+    with pool_class(max_workers=workers) as pool:
+        while True:
+            batch = list(
+                pending_qr_patients()
+                .filter(pk__gt=last_pk)
+                .only('pk', 'health_id', 'qr_code')
+                .order_by('pk')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            images = pool.map(render_qr_png, [get_qr_data(p.health_id) for p in batch])
+            for patient, png in zip(batch, images):
+                if attach_qr_code(patient, png):
+                    rendered += 1
+
+            if stdout:
+                stdout.write(f"  Rendered {rendered} QR codes (up to patient #{last_pk})")
+
+    return rendered
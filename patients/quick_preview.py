@@ -0,0 +1,183 @@
+import binascii
+import hashlib
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+PAYLOAD_VERSION = 2
+
+
+class QuickPreviewExpired(signing.SignatureExpired):
+    """Signature is valid but the payload is older than the QR quick-preview window."""
+
+
+def _b64(data):
+    return signing.b64_encode(data).decode()
+
+
+def _unb64(text):
+    return signing.b64_decode(text.encode())
+
+
+def public_key_bytes(public_key):
+    return public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+
+def key_id(public_key):
+    """Short, stable id of a public key; payloads name the key that signed them with it."""
+    return hashlib.sha256(public_key_bytes(public_key)).hexdigest()[:8]
+
+
+@lru_cache(maxsize=8)
+def _load_private_key(encoded):
+    return Ed25519PrivateKey.from_private_bytes(_unb64(encoded))
+
+
+@lru_cache(maxsize=32)
+def _load_public_key(encoded):
+    return Ed25519PublicKey.from_public_bytes(_unb64(encoded))
+
+
+def get_private_key():
+    if not settings.QR_PAYLOAD_PRIVATE_KEY:
+        raise ImproperlyConfigured(
+            "QR_PAYLOAD_PRIVATE_KEY is not set; generate one with `manage.py qr_signing_key`."
+        )
+    return _load_private_key(settings.QR_PAYLOAD_PRIVATE_KEY)
+
+
+def public_keys():
+    """Public keys payloads may be signed with, by key id: the current key first, then retired ones."""
+    keys = {}
+    if settings.QR_PAYLOAD_PRIVATE_KEY:
+        current = get_private_key().public_key()
+        keys[key_id(current)] = current
+    for encoded in settings.QR_PAYLOAD_RETIRED_PUBLIC_KEYS:
+        retired = _load_public_key(encoded)
+        keys.setdefault(key_id(retired), retired)
+    return keys
+
+
+def allergies_digest(allergies):
+    """
+    Short form of the allergy list that fits in a QR code.
+    Long lists are truncated and tagged with a hash of the full text, so a client
+    can tell two different truncated lists apart and knows to fetch the full record.
+    """
+    text = ' '.join((allergies or '').split())
+    limit = settings.QR_PAYLOAD_ALLERGY_CHARS
+    if len(text) <= limit:
+        return text
+    tag = hashlib.sha256(text.encode()).hexdigest()[:8]
+    return f"{text[:limit].rstrip()}… #{tag}"
+
+
+def build_quick_preview(patient, issued_at=None, kid=''):
+    """Compact, single-letter-keyed preview of the fields a first responder needs."""
+    return {
+        'v': PAYLOAD_VERSION,
+        'k': kid,
+        'h': patient.health_id,
+        'b': patient.blood_group or '',
+        'a': allergies_digest(patient.allergies),
+        'o': 1 if patient.organ_donor else 0,
+        't': int(issued_at if issued_at is not None else time.time()),
+    }
+
+
+def encode_quick_preview(patient, issued_at=None):
+    """
+    Signed token to embed in the patient's QR code: base64url(JSON payload) "." base64url(
+    Ed25519 signature of the first part). The payload's `k` names the signing key, so an
+    offline client verifies against the matching key from the published key set.
+    """
+    private_key = get_private_key()
+    payload = build_quick_preview(patient, issued_at, kid=key_id(private_key.public_key()))
+    body = _b64(json.dumps(payload, separators=(',', ':')).encode())
+    return f"{body}.{_b64(private_key.sign(body.encode()))}"
+
+
+def decode_quick_preview(token, at=None):
+    """
+    Verify a scanned token and return the preview fields.
+    `at` is when the code was scanned (defaults to now), so scans synced after the
+    device comes back online are judged against the window they were made in.
+    Raises signing.BadSignature (or QuickPreviewExpired) on failure.
+    """
+    from .models import SharingPermission
+
+    try:
+        body, signature = token.split('.')
+        data = json.loads(_unb64(body))
+        public_keys()[data['k']].verify(_unb64(signature), body.encode())
+    except (ValueError, KeyError, TypeError, binascii.Error, InvalidSignature):
+        raise signing.BadSignature("Quick preview signature does not match")
+    if data.get('v') != PAYLOAD_VERSION:
+        raise signing.BadSignature("Unsupported quick preview payload")
+
+    issued_at = datetime.fromtimestamp(data['t'], tz=dt_timezone.utc)
+    at = at or datetime.now(tz=dt_timezone.utc)
+    if at < issued_at or at - issued_at > SharingPermission.QUICK_PREVIEW_TTL:
+        raise QuickPreviewExpired("Quick preview payload is outside its validity window")
+
+    return {
+        'health_id': data['h'],
+        'blood_group': data['b'],
+        'allergies': data['a'],
+        'organ_donor': bool(data['o']),
+        'issued_at': issued_at,
+        'expires_at': issued_at + SharingPermission.QUICK_PREVIEW_TTL,
+    }
+
+
+def grant_quick_preview(patient, doctor, expires_at):
+    """
+    Record a verified scan as the doctor's QR_QUICK permission, lasting as long as the
+    payload. A live grant that already covers as much (OTP or emergency access, or a later
+    expiry) is left alone, and a scan synced after the payload expired grants nothing.
+    Returns the permission in force, or None.
+    """
+    from .models import SharingPermission
+
+    now = timezone.now()
+    if expires_at <= now:
+        return None
+    with transaction.atomic():
+        permission = (
+            SharingPermission.objects.select_for_update()
+            .filter(patient=patient, doctor=doctor)
+            .order_by('-granted_at')
+            .first()
+        )
+        if permission is None:
+            return SharingPermission.objects.create(
+                patient=patient,
+                doctor=doctor,
+                access_type=SharingPermission.AccessType.QR_QUICK,
+                expires_at=expires_at,
+                granted_by=patient.user,
+            )
+        live = permission.is_active and (permission.expires_at is None or permission.expires_at > now)
+        if live and (
+            permission.access_type != SharingPermission.AccessType.QR_QUICK
+            or permission.expires_at is None
+            or permission.expires_at >= expires_at
+        ):
+            return permission
+        permission.access_type = SharingPermission.AccessType.QR_QUICK
+        permission.is_active = True
+        permission.revoked_at = None
+        permission.expires_at = expires_at
+        permission.granted_by = patient.user
+        permission.save()
+        return permission
@@ -1,8 +1,12 @@
 from rest_framework import serializers
 from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from .models import (
     Patient, EmergencyContact, PatientDocument, 
-    OldPrescription, SharingPermission
+    OldPrescription, SharingPermission, PdfExportJob, PatientImportJob
 )
 from accounts.serializers import UserSerializer
 
@@ -19,10 +23,22 @@ class EmergencyContactSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class QRCodeURLMixin:
+    """Adds `qr_code_url`, pointing at the on-demand QR image endpoint."""
+
+    def get_qr_code_url(self, obj):
+        if not obj.health_id:
+            return None
+        url = reverse('patient-qr', kwargs={'health_id': obj.health_id})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class PatientSerializer(QRCodeURLMixin, serializers.ModelSerializer):
     """Full patient serializer with user details."""
     user = UserSerializer(read_only=True)
     emergency_contacts = EmergencyContactSerializer(many=True, read_only=True)
+    qr_code_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Patient
@@ -33,14 +49,15 @@ class PatientSerializer(serializers.ModelSerializer):
         )
 
 
-class PatientBasicSerializer(serializers.ModelSerializer):
+class PatientBasicSerializer(QRCodeURLMixin, serializers.ModelSerializer):
     """Basic patient info for BASIC authorization level doctors."""
     user = UserSerializer(read_only=True)
+    qr_code_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Patient
         fields = [
-            'id', 'user', 'health_id', 'qr_code', 
+            'id', 'user', 'health_id', 'qr_code', 'qr_code_url', 
             'date_of_birth', 'contact_number', 'address'
         ]
         read_only_fields = fields
@@ -97,6 +114,7 @@ class SharingPermissionSerializer(serializers.ModelSerializer):
             'is_active', 'is_expired', 'revoked_at'
         ]
         read_only_fields = ['id', 'granted_at', 'is_expired', 'revoked_at']
+        related_hints = ['doctor__user']
     
     def get_doctor_name(self, obj):
         return f"Dr. {obj.doctor.user.get_full_name() or obj.doctor.user.username}"
@@ -116,3 +134,61 @@ class GrantAccessSerializer(serializers.Serializer):
         except Doctor.DoesNotExist:
             raise serializers.ValidationError("Doctor not found or not verified.")
         return value
+
+
+class PdfExportJobSerializer(serializers.ModelSerializer):
+    """Status of a medical-history PDF export."""
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PdfExportJob
+        fields = ['id', 'status', 'error', 'created_at', 'completed_at', 'download_url']
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != PdfExportJob.Status.DONE:
+            return None
+        url = reverse('pdf-export-download', kwargs={'pk': obj.pk})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class PatientImportJobSerializer(serializers.ModelSerializer):
+    """Status and, once finished, the per-row error report of a bulk patient import."""
+
+    class Meta:
+        model = PatientImportJob
+        fields = ['id', 'status', 'format', 'created', 'failed', 'errors', 'error', 'created_at', 'completed_at']
+        read_only_fields = fields
+
+
+class QuickPreviewVerifySerializer(serializers.Serializer):
+    """A scanned QR quick-preview payload, optionally synced after an offline scan."""
+    payload = serializers.CharField()
+    scanned_at = serializers.DateTimeField(required=False)
+
+    def validate_scanned_at(self, value):
+        if value > timezone.now() + timedelta(minutes=5):
+            raise serializers.ValidationError("Scan time is in the future.")
+        return value
+
+
+class PatientImportRowSerializer(serializers.Serializer):
+    """Validates a single row of a bulk patient import file."""
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField()
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    date_of_birth = serializers.DateField(required=False, allow_null=True)
+    gender = serializers.ChoiceField(choices=Patient.GENDER_CHOICES, required=False)
+    blood_group = serializers.ChoiceField(choices=Patient.BLOOD_GROUPS, required=False, allow_blank=True)
+    contact_number = serializers.CharField(max_length=15, required=False, allow_blank=True)
+    address = serializers.CharField(required=False, allow_blank=True)
+    allergies = serializers.CharField(required=False, allow_blank=True)
+    chronic_conditions = serializers.CharField(required=False, allow_blank=True)
+    organ_donor = serializers.BooleanField(required=False)
+    emergency_contacts = EmergencyContactSerializer(many=True, required=False)
+
+    def validate_email(self, value):
+        return value.lower()
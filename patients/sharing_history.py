@@ -0,0 +1,117 @@
+import heapq
+from itertools import islice
+
+from django.db.models import Max, Q
+
+from accounts.models import User
+from audit.archive import archived_entries
+from audit.models import AccessLog, AuditSegment
+from utils.pagination import encode_time_cursor, decode_time_cursor, parse_date_bound
+
+
+def history_filters(params):
+    """
+    Parse the `action`, `since`, `until` and `actor_role` query parameters into a dict of
+    criteria for `sharing_history`. `action` and `actor_role` accept comma-separated lists.
+    Raises ValueError on bad input.
+    """
+    filters = {'actions': [], 'roles': [], 'since': None, 'until': None}
+    if params.get('action'):
+        actions = [a.strip().upper() for a in params['action'].split(',') if a.strip()]
+        unknown = set(actions) - set(AccessLog.Action.values)
+        if unknown:
+            raise ValueError(f"Unknown action: {', '.join(sorted(unknown))}")
+        filters['actions'] = actions
+    if params.get('actor_role'):
+        roles = [r.strip().upper() for r in params['actor_role'].split(',') if r.strip()]
+        unknown = set(roles) - set(User.Role.values)
+        if unknown:
+            raise ValueError(f"Unknown role: {', '.join(sorted(unknown))}")
+        filters['roles'] = roles
+    if params.get('since'):
+        filters['since'] = parse_date_bound(params['since'])
+    if params.get('until'):
+        filters['until'] = parse_date_bound(params['until'], end_of_day=True)
+    return filters
+
+
+def _hot_entry(log):
+    return {
+        'id': log.pk,
+        'actor': log.actor.username if log.actor else 'Unknown',
+        'actor_role': log.actor.role if log.actor else None,
+        'action': log.get_action_display(),
+        'action_code': log.action,
+        'details': log.details,
+        'timestamp': log.timestamp,
+    }
+
+
+def _archived_entry(record, role):
+    return {
+        'id': record['id'],
+        'actor': record['actor_username'] or 'Unknown',
+        'actor_role': role,
+        'action': AccessLog.Action(record['action']).label,
+        'action_code': record['action'],
+        'details': record['details'],
+        'timestamp': record['timestamp'],
+    }
+
+
+def sharing_history(patient, limit, before=None, filters=None):
+    """
+    One page of the patient's access log, newest first. Hot rows are sought through the
+    (patient, -timestamp, -id) index from the cursor position instead of being offset into;
+    once the page reaches back past the newest archived day, the patient's archived rows are
+    merged in the same way as the audit log list. Returns (entries, next_cursor).
+    """
+    filters = filters or {}
+    actions, roles = filters.get('actions'), filters.get('roles')
+    since, until = filters.get('since'), filters.get('until')
+    before = decode_time_cursor(before) if before else None
+
+    qs = AccessLog.objects.filter(patient=patient)
+    if actions:
+        qs = qs.filter(action__in=actions)
+    if roles:
+        qs = qs.filter(actor__role__in=roles)
+    if since is not None:
+        qs = qs.filter(timestamp__gte=since)
+    if until is not None:
+        qs = qs.filter(timestamp__lt=until)
+    if before is not None:
+        ts, pk = before
+        qs = qs.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+    hot_rows = [((log.timestamp, log.pk), log) for log in qs.select_related('actor').order_by('-timestamp', '-id')[:limit + 1]]
+    streams = [hot_rows]
+
+    # Archived records carry the actor's id but not their role; look each actor up once
+    actor_roles = {}
+
+    def role_of(actor_id):
+        if actor_id is None:
+            return None
+        if actor_id not in actor_roles:
+            actor_roles[actor_id] = User.objects.filter(pk=actor_id).values_list('role', flat=True).first()
+        return actor_roles[actor_id]
+
+    archived_until = AuditSegment.objects.aggregate(end=Max('end'))['end']
+    if archived_until is not None and (since is None or since < archived_until) and (
+        len(hot_rows) <= limit or hot_rows[-1][0][0] < archived_until
+    ):
+        archived = archived_entries(since, until, before, actions, patient=patient.pk)
+        if roles:
+            archived = (record for record in archived if role_of(record['actor']) in roles)
+        streams.append(((record['timestamp'], record['id']), record) for record in archived)
+    page = list(islice(heapq.merge(*streams, key=lambda item: item[0], reverse=True), limit + 1))
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_time_cursor(*page[-1][0])
+    entries = [
+        _hot_entry(item) if isinstance(item, AccessLog) else _archived_entry(item, role_of(item['actor']))
+        for _, item in page
+    ]
+    return entries, next_cursor
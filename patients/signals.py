@@ -34,3 +34,18 @@ from django.db.models.signals import post_delete
 def notify_access_deleted(sender, instance, **kwargs):
     """Notify if permission is deleted forcefully."""
     send_access_revoked_email(instance.patient, instance.doctor)
+
+
+from django.db import transaction
+from .access import invalidate_access
+
+@receiver(post_save, sender=SharingPermission)
+@receiver(post_delete, sender=SharingPermission)
+def invalidate_access_decision(sender, instance, **kwargs):
+    """
+    Any grant, revoke or edit changes what the doctor may see. Drop the cached decision now
+    and again after commit, so a read racing the transaction cannot re-cache the old state.
+    """
+    doctor_user_id = instance.doctor.user_id
+    invalidate_access(doctor_user_id, instance.patient_id)
+    transaction.on_commit(lambda: invalidate_access(doctor_user_id, instance.patient_id))
@@ -0,0 +1,81 @@
+import time
+from collections import namedtuple
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .access import invalidate_access
+from .models import SharingPermission, OTPRequest
+
+SweepResult = namedtuple('SweepResult', ['rows', 'batches', 'seconds'])
+
+
+def _sweep(select_batch, apply_batch, batch_size, pause, stdout, label):
+    """
+    Keyset-paginated sweep: each batch selects the next `batch_size` matching primary keys
+    after the last one seen and applies the change in its own short transaction, so live
+    traffic is only ever blocked for one batch (SQLite has a single writer).
+    Rows locked by live requests are skipped on Postgres and picked up by the next run.
+    """
+    started = time.monotonic()
+    last_pk = 0
+    rows = batches = 0
+    while True:
+        with transaction.atomic():
+            batch = select_batch(last_pk, batch_size)
+            if not batch:
+                break
+            rows += apply_batch(batch)
+        batches += 1
+        last_pk = batch[-1][0]
+        if stdout and batches % 10 == 0:
+            elapsed = time.monotonic() - started
+            stdout.write(f"  {label}: {rows} rows in {batches} batches ({rows / elapsed:.0f} rows/s)")
+        if pause:
+            time.sleep(pause)
+    return SweepResult(rows, batches, time.monotonic() - started)
+
+
+def deactivate_expired_permissions(batch_size=1000, pause=0, now=None, stdout=None):
+    """Flip is_active off for permissions whose expires_at has passed."""
+    now = now or timezone.now()
+    expired = Q(is_active=True, expires_at__lte=now)
+
+    def select_batch(last_pk, size):
+        return list(
+            SharingPermission.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(expired, pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'doctor__user_id', 'patient_id')[:size]
+        )
+
+    def apply_batch(batch):
+        # Re-check the predicate: an OTP upgrade may have extended the row since it was read
+        updated = SharingPermission.objects.filter(expired, pk__in=[pk for pk, _, _ in batch]).update(is_active=False)
+        pairs = {(doctor_user_id, patient_id) for _, doctor_user_id, patient_id in batch}
+        transaction.on_commit(lambda: [invalidate_access(*pair) for pair in pairs])
+        return updated
+
+    return _sweep(select_batch, apply_batch, batch_size, pause, stdout, 'permissions')
+
+
+def purge_stale_otps(batch_size=1000, pause=0, now=None, stdout=None):
+    """Delete OTPs that have been used or can no longer be used."""
+    now = now or timezone.now()
+    stale = Q(is_verified=True) | Q(created_at__lte=now - OTPRequest.LIFETIME)
+
+    def select_batch(last_pk, size):
+        return list(
+            OTPRequest.objects
+            .select_for_update(skip_locked=True)
+            .filter(stale, pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk')[:size]
+        )
+
+    def apply_batch(batch):
+        deleted, _ = OTPRequest.objects.filter(stale, pk__in=[pk for pk, in batch]).delete()
+        return deleted
+
+    return _sweep(select_batch, apply_batch, batch_size, pause, stdout, 'otps')
@@ -1,6 +1,14 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from io import StringIO
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.contrib.auth import get_user_model
-from .models import Patient, Record
+from django.core.management import call_command
+from .models import Patient
+from records.models import MedicalRecord as Record
 from doctors.models import Doctor
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -23,6 +31,989 @@ class PatientModelTest(TestCase):
     def test_str(self):
         self.assertTrue(str(self.patient).startswith(self.user.username))
 
+class PatientChangeTrackingTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='tracked', password='pw', role='PATIENT', email='tracked@test.com')
+        self.patient = Patient.objects.get(user=user)
+        self.patient.organ_donor = True
+        self.patient.is_organ_donor_verified = True
+        self.patient.save()
+
+    def test_update_writes_only_changed_columns(self):
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.contact_number = '555-0100'
+        with CaptureQueriesContext(connection) as ctx:
+            patient.save()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        self.assertIn('contact_number', sql)
+        self.assertNotIn('organ_donor', sql)
+
+    def test_unchanged_save_is_noop(self):
+        from django.db.models.signals import post_save
+
+        seen = []
+        def receiver(sender, instance, created, update_fields, **kwargs):
+            seen.append((created, update_fields))
+        post_save.connect(receiver, sender=Patient)
+        self.addCleanup(post_save.disconnect, receiver, sender=Patient)
+
+        patient = Patient.objects.get(pk=self.patient.pk)
+        with self.assertNumQueries(0):
+            patient.save()
+        # Still a save as far as signal handlers are concerned
+        self.assertEqual(seen, [(False, frozenset())])
+
+    def test_file_replaced_in_place_is_dirty(self):
+        from django.core.files.base import ContentFile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        patient = Patient.objects.get(pk=self.patient.pk)
+        with self.settings(MEDIA_ROOT=media_root):
+            patient.qr_code.save('first.png', ContentFile(b'1'))
+            patient.qr_code.save('second.png', ContentFile(b'2'), save=False)
+        self.assertEqual(patient.get_dirty_fields(), ['qr_code'])
+        self.assertTrue(patient.has_changed('qr_code'))
+
+    def test_organ_donor_change_resets_verification(self):
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.organ_donor = False
+        with self.assertNumQueries(1):
+            patient.save()
+        patient.refresh_from_db()
+        self.assertFalse(patient.is_organ_donor_verified)
+        self.assertFalse(patient.has_changed('organ_donor'))
+
+
+class QRRenderTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_sync_mode_renders_on_save(self):
+        with override_settings(MEDIA_ROOT=self.media_root, QR_RENDER_MODE='sync'):
+            user = User.objects.create_user(username='qrsync', password='pw', role='PATIENT', email='qrsync@test.com')
+            patient = Patient.objects.get(user=user)
+            self.assertTrue(patient.qr_code.name.startswith('qr_codes/'))
+
+    def test_deferred_mode_leaves_qr_pending(self):
+        with override_settings(MEDIA_ROOT=self.media_root, QR_RENDER_MODE='deferred'):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                user = User.objects.create_user(username='qrlater', password='pw', role='PATIENT', email='qrlater@test.com')
+            patient = Patient.objects.get(user=user)
+            self.assertFalse(patient.qr_code)
+            self.assertEqual(len(callbacks), 1)
+
+    def test_render_command_drains_pending(self):
+        with override_settings(MEDIA_ROOT=self.media_root, QR_RENDER_MODE='deferred'):
+            for i in range(3):
+                User.objects.create_user(username=f'bulk{i}', password='pw', role='PATIENT', email=f'bulk{i}@test.com')
+            self.assertEqual(Patient.objects.filter(qr_code='').count(), 3)
+
+            call_command('render_qr_codes', '--batch-size', '2', stdout=StringIO())
+
+            self.assertEqual(Patient.objects.filter(qr_code='').count(), 0)
+            patient = Patient.objects.get(user__username='bulk0')
+            self.assertEqual(patient.qr_code.name, f"qr_codes/qr_{patient.health_id}.png")
+
+
+class QRCodeEndpointTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='qrpat', password='pw', role='PATIENT', email='qrpat@test.com')
+        self.patient = Patient.objects.get(user=self.user)
+        self.url = f'/api/patients/{self.patient.health_id}/qr.png'
+
+    def test_png_is_cacheable(self):
+        response = self.client.get(self.url, {'size': 200})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+        cached = self.client.get(self.url, {'size': 200}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_svg_format(self):
+        response = self.client.get(self.url, {'format': 'svg'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
+
+    def test_malformed_health_id(self):
+        response = self.client.get('/api/patients/HID_NOPE0000/qr.png')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_known_and_unknown_ids_look_alike(self):
+        from .health_id import format_health_id
+        unknown = format_health_id(123456789)
+        self.assertFalse(Patient.objects.filter(health_id=unknown).exists())
+        response = self.client.get(f'/api/patients/{unknown}/qr.png')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_profile_exposes_qr_url(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/patients/me/')
+        self.assertTrue(response.data['qr_code_url'].endswith(self.url))
+
+
+class PatientImportTest(TestCase):
+    CSV = (
+        "username,email,password,first_name,date_of_birth,blood_group,emergency_contact_name,emergency_contact_relationship,emergency_contact_phone\n"
+        "imp1,imp1@test.com,s3cret-pass,Ann,1990-04-01,A+,Bob,Brother,555\n"
+        "imp2,imp2@test.com,,Ben,,O-,,,\n"
+        "imp1,dup@test.com,,Dup,,,,,\n"
+        "bad user!,bad@test.com,,,not-a-date,XX,,,\n"
+    )
+
+    def test_csv_import(self):
+        from .importer import PatientImporter
+        from io import BytesIO
+
+        report = PatientImporter(chunk_size=2, workers=1).run(BytesIO(self.CSV.encode()), 'csv')
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([e['row'] for e in report['errors']], [4, 5])
+        self.assertIn('username', report['errors'][0]['errors'])
+        self.assertEqual(set(report['errors'][1]['errors']), {'username', 'date_of_birth', 'blood_group'})
+
+        ann = Patient.objects.get(user__username='imp1')
+        self.assertTrue(ann.user.check_password('s3cret-pass'))
+        self.assertEqual(ann.blood_group, 'A+')
+        self.assertEqual(ann.emergency_contacts.get().name, 'Bob')
+        self.assertFalse(Patient.objects.get(user__username='imp2').user.has_usable_password())
+        self.assertEqual(len({p.health_id for p in Patient.objects.all()}), 2)
+
+    def test_admin_ndjson_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .importer import run_import_job
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        admin = User.objects.create_superuser(username='importer', password='pw', email='importer@test.com')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        lines = b'{"username": "nd1", "email": "nd1@test.com", "emergency_contacts": [{"name": "Cy", "relationship": "Friend", "phone": "1"}]}\nnot json\n'
+        upload = SimpleUploadedFile('patients.ndjson', lines, content_type='application/x-ndjson')
+
+        with self.settings(MEDIA_ROOT=media_root):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = client.post('/api/patients/import/', {'file': upload}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data['status'], 'PENDING')
+            self.assertEqual(len(callbacks), 1)
+            self.assertFalse(Patient.objects.filter(user__username='nd1').exists())
+
+            run_import_job(response.data['id'])
+
+        job = client.get(f"/api/patients/import/{response.data['id']}/").data
+        self.assertEqual(job['status'], 'DONE')
+        self.assertEqual(job['created'], 1)
+        self.assertEqual(job['errors'][0]['row'], 2)
+        self.assertTrue(Patient.objects.filter(user__username='nd1', emergency_contacts__name='Cy').exists())
+        # The upload is not kept once imported
+        self.assertEqual(os.listdir(os.path.join(media_root, 'patient_imports')), [])
+
+
+class HealthIdTest(TestCase):
+    def test_check_digit_catches_typos(self):
+        from .health_id import format_health_id, is_valid_health_id
+
+        health_id = format_health_id(42)
+        self.assertTrue(is_valid_health_id(health_id))
+        digits = health_id[4:]
+        typo = digits[:3] + str((int(digits[3]) + 1) % 10) + digits[4:]
+        swapped = digits[:2] + digits[3] + digits[2] + digits[4:]
+        self.assertFalse(is_valid_health_id('HID-' + typo))
+        if swapped != digits:
+            self.assertFalse(is_valid_health_id('HID-' + swapped))
+        self.assertFalse(is_valid_health_id('HID 123/../x'))
+
+    def test_older_ids_still_resolve(self):
+        from .health_id import is_valid_health_id
+        # Random hex IDs (some all digits) predate the check digit
+        for legacy in ('HID-1A2B3C4D', 'HID-12345678'):
+            self.assertTrue(is_valid_health_id(legacy), legacy)
+        # Anything else is rejected without a lookup
+        for junk in ('HID-123', 'HID-1a2b3c4d', 'PATIENT-0042', 'HID-1A2B3C4D5'):
+            self.assertFalse(is_valid_health_id(junk), junk)
+
+    @override_settings(HEALTH_ID_ACCEPT_LEGACY=False)
+    def test_legacy_ids_can_be_rejected(self):
+        from .health_id import is_valid_health_id
+        self.assertFalse(is_valid_health_id('HID-1A2B3C4D'))
+
+    @override_settings(HEALTH_ID_BLOCK_SIZE=3)
+    def test_allocation_is_unique_across_blocks(self):
+        from .health_id import HealthIdAllocator, allocate_health_ids, is_valid_health_id
+
+        allocator = HealthIdAllocator()
+        ids = [allocator.allocate() for _ in range(7)] + allocate_health_ids(5)
+        self.assertEqual(len(set(ids)), 12)
+        self.assertTrue(all(is_valid_health_id(i) for i in ids))
+
+    @override_settings(HEALTH_ID_BLOCK_SIZE=100)
+    def test_rolled_back_reservation_is_not_reused(self):
+        from django.db import transaction
+        from .health_id import HealthIdAllocator
+
+        first, second = HealthIdAllocator(), HealthIdAllocator()
+        try:
+            with transaction.atomic():
+                first.allocate()
+                raise RuntimeError('registration failed')
+        except RuntimeError:
+            pass
+        # The reservation rolled back: the first worker must not hand out the rest of its block
+        ids = [second.allocate(), second.allocate(), first.allocate()]
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_new_patients_get_check_digit_ids(self):
+        from .health_id import HEALTH_ID_RE
+        user = User.objects.create_user(username='hidpat', password='pw', role='PATIENT', email='hidpat@test.com')
+        self.assertRegex(Patient.objects.get(user=user).health_id, HEALTH_ID_RE)
+
+    def test_malformed_id_is_rejected_without_queries(self):
+        doctor_user = User.objects.create_user(username='hiddoc', password='pw', role='DOCTOR', email='hiddoc@test.com')
+        client = APIClient()
+        client.force_authenticate(user=doctor_user)
+        with self.assertNumQueries(0):
+            response = client.get('/api/patients/HID-0000000001/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AccessDecisionCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from doctors.models import Hospital
+        from .access import clear_local_access_cache
+
+        cache.clear()
+        clear_local_access_cache()
+        self.client = APIClient()
+        self.patient_user = User.objects.create_user(username='acpat', password='pw', role='PATIENT', email='acpat@test.com')
+        self.patient = Patient.objects.get(user=self.patient_user)
+        self.doc_user = User.objects.create_user(username='acdoc', password='pw', role='DOCTOR', email='acdoc@test.com')
+        hospital = Hospital.objects.create(name='AC Hospital', address='4 Main St', registration_number='ACH1', phone='1', email='ach@test.com')
+        self.doctor = Doctor.objects.create(user=self.doc_user, hospital=hospital, license_number='AC1', specialization='Gen', is_verified=True)
+
+    def test_decisions_are_cached_and_invalidated(self):
+        from .access import get_access
+
+        self.assertFalse(get_access(self.doc_user.pk, self.patient.pk).can_view_records)
+
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.post('/api/patients/sharing/grant/', {'doctor_id': self.doctor.pk, 'access_type': 'QR_QUICK'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        decision = get_access(self.doc_user.pk, self.patient.pk)
+        self.assertTrue(decision.can_view_records)
+        self.assertFalse(decision.can_view_documents)
+        self.assertEqual(decision.access_types, ('QR_QUICK',))
+        with self.assertNumQueries(0):
+            get_access(self.doc_user.pk, self.patient.pk)
+
+        self.client.post(f"/api/patients/sharing/{response.data['id']}/revoke/")
+        self.assertFalse(get_access(self.doc_user.pk, self.patient.pk).can_view_records)
+
+    def test_otp_verification_upgrades_cached_decision(self):
+        from .access import get_access
+        from .models import SharingPermission
+        from .otp import get_otp_store
+
+        SharingPermission.objects.create(patient=self.patient, doctor=self.doctor, access_type='QR_QUICK')
+        self.assertFalse(get_access(self.doc_user.pk, self.patient.pk).can_add_records)
+
+        code = get_otp_store().issue(self.doctor.pk, self.patient.pk)
+        self.client.force_authenticate(user=self.doc_user)
+        response = self.client.post('/api/patients/otp/verify/', {'health_id': self.patient.health_id, 'otp_code': code}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        decision = get_access(self.doc_user.pk, self.patient.pk)
+        self.assertTrue(decision.can_add_records)
+        self.assertIsNone(decision.expires_at)
+
+    def test_entry_expires_with_permission(self):
+        import time
+        from datetime import timedelta
+        from .access import get_access
+        from .models import SharingPermission
+
+        SharingPermission.objects.create(
+            patient=self.patient, doctor=self.doctor, access_type='QR_QUICK',
+            expires_at=timezone.now() + timedelta(milliseconds=300)
+        )
+        self.assertTrue(get_access(self.doc_user.pk, self.patient.pk).can_view_records)
+        time.sleep(0.4)
+        # No invalidation happened; the cached entry simply ran out with the permission
+        self.assertFalse(get_access(self.doc_user.pk, self.patient.pk).can_view_records)
+
+    @override_settings(ACCESS_CACHE_LOCAL_TTL=0)
+    def test_per_process_cache_is_not_trusted_across_workers(self):
+        from .access import get_access
+        from .models import SharingPermission
+
+        SharingPermission.objects.create(patient=self.patient, doctor=self.doctor, access_type='QR_QUICK')
+        self.assertTrue(get_access(self.doc_user.pk, self.patient.pk).can_view_records)
+        # A revoke in another worker invalidates only that worker's copies
+        SharingPermission.objects.update(is_active=False)
+        self.assertFalse(get_access(self.doc_user.pk, self.patient.pk).can_view_records)
+
+    def test_records_endpoint_requires_access(self):
+        Record.objects.create(patient=self.patient, doctor=self.doc_user, record_type='DIAGNOSIS', title='Flu')
+        self.client.force_authenticate(user=self.doc_user)
+        self.assertEqual(len(self.client.get('/api/records/', {'patient': self.patient.health_id}).data), 0)
+
+        from .models import SharingPermission
+        SharingPermission.objects.create(patient=self.patient, doctor=self.doctor, access_type='QR_QUICK')
+        self.assertEqual(len(self.client.get('/api/records/', {'patient': self.patient.health_id}).data), 1)
+
+
+class ExpirySweeperTest(TestCase):
+    def setUp(self):
+        from doctors.models import Hospital
+
+        hospital = Hospital.objects.create(name='SW Hospital', address='5 Main St', registration_number='SWH1', phone='1', email='swh@test.com')
+        doc_user = User.objects.create_user(username='swdoc', password='pw', role='DOCTOR', email='swdoc@test.com')
+        self.doctor = Doctor.objects.create(user=doc_user, hospital=hospital, license_number='SW1', specialization='Gen')
+        self.patients = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'swpat{i}', password='pw', role='PATIENT', email=f'swpat{i}@test.com')
+            self.patients.append(Patient.objects.get(user=user))
+
+    def test_command_sweeps_in_batches(self):
+        from datetime import timedelta
+        from .models import SharingPermission, OTPRequest
+
+        past = timezone.now() - timedelta(hours=1)
+        expired = [
+            SharingPermission.objects.create(patient=p, doctor=self.doctor, access_type='QR_QUICK', expires_at=past)
+            for p in self.patients
+        ]
+        live = SharingPermission.objects.create(patient=self.patients[0], doctor=self.doctor, access_type='QR_QUICK')
+        full = SharingPermission.objects.create(patient=self.patients[1], doctor=self.doctor, access_type='OTP_FULL')
+
+        used = OTPRequest.objects.create(doctor=self.doctor, patient=self.patients[0], otp_code='111111', is_verified=True)
+        old = OTPRequest.objects.create(doctor=self.doctor, patient=self.patients[1], otp_code='222222')
+        OTPRequest.objects.filter(pk=old.pk).update(created_at=past)
+        fresh = OTPRequest.objects.create(doctor=self.doctor, patient=self.patients[2], otp_code='333333')
+
+        out = StringIO()
+        call_command('sweep_expired_access', '--batch-size', '2', stdout=out)
+
+        self.assertFalse(SharingPermission.objects.filter(pk__in=[p.pk for p in expired], is_active=True).exists())
+        self.assertEqual(SharingPermission.objects.filter(pk__in=[live.pk, full.pk], is_active=True).count(), 2)
+        self.assertEqual(list(OTPRequest.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertIn('Deactivated expired permissions: 3 rows in 2 batches', out.getvalue())
+        self.assertIn('Purged stale OTPs: 2 rows in 1 batches', out.getvalue())
+
+
+class OTPStoreTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from doctors.models import Hospital
+
+        cache.clear()
+        self.client = APIClient()
+        hospital = Hospital.objects.create(name='OTP Hospital', address='6 Main St', registration_number='OTPH1', phone='1', email='otph@test.com')
+        self.doc_user = User.objects.create_user(username='otpdoc', password='pw', role='DOCTOR', email='otpdoc@test.com')
+        self.doctor = Doctor.objects.create(user=self.doc_user, hospital=hospital, license_number='OTP1', specialization='Gen', is_verified=True)
+        pat_user = User.objects.create_user(username='otppat', password='pw', role='PATIENT', email='otppat@test.com')
+        self.patient = Patient.objects.get(user=pat_user)
+
+    def _check_store(self, store):
+        from .otp import OTP_OK, OTP_INVALID, OTP_LOCKED, OTP_MISSING
+
+        code = store.issue(self.doctor.pk, self.patient.pk)
+        wrong = '000000' if code != '000000' else '111111'
+        self.assertEqual(store.verify(self.doctor.pk, self.patient.pk, wrong), OTP_INVALID)
+        self.assertEqual(store.verify(self.doctor.pk, self.patient.pk, code), OTP_OK)
+        # Codes are single use
+        self.assertEqual(store.verify(self.doctor.pk, self.patient.pk, code), OTP_MISSING)
+
+        code = store.issue(self.doctor.pk, self.patient.pk)
+        with self.settings(OTP_MAX_ATTEMPTS=2):
+            store.verify(self.doctor.pk, self.patient.pk, wrong)
+            store.verify(self.doctor.pk, self.patient.pk, wrong)
+            self.assertEqual(store.verify(self.doctor.pk, self.patient.pk, code), OTP_LOCKED)
+
+    def test_database_store(self):
+        from .models import OTPRequest
+        from .otp import DatabaseOTPStore
+
+        self._check_store(DatabaseOTPStore())
+        # Re-issuing replaces the pair's row instead of adding one
+        self.assertEqual(OTPRequest.objects.count(), 1)
+        self.assertNotIn(OTPRequest.objects.get().otp_code, {'000000', '111111'})
+
+    def test_cache_store(self):
+        from .models import OTPRequest
+        from .otp import CacheOTPStore
+
+        self._check_store(CacheOTPStore())
+        self.assertFalse(OTPRequest.objects.exists())
+
+    def test_request_endpoint_is_rate_limited(self):
+        self.client.force_authenticate(user=self.doc_user)
+        with self.settings(OTP_PATIENT_RATE='2/hour'):
+            for _ in range(2):
+                response = self.client.post('/api/patients/otp/request/', {'health_id': self.patient.health_id}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.post('/api/patients/otp/request/', {'health_id': self.patient.health_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_request_endpoint_sends_the_code_to_the_patient(self):
+        from unittest import mock
+        from .otp import OTP_OK, get_otp_store
+
+        self.client.force_authenticate(user=self.doc_user)
+        with mock.patch('utils.notifications.send_email_async') as send:
+            response = self.client.post('/api/patients/otp/request/', {'health_id': self.patient.health_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('dev_note', response.data)
+        _, message, recipients = send.call_args.args
+        self.assertEqual(recipients, ['otppat@test.com'])
+        code = message.split('Your one-time code is: ')[1][:6]
+        self.assertEqual(get_otp_store().verify(self.doctor.pk, self.patient.pk, code), OTP_OK)
+
+    def test_file_sender_for_load_tests(self):
+        outbox = os.path.join(tempfile.mkdtemp(), 'outbox.txt')
+        self.addCleanup(shutil.rmtree, os.path.dirname(outbox))
+        self.client.force_authenticate(user=self.doc_user)
+        with self.settings(OTP_SENDER='patients.otp.FileOTPSender', OTP_OUTBOX_FILE=outbox):
+            self.client.post('/api/patients/otp/request/', {'health_id': self.patient.health_id}, format='json')
+        with open(outbox) as fh:
+            health_id, code = fh.read().split()
+        self.assertEqual(health_id, self.patient.health_id)
+        response = self.client.post('/api/patients/otp/verify/', {'health_id': health_id, 'otp_code': code}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_verify_endpoint_grants_access(self):
+        from .models import SharingPermission
+        from .otp import get_otp_store
+
+        code = get_otp_store().issue(self.doctor.pk, self.patient.pk)
+        self.client.force_authenticate(user=self.doc_user)
+        response = self.client.post('/api/patients/otp/verify/', {'health_id': self.patient.health_id, 'otp_code': code}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(SharingPermission.objects.filter(patient=self.patient, doctor=self.doctor, access_type='OTP_FULL').exists())
+
+    def test_verify_endpoint_has_no_fixed_code(self):
+        from .models import SharingPermission
+        from .otp import OTPStore
+
+        with self.assertRaises(TypeError):
+            OTPStore()
+        self.client.force_authenticate(user=self.doc_user)
+        response = self.client.post('/api/patients/otp/verify/', {'health_id': self.patient.health_id, 'otp_code': '12345'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(SharingPermission.objects.filter(patient=self.patient, doctor=self.doctor).exists())
+
+
+class SharingHistoryTest(TestCase):
+    def setUp(self):
+        from audit.models import AccessLog
+
+        self.client = APIClient()
+        pat_user = User.objects.create_user(username='histpat', password='pw', role='PATIENT')
+        self.patient = Patient.objects.get(user=pat_user)
+        doctors = [
+            User.objects.create_user(username=f'histdoc{i}', password='pw', role='DOCTOR', email=f'histdoc{i}@test.com')
+            for i in range(3)
+        ]
+        AccessLog.objects.all().delete()
+        # Same timestamp for several rows so the id tie-break is exercised
+        same_moment = timezone.now() - timezone.timedelta(days=1)
+        for i in range(6):
+            log = AccessLog.objects.create(
+                actor=doctors[i % 3] if i % 2 else pat_user,
+                patient=self.patient,
+                action=AccessLog.Action.VIEW_RECORDS if i % 2 else AccessLog.Action.GRANT_ACCESS,
+                details=f'entry {i}',
+            )
+            if i < 4:
+                AccessLog.objects.filter(pk=log.pk).update(timestamp=same_moment)
+        self.client.force_authenticate(user=pat_user)
+
+    def test_cursor_walks_every_entry_once(self):
+        seen, url = [], '/api/patients/sharing-history/?limit=2'
+        while url:
+            with self.assertNumQueries(3):  # patient + page + newest archived day
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(entry['details'] for entry in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, ['entry 5', 'entry 4', 'entry 3', 'entry 2', 'entry 1', 'entry 0'])
+
+    def test_filters(self):
+        response = self.client.get('/api/patients/sharing-history/', {'action': 'view_records', 'actor_role': 'DOCTOR'})
+        self.assertEqual([e['details'] for e in response.data['results']], ['entry 5', 'entry 3', 'entry 1'])
+
+        today = timezone.localdate().isoformat()
+        response = self.client.get('/api/patients/sharing-history/', {'since': today})
+        self.assertEqual([e['details'] for e in response.data['results']], ['entry 5', 'entry 4'])
+        response = self.client.get('/api/patients/sharing-history/', {'until': (timezone.localdate() - timezone.timedelta(days=1)).isoformat()})
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_bad_parameters(self):
+        for params in ({'before': 'garbage'}, {'action': 'NOPE'}, {'since': 'yesterday'}, {'actor_role': 'GHOST'}):
+            response = self.client.get('/api/patients/sharing-history/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_archived_days_are_paged_after_the_hot_rows(self):
+        from audit.models import AccessLog
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        doctor = User.objects.get(username='histdoc0')
+        old = timezone.now() - timezone.timedelta(days=60)
+        for i in range(3):
+            log = AccessLog.objects.create(
+                actor=doctor if i else self.patient.user,
+                patient=self.patient,
+                action=AccessLog.Action.VIEW_RECORDS,
+                details=f'archived {i}',
+            )
+            AccessLog.objects.filter(pk=log.pk).update(timestamp=old + timezone.timedelta(minutes=i))
+        with self.settings(AUDIT_ARCHIVE_DIR=tmp):
+            call_command('archive_access_logs', '--older-than-days', '30', stdout=open(os.devnull, 'w'))
+            self.assertFalse(AccessLog.objects.filter(details__startswith='archived').exists())
+
+            seen, url = [], '/api/patients/sharing-history/?limit=4'
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                seen.extend(entry['details'] for entry in response.data['results'])
+                url = response.data['next']
+            self.assertEqual(seen, [
+                'entry 5', 'entry 4', 'entry 3', 'entry 2', 'entry 1', 'entry 0',
+                'archived 2', 'archived 1', 'archived 0',
+            ])
+
+            response = self.client.get('/api/patients/sharing-history/', {'actor_role': 'DOCTOR', 'until': (timezone.localdate() - timezone.timedelta(days=30)).isoformat()})
+            self.assertEqual(
+                [(e['details'], e['actor'], e['actor_role'], e['action']) for e in response.data['results']],
+                [('archived 2', 'histdoc0', 'DOCTOR', 'View Records'), ('archived 1', 'histdoc0', 'DOCTOR', 'View Records')],
+            )
+
+
+
+class OrganDonorRequestsTest(TestCase):
+    def setUp(self):
+        from .models import EmergencyContact
+
+        self.client = APIClient()
+        self.staff = User.objects.create_superuser(username='odroot', password='pw', email='odroot@test.com')
+        self.client.force_authenticate(user=self.staff)
+        self.serial = 0
+        self.EmergencyContact = EmergencyContact
+
+    def _add_donor(self):
+        self.serial += 1
+        user = User.objects.create_user(username=f'donor{self.serial}', password='pw', role='PATIENT', email=f'donor{self.serial}@test.com')
+        patient = Patient.objects.get(user=user)
+        patient.organ_donor = True
+        patient.save()
+        self.EmergencyContact.objects.create(patient=patient, name='Kin', relationship='Sibling', phone='1')
+
+    def _list(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/patients/organ-donor-requests/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response.data
+
+    def test_query_count_does_not_grow_with_donors(self):
+        self._add_donor()
+        queries, _ = self._list()
+        self._add_donor()
+        self._add_donor()
+        more_queries, data = self._list()
+        self.assertEqual(more_queries, queries)
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[0]['emergency_contacts'][0]['name'], 'Kin')
+        self.assertTrue(data[0]['user']['username'].startswith('donor'))
+
+def new_qr_signing_key():
+    """A fresh (QR_PAYLOAD_PRIVATE_KEY, public key) pair, both base64 as in settings."""
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat, PublicFormat
+    from django.core import signing
+
+    key = Ed25519PrivateKey.generate()
+    private = key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+    public = key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    return signing.b64_encode(private).decode(), signing.b64_encode(public).decode()
+
+
+class QuickPreviewTest(TestCase):
+    def setUp(self):
+        from doctors.models import Hospital
+
+        self.private_key, self.public_key = new_qr_signing_key()
+        override = override_settings(QR_PAYLOAD_PRIVATE_KEY=self.private_key, QR_PAYLOAD_RETIRED_PUBLIC_KEYS=[])
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.client = APIClient()
+        self.patient_user = User.objects.create_user(username='qppat', password='pw', role='PATIENT', email='qppat@test.com')
+        self.patient = Patient.objects.get(user=self.patient_user)
+        self.patient.blood_group = 'B-'
+        self.patient.allergies = 'Penicillin'
+        self.patient.organ_donor = True
+        self.patient.save()
+        self.doctor_user = User.objects.create_user(username='qpdoc', password='pw', role='DOCTOR', email='qpdoc@test.com')
+        hospital = Hospital.objects.create(name='QP Hospital', address='1 Main St', registration_number='QPH1', phone='1', email='qph@test.com')
+        self.doctor = Doctor.objects.create(user=self.doctor_user, hospital=hospital, license_number='QP1', specialization='Gen', is_verified=True)
+
+    def _payload(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get('/api/patients/me/qr-payload/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['payload']
+
+    def test_verify_logs_scan_and_grants_quick_access(self):
+        from audit.models import AccessLog
+        from .models import SharingPermission
+
+        payload = self._payload()
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.post('/api/patients/qr-payload/verify/', {'payload': payload}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['health_id'], self.patient.health_id)
+        self.assertEqual(response.data['blood_group'], 'B-')
+        self.assertEqual(response.data['allergies'], 'Penicillin')
+        self.assertTrue(response.data['organ_donor'])
+        self.assertTrue(AccessLog.objects.filter(
+            actor=self.doctor_user, patient=self.patient, action=AccessLog.Action.QR_SCAN
+        ).exists())
+        permission = SharingPermission.objects.get(patient=self.patient, doctor=self.doctor)
+        self.assertEqual(permission.access_type, SharingPermission.AccessType.QR_QUICK)
+        self.assertTrue(permission.is_active)
+        self.assertEqual(permission.expires_at, response.data['expires_at'])
+
+    def test_scan_does_not_downgrade_full_access(self):
+        from .models import SharingPermission
+
+        SharingPermission.objects.create(
+            patient=self.patient, doctor=self.doctor, access_type=SharingPermission.AccessType.OTP_FULL
+        )
+        payload = self._payload()
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.post('/api/patients/qr-payload/verify/', {'payload': payload}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        permission = SharingPermission.objects.get(patient=self.patient, doctor=self.doctor)
+        self.assertEqual(permission.access_type, SharingPermission.AccessType.OTP_FULL)
+        self.assertIsNone(permission.expires_at)
+
+    def test_tampered_payload_rejected(self):
+        payload = self._payload()
+        body, signature = payload.split('.')
+        forged = body[:-2] + ('AA' if body[-2:] != 'AA' else 'BB')
+        self.client.force_authenticate(user=self.doctor_user)
+        for token in ('x' + payload, f'{forged}.{signature}', body):
+            response = self.client.post('/api/patients/qr-payload/verify/', {'payload': token}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, token)
+
+    def test_expiry_is_judged_at_scan_time(self):
+        from datetime import timedelta
+        from .models import SharingPermission
+        from .quick_preview import encode_quick_preview
+
+        issued = timezone.now() - timedelta(hours=30)
+        payload = encode_quick_preview(self.patient, issued_at=issued.timestamp())
+        self.client.force_authenticate(user=self.doctor_user)
+
+        expired = self.client.post('/api/patients/qr-payload/verify/', {'payload': payload}, format='json')
+        self.assertEqual(expired.status_code, status.HTTP_400_BAD_REQUEST)
+
+        synced = self.client.post('/api/patients/qr-payload/verify/', {
+            'payload': payload, 'scanned_at': (issued + timedelta(hours=1)).isoformat()
+        }, format='json')
+        self.assertEqual(synced.status_code, status.HTTP_200_OK)
+        # The payload's window is over by the time the scan syncs, so nothing is granted
+        self.assertFalse(SharingPermission.objects.filter(patient=self.patient, doctor=self.doctor).exists())
+
+    def test_payload_verifies_offline_with_the_published_keys(self):
+        import json
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+        from django.core import signing
+
+        payload = self._payload()
+        self.client.force_authenticate(user=None)
+        response = self.client.get('/api/patients/qr-payload/keys/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        keys = {key['kid']: key for key in response.data['keys']}
+
+        # What a doctor client does with no connection: pick the key by id and check the signature
+        body, signature = payload.split('.')
+        data = json.loads(signing.b64_decode(body.encode()))
+        public_key = Ed25519PublicKey.from_public_bytes(signing.b64_decode(keys[data['k']]['x'].encode()))
+        public_key.verify(signing.b64_decode(signature.encode()), body.encode())
+        self.assertEqual(data['h'], self.patient.health_id)
+        self.assertEqual(keys[data['k']]['x'], self.public_key)
+
+    def test_rotation_switches_by_key_id(self):
+        from django.core import signing
+        from .quick_preview import encode_quick_preview, decode_quick_preview
+
+        old_payload = encode_quick_preview(self.patient)
+        new_private, _ = new_qr_signing_key()
+        with override_settings(QR_PAYLOAD_PRIVATE_KEY=new_private, QR_PAYLOAD_RETIRED_PUBLIC_KEYS=[self.public_key]):
+            self.assertEqual(decode_quick_preview(old_payload)['health_id'], self.patient.health_id)
+            new_payload = encode_quick_preview(self.patient)
+            self.assertNotEqual(new_payload.split('.')[0], old_payload.split('.')[0])
+            self.assertEqual(decode_quick_preview(new_payload)['health_id'], self.patient.health_id)
+
+            keys = self.client.get('/api/patients/qr-payload/keys/').data['keys']
+            self.assertEqual(len(keys), 2)
+            self.assertEqual(keys[1]['x'], self.public_key)
+        # Once the old key is dropped from the published set its payloads stop verifying
+        with override_settings(QR_PAYLOAD_PRIVATE_KEY=new_private):
+            with self.assertRaises(signing.BadSignature):
+                decode_quick_preview(old_payload)
+
+    def test_signing_key_command(self):
+        out = StringIO()
+        call_command('qr_signing_key', stdout=out)
+        self.assertTrue(out.getvalue().startswith('QR_PAYLOAD_PRIVATE_KEY='))
+
+        out = StringIO()
+        call_command('qr_signing_key', '--current', stdout=out)
+        self.assertIn(self.public_key, out.getvalue())
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta, date
+        from django.core.cache import cache
+        from doctors.models import Consultation, Hospital
+        from .access import clear_local_access_cache
+        from .models import OldPrescription, PatientDocument
+
+        cache.clear()
+        clear_local_access_cache()
+
+        self.client = APIClient()
+        self.patient_user = User.objects.create_user(username='tlpat', password='pw', role='PATIENT', email='tlpat@test.com')
+        self.patient = Patient.objects.get(user=self.patient_user)
+        self.doc_user = User.objects.create_user(username='tldoc', password='pw', role='DOCTOR', email='tldoc@test.com')
+        hospital = Hospital.objects.create(name='TL Hospital', address='1 Main St', registration_number='TLH1', phone='1', email='tlh@test.com')
+        self.doctor = Doctor.objects.create(user=self.doc_user, hospital=hospital, license_number='TL1', specialization='Gen', is_verified=True)
+        self.url = f'/api/patients/{self.patient.health_id}/timeline/'
+
+        now = timezone.now()
+        for days in range(4):
+            Consultation.objects.create(
+                doctor=self.doctor, patient=self.patient,
+                consultation_date=now - timedelta(days=days * 2), chief_complaint=f'Visit {days}'
+            )
+        for days in range(3):
+            OldPrescription.objects.create(
+                patient=self.patient, prescription_date=date.today() - timedelta(days=days * 2 + 1), symptoms='Cough'
+            )
+        Record.objects.create(patient=self.patient, doctor=self.doc_user, record_type='DIAGNOSIS', title='Flu')
+        PatientDocument.objects.create(patient=self.patient, document_type='INSURANCE', title='Policy', file='patient_documents/p.pdf')
+
+    def _walk(self, limit):
+        seen, url, pages = [], self.url, 0
+        while url:
+            response = self.client.get(url, {'limit': limit} if url == self.url else None)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend((e['type'], e['id'], e['timestamp']) for e in response.data['results'])
+            url = response.data['next']
+            pages += 1
+        return seen, pages
+
+    def test_owner_pages_through_everything_in_order(self):
+        from audit.models import AccessLog
+
+        self.client.force_authenticate(user=self.patient_user)
+        seen, pages = self._walk(limit=3)
+
+        self.assertEqual(len(seen), 9)
+        self.assertEqual(len(set(seen)), 9)
+        timestamps = [ts for _, _, ts in seen]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertEqual(pages, 3)
+        self.assertEqual(AccessLog.objects.filter(patient=self.patient, details__startswith='Viewed timeline').count(), 3)
+
+    def test_query_count_is_per_source(self):
+        self.client.force_authenticate(user=self.patient_user)
+        # patient and five sources, plus one access log insert (flushed at request end, with
+        # its hash-chain bookkeeping)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, {'limit': 2})
+        queries = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        reads = [sql for sql in queries if 'audit_' not in sql]
+        self.assertEqual(len(reads), 6, reads)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "audit_accesslog"') for sql in queries), 1)
+
+    def test_doctor_needs_permission(self):
+        from .models import SharingPermission
+
+        self.client.force_authenticate(user=self.doc_user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        SharingPermission.objects.create(patient=self.patient, doctor=self.doctor, access_type='QR_QUICK')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Quick preview does not cover personal documents
+        self.assertNotIn('document', {e['type'] for e in response.data['results']})
+
+    def test_bad_cursor(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get(self.url, {'before': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PdfExportTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='pdfpat', password='pw', role='PATIENT', email='pdfpat@test.com')
+        self.patient = Patient.objects.get(user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def _request(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post('/api/patients/pdf-exports/')
+        return response, callbacks
+
+    def test_export_is_queued_then_cached(self):
+        from .pdf_export import run_export
+
+        response, callbacks = self._request()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertEqual(len(callbacks), 1)
+        job_id = response.data['id']
+
+        # Same history while the job is in flight: no second job
+        again, callbacks = self._request()
+        self.assertEqual(again.data['id'], job_id)
+        self.assertEqual(len(callbacks), 0)
+
+        run_export(job_id)
+        status_response = self.client.get(f'/api/patients/pdf-exports/{job_id}/')
+        self.assertEqual(status_response.data['status'], 'DONE')
+
+        cached, callbacks = self._request()
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.data['id'], job_id)
+        self.assertEqual(len(callbacks), 0)
+
+        download = self.client.get(f'/api/patients/pdf-exports/{job_id}/download/')
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+    def test_history_change_invalidates_cache(self):
+        from .models import OldPrescription
+        from .pdf_export import run_export
+
+        response, _ = self._request()
+        run_export(response.data['id'])
+
+        OldPrescription.objects.create(patient=self.patient, prescription_date=timezone.now().date(), symptoms='Fever')
+        fresh, callbacks = self._request()
+        self.assertEqual(fresh.status_code, status.HTTP_202_ACCEPTED)
+        self.assertNotEqual(fresh.data['id'], response.data['id'])
+        self.assertEqual(len(callbacks), 1)
+
+    def test_renamed_doctor_or_test_invalidates_cache(self):
+        from doctors.models import Consultation, Hospital
+        from labs.models import LabReport, LabTechnician, LabTest
+        from .pdf_export import history_fingerprint
+
+        hospital = Hospital.objects.create(name='PDF Hospital', address='1 Main St', registration_number='PDF1', phone='1', email='pdfh@test.com')
+        doctor_user = User.objects.create_user(username='pdfdoc', password='pw', role='DOCTOR', email='pdfdoc@test.com', last_name='Old')
+        doctor = Doctor.objects.create(user=doctor_user, hospital=hospital, license_number='PDFDOC', specialization='Gen')
+        tech_user = User.objects.create_user(username='pdftech', password='pw', role='LAB_TECH', email='pdftech@test.com')
+        technician = LabTechnician.objects.create(user=tech_user, license_number='PDFLAB')
+        test_type = LabTest.objects.create(name='Old panel', code='PDF-1')
+        Consultation.objects.create(doctor=doctor, patient=self.patient, consultation_date=timezone.now(), chief_complaint='Checkup')
+        LabReport.objects.create(patient=self.patient, technician=technician, test_type=test_type, comments='Normal')
+
+        before = history_fingerprint(self.patient)
+        User.objects.filter(pk=doctor_user.pk).update(last_name='New')
+        renamed_doctor = history_fingerprint(self.patient)
+        self.assertNotEqual(renamed_doctor, before)
+        LabTest.objects.filter(pk=test_type.pk).update(name='New panel')
+        self.assertNotEqual(history_fingerprint(self.patient), renamed_doctor)
+
+    def test_legacy_download_endpoint(self):
+        from .pdf_export import run_export
+
+        with self.captureOnCommitCallbacks(execute=False):
+            pending = self.client.get('/api/patients/me/download-pdf/')
+        self.assertEqual(pending.status_code, status.HTTP_202_ACCEPTED)
+
+        run_export(pending.data['id'])
+        ready = self.client.get('/api/patients/me/download-pdf/')
+        self.assertEqual(ready.status_code, status.HTTP_200_OK)
+        self.assertEqual(ready['Content-Type'], 'application/pdf')
+
+
+class ReportDataLoaderTest(TestCase):
+    def setUp(self):
+        from doctors.models import Hospital
+        from labs.models import LabTechnician
+
+        self.user = User.objects.create_user(username='rptpat', password='pw', role='PATIENT', email='rptpat@test.com', first_name='Ria')
+        self.patient = Patient.objects.get(user=self.user)
+        hospital = Hospital.objects.create(name='RPT Hospital', address='2 Main St', registration_number='RPT1', phone='1', email='rpt@test.com')
+        self.doctors = []
+        for i in range(3):
+            doc_user = User.objects.create_user(username=f'rptdoc{i}', password='pw', role='DOCTOR', email=f'rptdoc{i}@test.com', last_name=f'Doc{i}')
+            self.doctors.append(Doctor.objects.create(user=doc_user, hospital=hospital, license_number=f'RPT{i}', specialization='Gen'))
+        tech_user = User.objects.create_user(username='rpttech', password='pw', role='LAB_TECH', email='rpttech@test.com')
+        self.technician = LabTechnician.objects.create(user=tech_user, license_number='RPTLAB')
+
+    def _add_history(self, n):
+        from datetime import timedelta
+        from doctors.models import Consultation
+        from labs.models import LabTest, LabReport
+        from .models import OldPrescription
+
+        for i in range(n):
+            test = LabTest.objects.create(name=f'Panel {i}', code=f'RPT-{self.patient.pk}-{LabTest.objects.count()}')
+            Consultation.objects.create(
+                doctor=self.doctors[i % 3], patient=self.patient,
+                consultation_date=timezone.now() - timedelta(days=i), chief_complaint='Checkup'
+            )
+            OldPrescription.objects.create(patient=self.patient, prescription_date=timezone.now().date(), symptoms='Cold')
+            LabReport.objects.create(patient=self.patient, technician=self.technician, test_type=test, comments='Normal')
+
+    def test_query_count_does_not_grow_with_history(self):
+        from utils.report_data import load_patient_report
+        from utils.pdf_generator import generate_patient_pdf
+
+        self._add_history(2)
+        with self.assertNumQueries(4):
+            small = load_patient_report(self.patient.pk)
+
+        self._add_history(30)
+        with self.assertNumQueries(4):
+            large = load_patient_report(self.patient.pk)
+        self.assertEqual(len(large.consultations), 32)
+        self.assertEqual(large.patient.full_name, 'Ria')
+        self.assertEqual(large.consultations[0].doctor_name, 'Doc0')
+        self.assertTrue(large.lab_reports[0].test_name.startswith('Panel'))
+
+        with self.assertNumQueries(0):
+            pdf = generate_patient_pdf(large).getvalue()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(len(small.prescriptions), 2)
+
+
 class RecordAPITest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -0,0 +1,191 @@
+import heapq
+from datetime import datetime, time
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from utils.pagination import encode_cursor, decode_cursor
+
+
+def _as_datetime(day):
+    """Prescriptions only carry a date; place them at local midnight on the timeline."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _file_url(request, field):
+    if not field:
+        return None
+    return request.build_absolute_uri(field.url) if request else field.url
+
+
+def _doctor_name(user):
+    if user is None:
+        return None
+    return user.get_full_name() or user.username
+
+
+class TimelineSource:
+    """
+    One table feeding the timeline.
+    `rank` breaks ties between sources that share a timestamp, so the merged order
+    (timestamp, rank, id) is total and a cursor names exactly one position in it.
+    """
+
+    def __init__(self, kind, rank, ts_field, queryset, to_entry, date_only=False, is_document=False):
+        self.kind = kind
+        self.rank = rank
+        self.ts_field = ts_field
+        self.queryset = queryset
+        self.to_entry = to_entry
+        self.date_only = date_only
+        self.is_document = is_document
+
+    def timestamp(self, obj):
+        value = getattr(obj, self.ts_field)
+        return _as_datetime(value) if self.date_only else value
+
+    def _before(self, ts, rank, pk):
+        """Q for rows that sort strictly after the cursor position (i.e. older)."""
+        field = self.ts_field
+        if self.date_only:
+            day = timezone.localtime(ts).date()
+            if _as_datetime(day) != ts:
+                # Cursor sits mid-day: that whole day is older, nothing can tie
+                return Q(**{f'{field}__lte': day})
+            older, same = Q(**{f'{field}__lt': day}), Q(**{field: day})
+        else:
+            older, same = Q(**{f'{field}__lt': ts}), Q(**{field: ts})
+
+        if self.rank < rank:
+            return older | same
+        if self.rank > rank:
+            return older
+        return older | (same & Q(pk__lt=pk))
+
+    def fetch(self, patient, limit, cursor=None):
+        """The newest `limit` rows older than the cursor, served by the (patient, ts, id) index."""
+        qs = self.queryset().filter(patient=patient)
+        if cursor is not None:
+            qs = qs.filter(self._before(*cursor))
+        return list(qs.order_by(f'-{self.ts_field}', '-pk')[:limit])
+
+
+def _consultation_entry(obj, request):
+    return {
+        'title': f"Consultation with Dr. {_doctor_name(obj.doctor.user)}",
+        'summary': obj.chief_complaint,
+        'diagnosis': obj.diagnosis,
+        'medicines': obj.medicines,
+        'follow_up_date': obj.follow_up_date,
+    }
+
+
+def _lab_report_entry(obj, request):
+    return {
+        'title': obj.test_type.name,
+        'summary': obj.comments,
+        'result_data': obj.result_data,
+        'file': _file_url(request, obj.file),
+    }
+
+
+def _medical_record_entry(obj, request):
+    return {
+        'title': obj.title,
+        'summary': obj.description,
+        'record_type': obj.record_type,
+        'author': _doctor_name(obj.doctor),
+        'file': _file_url(request, obj.file),
+    }
+
+
+def _prescription_entry(obj, request):
+    return {
+        'title': f"Prescription from {obj.doctor_name}" if obj.doctor_name else "Prescription",
+        'summary': obj.diagnosis or obj.symptoms,
+        'hospital_name': obj.hospital_name,
+        'medicines': obj.medicines,
+        'file': _file_url(request, obj.file),
+    }
+
+
+def _document_entry(obj, request):
+    return {
+        'title': obj.title,
+        'summary': obj.description,
+        'document_type': obj.document_type,
+        'file': _file_url(request, obj.file),
+    }
+
+
+def _consultations():
+    from doctors.models import Consultation
+    return Consultation.objects.select_related('doctor__user')
+
+
+def _lab_reports():
+    from labs.models import LabReport
+    return LabReport.objects.select_related('test_type')
+
+
+def _medical_records():
+    from records.models import MedicalRecord
+    return MedicalRecord.objects.select_related('doctor')
+
+
+def _prescriptions():
+    from .models import OldPrescription
+    return OldPrescription.objects.all()
+
+
+def _documents():
+    from .models import PatientDocument
+    return PatientDocument.objects.all()
+
+
+SOURCES = [
+    TimelineSource('consultation', 0, 'consultation_date', _consultations, _consultation_entry),
+    TimelineSource('lab_report', 1, 'created_at', _lab_reports, _lab_report_entry),
+    TimelineSource('medical_record', 2, 'created_at', _medical_records, _medical_record_entry),
+    TimelineSource('prescription', 3, 'prescription_date', _prescriptions, _prescription_entry, date_only=True),
+    TimelineSource('document', 4, 'uploaded_at', _documents, _document_entry, is_document=True),
+]
+
+
+def parse_timeline_cursor(cursor):
+    """Decode a `before` cursor into (timestamp, rank, pk). Raises ValueError if malformed."""
+    ts, rank, pk = decode_cursor(cursor, 3)
+    ts = parse_datetime(ts) if isinstance(ts, str) else None
+    if ts is None or not isinstance(rank, int) or not isinstance(pk, int):
+        raise ValueError("Invalid cursor")
+    return ts, rank, pk
+
+
+def build_timeline(patient, limit=20, before=None, include_documents=True, request=None):
+    """
+    Newest-first page of a patient's history across all sources.
+    Each source contributes at most limit + 1 rows from an indexed, LIMITed query and
+    the already-sorted lists are heap-merged, so a page costs one query per source
+    regardless of how long the history is. Returns (entries, next_cursor).
+    """
+    cursor = parse_timeline_cursor(before) if before else None
+    sources = [s for s in SOURCES if include_documents or not s.is_document]
+
+    streams = [
+        [(source.timestamp(obj), source.rank, obj.pk, source, obj) for obj in source.fetch(patient, limit + 1, cursor)]
+        for source in sources
+    ]
+    merged = list(heapq.merge(*streams, key=lambda item: item[:3], reverse=True))
+
+    page = merged[:limit]
+    entries = []
+    for ts, rank, pk, source, obj in page:
+        entry = {'type': source.kind, 'id': pk, 'timestamp': ts}
+        entry.update(source.to_entry(obj, request))
+        entries.append(entry)
+
+    next_cursor = None
+    if len(merged) > limit:
+        ts, rank, pk = page[-1][:3]
+        next_cursor = encode_cursor(ts.isoformat(), rank, pk)
+    return entries, next_cursor
@@ -3,7 +3,8 @@ from rest_framework.routers import SimpleRouter
 from .views import (
     PatientViewSet, EmergencyContactViewSet, PatientDocumentViewSet,
     OldPrescriptionViewSet, SharingPermissionViewSet, SharingHistoryView,
-    OTPRequestView, OTPVerifyView
+    OTPRequestView, OTPVerifyView, PatientQRCodeView, PatientImportView, PatientImportJobView,
+    QuickPreviewKeysView, QuickPreviewVerifyView, PdfExportViewSet
 )
 
 router = SimpleRouter()
@@ -11,6 +12,7 @@ router.register(r'emergency-contacts', EmergencyContactViewSet, basename='emerge
 router.register(r'documents', PatientDocumentViewSet, basename='document')
 router.register(r'prescriptions', OldPrescriptionViewSet, basename='old-prescription')
 router.register(r'sharing', SharingPermissionViewSet, basename='sharing')
+router.register(r'pdf-exports', PdfExportViewSet, basename='pdf-export')
 # Register PatientViewSet last to avoid shadowing other routes with its lookup regex
 router.register(r'', PatientViewSet, basename='patient')
 
@@ -18,5 +20,10 @@ urlpatterns = [
     path('sharing-history/', SharingHistoryView.as_view(), name='sharing-history'),
     path('otp/request/', OTPRequestView.as_view(), name='otp-request'),
     path('otp/verify/', OTPVerifyView.as_view(), name='otp-verify'),
+    path('qr-payload/keys/', QuickPreviewKeysView.as_view(), name='qr-payload-keys'),
+    path('qr-payload/verify/', QuickPreviewVerifyView.as_view(), name='qr-payload-verify'),
+    path('import/', PatientImportView.as_view(), name='patient-import'),
+    path('import/<int:pk>/', PatientImportJobView.as_view(), name='patient-import-job'),
+    path('<str:health_id>/qr.png', PatientQRCodeView.as_view(), name='patient-qr'),
     path('', include(router.urls)),
 ]
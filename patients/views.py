@@ -1,25 +1,41 @@
-from rest_framework import viewsets, permissions, decorators, status, generics
+from rest_framework import viewsets, permissions, decorators, status, generics, renderers, mixins
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from django.utils import timezone
 from .models import (
     Patient, EmergencyContact, PatientDocument, 
-    OldPrescription, SharingPermission
+    OldPrescription, SharingPermission, PdfExportJob, PatientImportJob
 )
 from .serializers import (
     PatientSerializer, PatientBasicSerializer, EmergencyContactSerializer,
     PatientDocumentSerializer, OldPrescriptionSerializer,
-    SharingPermissionSerializer, GrantAccessSerializer
+    SharingPermissionSerializer, GrantAccessSerializer, QuickPreviewVerifySerializer,
+    PdfExportJobSerializer, PatientImportJobSerializer
 )
 from role_permissions.roles import IsDoctor, IsPatient, IsPatientOwner
+from .health_id import is_valid_health_id
+from .access import doctor_access
+from .timeline import build_timeline
+from .sharing_history import sharing_history, history_filters
+from .pdf_export import request_export
+from .quick_preview import (
+    encode_quick_preview, decode_quick_preview, grant_quick_preview, public_keys, public_key_bytes,
+    QuickPreviewExpired
+)
 from audit.models import AccessLog
+from audit.writer import log_access
+from django.core import signing
+from rest_framework.utils.urls import replace_query_param
+from utils.pagination import clamp_limit
+from utils.query_optimizer import optimize_queryset, OptimizedQuerysetMixin
 
 
 from utils.notifications import send_access_granted_email, send_access_revoked_email
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     lookup_field = 'health_id'
@@ -27,12 +43,18 @@ class PatientViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         if self.action in ['create', 'destroy']:
             return [permissions.IsAdminUser()]
-        if self.action in ['update', 'partial_update']:
+        if self.action in ['update', 'partial_update', 'qr_payload']:
             return [IsPatient()]
         if self.action in ['organ_donor_requests', 'verify_organ_donor']:
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
+    def get_object(self):
+        # Malformed or mistyped IDs never reach the database
+        if not is_valid_health_id(self.kwargs.get(self.lookup_field)):
+            raise Http404
+        return super().get_object()
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         user = request.user
@@ -47,7 +69,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         
         if is_owner or is_doctor or is_lab_tech:
             # Log the successful access
-            AccessLog.objects.create(
+            log_access(
                 actor=user,
                 patient=instance,
                 action=action_type,
@@ -68,7 +90,7 @@ class PatientViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         else:
             # Log denied access
-            AccessLog.objects.create(
+            log_access(
                 actor=user,
                 patient=instance,
                 action=action_type,
@@ -82,42 +104,87 @@ class PatientViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(patient)
         return Response(serializer.data)
 
-    @decorators.action(detail=False, methods=['get'], url_path='me/download-pdf')
-    def download_pdf(self, request):
-        """Generate and return a PDF of the patient's medical history."""
-        patient = get_object_or_404(Patient, user=request.user)
-        
-        # Gather Data
-        from records.models import Consultation
-        from labs.models import LabReport
-        from utils.pdf_generator import generate_patient_pdf
-        from django.http import FileResponse
-        
-        records = Consultation.objects.filter(patient=patient).order_by('-created_at')
-        prescriptions = OldPrescription.objects.filter(patient=patient).order_by('-prescription_date')
-        lab_reports = LabReport.objects.filter(patient=patient).order_by('-created_at')
-        
-        # Generate PDF
-        pdf_buffer = generate_patient_pdf(patient, records, prescriptions, lab_reports)
-        
-        # Log Access
-        AccessLog.objects.create(
-            actor=request.user,
+    @swagger_auto_schema(
+        operation_description="Unified, newest-first medical history across consultations, lab reports, records, prescriptions and documents.",
+        manual_parameters=[
+            openapi.Parameter('before', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Cursor from a previous page'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Entries per page (max 100)'),
+        ]
+    )
+    @decorators.action(detail=True, methods=['get'])
+    def timeline(self, request, health_id=None):
+        patient = self.get_object()
+        user = request.user
+        include_documents = True
+
+        if patient.user_id != user.id and not user.is_staff:
+            access = doctor_access(user, patient)
+            if not access.can_view_records:
+                log_access(
+                    actor=user,
+                    patient=patient,
+                    action=AccessLog.Action.VIEW_RECORDS,
+                    details=f"Timeline access denied for {patient.health_id}"
+                )
+                return Response({"detail": "Not authorized."}, status=status.HTTP_403_FORBIDDEN)
+            include_documents = access.can_view_documents
+
+        try:
+            entries, next_cursor = build_timeline(
+                patient,
+                limit=clamp_limit(request.query_params.get('limit')),
+                before=request.query_params.get('before'),
+                include_documents=include_documents,
+                request=request,
+            )
+        except ValueError:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        log_access(
+            actor=user,
             patient=patient,
-            action=AccessLog.Action.VIEW_PROFILE,
-            details="Downloaded medical history PDF"
-        )
-        
-        return FileResponse(
-            pdf_buffer, 
-            as_attachment=True, 
-            filename=f"Medical_Report_{patient.health_id}.pdf"
+            action=AccessLog.Action.VIEW_RECORDS,
+            details=f"Viewed timeline of {patient.health_id} ({len(entries)} entries)"
         )
+        return Response({
+            'results': entries,
+            'next_cursor': next_cursor,
+            'next': replace_query_param(request.build_absolute_uri(), 'before', next_cursor) if next_cursor else None,
+        })
+
+    @decorators.action(detail=False, methods=['get'], url_path='me/qr-payload')
+    def qr_payload(self, request):
+        """
+        Signed quick-preview payload for the patient's QR code. Doctor clients can verify it
+        offline for 24 hours against the public keys from /qr-payload/keys/.
+        """
+        patient = get_object_or_404(Patient, user=request.user)
+        issued_at = timezone.now().replace(microsecond=0)
+        token = encode_quick_preview(patient, issued_at=issued_at.timestamp())
+        return Response({
+            'payload': token,
+            'issued_at': issued_at,
+            'expires_at': issued_at + SharingPermission.QUICK_PREVIEW_TTL,
+        })
+
+    @decorators.action(detail=False, methods=['get'], url_path='me/download-pdf')
+    def download_pdf(self, request):
+        """
+        Return the patient's medical history PDF if an export of the current history is ready;
+        otherwise queue one and answer 202 with the job to poll (see /pdf-exports/).
+        """
+        patient = get_object_or_404(Patient.objects.select_related('user'), user=request.user)
+        job, _ = request_export(patient, request.user)
+        if job.status != PdfExportJob.Status.DONE:
+            return Response(PdfExportJobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+        return serve_pdf_export(request, job)
 
     @decorators.action(detail=False, methods=['get'], url_path='organ-donor-requests')
     def organ_donor_requests(self, request):
         """List patients who are organ donors but not yet verified."""
-        patients = Patient.objects.filter(organ_donor=True, is_organ_donor_verified=False)
+        patients = optimize_queryset(
+            Patient.objects.filter(organ_donor=True, is_organ_donor_verified=False), self.get_serializer()
+        )
         serializer = self.get_serializer(patients, many=True)
         return Response(serializer.data)
 
@@ -142,7 +209,52 @@ class PatientViewSet(viewsets.ModelViewSet):
         return Response({'detail': 'Invalid verification status.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class EmergencyContactViewSet(viewsets.ModelViewSet):
+def serve_pdf_export(request, job):
+    from django.http import FileResponse
+
+    log_access(
+        actor=request.user,
+        patient=job.patient,
+        action=AccessLog.Action.VIEW_PROFILE,
+        details="Downloaded medical history PDF"
+    )
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=f"Medical_Report_{job.patient.health_id}.pdf"
+    )
+
+
+class PdfExportViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                       mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Medical-history PDF exports. POST queues a job (or returns the cached export of an
+    unchanged history), GET polls it, and /download/ streams the finished file.
+    """
+    serializer_class = PdfExportJobSerializer
+    permission_classes = [IsPatient]
+
+    def get_queryset(self):
+        return PdfExportJob.objects.filter(patient__user=self.request.user).select_related('patient')
+
+    def create(self, request, *args, **kwargs):
+        patient = get_object_or_404(Patient.objects.select_related('user'), user=request.user)
+        job, _ = request_export(patient, request.user)
+        ready = job.status == PdfExportJob.Status.DONE
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_200_OK if ready else status.HTTP_202_ACCEPTED
+        )
+
+    @decorators.action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != PdfExportJob.Status.DONE or not job.file:
+            return Response(self.get_serializer(job).data, status=status.HTTP_409_CONFLICT)
+        return serve_pdf_export(request, job)
+
+
+class EmergencyContactViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for patient's emergency contacts."""
     serializer_class = EmergencyContactSerializer
     permission_classes = [IsPatient]
@@ -156,7 +268,7 @@ class EmergencyContactViewSet(viewsets.ModelViewSet):
         serializer.save(patient=patient)
 
 
-class PatientDocumentViewSet(viewsets.ModelViewSet):
+class PatientDocumentViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for patient documents."""
     serializer_class = PatientDocumentSerializer
     permission_classes = [IsPatient]
@@ -170,7 +282,7 @@ class PatientDocumentViewSet(viewsets.ModelViewSet):
         serializer.save(patient=patient, uploaded_by=self.request.user)
         
         # Log the action
-        AccessLog.objects.create(
+        log_access(
             actor=self.request.user,
             patient=patient,
             action=AccessLog.Action.UPLOAD_DOCUMENT,
@@ -178,7 +290,7 @@ class PatientDocumentViewSet(viewsets.ModelViewSet):
         )
 
 
-class OldPrescriptionViewSet(viewsets.ModelViewSet):
+class OldPrescriptionViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for old prescriptions."""
     serializer_class = OldPrescriptionSerializer
     permission_classes = [IsPatient]
@@ -192,7 +304,7 @@ class OldPrescriptionViewSet(viewsets.ModelViewSet):
         serializer.save(patient=patient, uploaded_by=self.request.user)
         
         # Log the action
-        AccessLog.objects.create(
+        log_access(
             actor=self.request.user,
             patient=patient,
             action=AccessLog.Action.UPLOAD_DOCUMENT,
@@ -200,7 +312,7 @@ class OldPrescriptionViewSet(viewsets.ModelViewSet):
         )
 
 
-class SharingPermissionViewSet(viewsets.ModelViewSet):
+class SharingPermissionViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for managing sharing permissions."""
     serializer_class = SharingPermissionSerializer
     permission_classes = [IsPatient]
@@ -228,11 +340,12 @@ class SharingPermissionViewSet(viewsets.ModelViewSet):
         )
         
         # Log the action
-        AccessLog.objects.create(
+        log_access(
             actor=request.user,
             patient=patient,
             action=AccessLog.Action.GRANT_ACCESS,
-            details=f"Granted {permission.access_type} access to Dr. {doctor.user.username}"
+            details=f"Granted {permission.access_type} access to Dr. {doctor.user.username}",
+            sync=True
         )
 
         # Send Email Notification
@@ -252,11 +365,12 @@ class SharingPermissionViewSet(viewsets.ModelViewSet):
         permission.revoke()
         
         # Log the action
-        AccessLog.objects.create(
+        log_access(
             actor=request.user,
             patient=patient,
             action=AccessLog.Action.REVOKE_ACCESS,
-            details=f"Revoked access from Dr. {permission.doctor.user.username}"
+            details=f"Revoked access from Dr. {permission.doctor.user.username}",
+            sync=True
         )
 
         # Send Email Notification
@@ -266,30 +380,196 @@ class SharingPermissionViewSet(viewsets.ModelViewSet):
 
 
 class SharingHistoryView(generics.ListAPIView):
-    """View for patient to see their access history."""
+    """
+    View for patient to see their access history, newest first.
+    Paged with an opaque `before` cursor; filter with `action`, `actor_role`, `since` and `until`.
+    """
     permission_classes = [IsPatient]
     
     def get(self, request):
         patient = get_object_or_404(Patient, user=request.user)
-        logs = AccessLog.objects.filter(patient=patient).order_by('-timestamp')[:50]
+        try:
+            entries, next_cursor = sharing_history(
+                patient,
+                limit=clamp_limit(request.query_params.get('limit'), default=50),
+                before=request.query_params.get('before'),
+                filters=history_filters(request.query_params),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        data = [
+        return Response({
+            'results': entries,
+            'next_cursor': next_cursor,
+            'next': replace_query_param(request.build_absolute_uri(), 'before', next_cursor) if next_cursor else None,
+        })
+
+
+from rest_framework.views import APIView
+from django.conf import settings
+from .otp import get_otp_sender, get_otp_store, OTP_OK, OTP_EXPIRED, OTP_LOCKED
+from utils.ratelimit import take_token
+from .qr import render_qr_image, qr_image_etag, clamp_qr_size
+from doctors.models import Doctor
+import math
+
+class PatientImportView(APIView):
+    """
+    Bulk import patients from an uploaded CSV or NDJSON file (admins only).
+    The file is queued as a background job; poll /import/<id>/ for its report.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Bulk import patients. Upload `file` (CSV or NDJSON); answers 202 with the job to poll.",
+        responses={202: 'Queued import job', 400: 'Bad Request'}
+    )
+    def post(self, request):
+        from .importer import detect_format, queue_import
+
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"error": "A CSV or NDJSON file is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or detect_format(upload.name)
+        if fmt not in ('csv', 'ndjson'):
+            return Response({"error": "format must be csv or ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = queue_import(upload, fmt, request.user)
+        return Response(PatientImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class PatientImportJobView(generics.RetrieveAPIView):
+    """Status and per-row error report of a bulk patient import (admins only)."""
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = PatientImportJobSerializer
+    queryset = PatientImportJob.objects.all()
+
+
+class ImageRenderer(renderers.BaseRenderer):
+    """Pass-through renderer for views that return raw image bytes."""
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Error payloads (dicts) have no image representation
+        return data if isinstance(data, bytes) else b''
+
+
+class PNGRenderer(ImageRenderer):
+    media_type = 'image/png'
+    format = 'png'
+
+
+class SVGRenderer(ImageRenderer):
+    media_type = 'image/svg+xml'
+    format = 'svg'
+
+
+class PatientQRCodeView(APIView):
+    """
+    Render a patient's QR code on demand: /api/patients/<health_id>/qr.png?size=300&format=svg|png.
+    The image only encodes the public profile URL, so it is served without authentication
+    (<img> tags cannot send a bearer token). Every well-formed Health ID gets an image
+    without a database lookup, so the endpoint cannot be used to probe which IDs exist.
+    Caching is ETag-validated; the ETag covers PUBLIC_BASE_URL, so a domain change is
+    picked up once QR_IMAGE_MAX_AGE runs out.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_classes = []
+    renderer_classes = [PNGRenderer, SVGRenderer]
+
+    def get(self, request, health_id):
+        if not is_valid_health_id(health_id):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        fmt = request.accepted_renderer.format
+        size = clamp_qr_size(request.query_params.get('size'))
+        etag = qr_image_etag(health_id, size, fmt)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': f"public, max-age={settings.QR_IMAGE_MAX_AGE}",
+            'Vary': 'Accept',
+        }
+
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        return Response(render_qr_image(health_id, size, fmt), headers=headers)
+
+
+class QuickPreviewKeysView(APIView):
+    """
+    Public keys that QR quick-preview payloads are signed with, as a JSON Web Key Set.
+    Clients cache it and verify scans offline with the key whose `kid` matches the payload's
+    `k`; the current key comes first, followed by retired keys still within their window.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Ed25519 public keys for verifying QR quick-preview payloads offline.",
+        responses={200: 'JSON Web Key Set'}
+    )
+    def get(self, request):
+        keys = [
             {
-                'actor': log.actor.username if log.actor else 'Unknown',
-                'action': log.get_action_display(),
-                'details': log.details,
-                'timestamp': log.timestamp
+                'kty': 'OKP',
+                'crv': 'Ed25519',
+                'alg': 'EdDSA',
+                'use': 'sig',
+                'kid': kid,
+                'x': signing.b64_encode(public_key_bytes(key)).decode(),
             }
-            for log in logs
+            for kid, key in public_keys().items()
         ]
-        
-        return Response(data)
+        return Response({
+            'keys': keys,
+            'payload_ttl_seconds': int(SharingPermission.QUICK_PREVIEW_TTL.total_seconds()),
+        })
 
 
-from rest_framework.views import APIView
-from .models import OTPRequest
-from doctors.models import Doctor
-import random
+class QuickPreviewVerifyView(APIView):
+    """
+    Verify a scanned QR quick-preview payload, record the access and grant the doctor
+    QR_QUICK access for the rest of the payload's window.
+    Doctor clients can show the preview straight from the signed payload and post
+    it here later with `scanned_at`; the access log and grant are written when it syncs.
+    """
+    permission_classes = [IsDoctor]
+
+    @swagger_auto_schema(
+        operation_description="Verify a signed QR quick-preview payload and log the scan.",
+        request_body=QuickPreviewVerifySerializer,
+        responses={200: 'Verified preview', 400: 'Invalid or expired payload', 404: 'Patient not found'}
+    )
+    def post(self, request):
+        serializer = QuickPreviewVerifySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        scanned_at = serializer.validated_data.get('scanned_at')
+
+        try:
+            preview = decode_quick_preview(serializer.validated_data['payload'], at=scanned_at)
+        except QuickPreviewExpired:
+            return Response({"error": "QR code has expired"}, status=status.HTTP_400_BAD_REQUEST)
+        except signing.BadSignature:
+            return Response({"error": "Invalid QR code"}, status=status.HTTP_400_BAD_REQUEST)
+
+        patient = get_object_or_404(Patient, health_id=preview['health_id'])
+        doctor = get_object_or_404(Doctor, user=request.user)
+        grant_quick_preview(patient, doctor, preview['expires_at'])
+
+        details = f"QR quick preview of {patient.health_id}"
+        if scanned_at:
+            details += f" (scanned {scanned_at.isoformat()})"
+        log_access(
+            actor=request.user,
+            patient=patient,
+            action=AccessLog.Action.QR_SCAN,
+            details=details
+        )
+        return Response(preview)
+
 
 class OTPRequestView(APIView):
     """Generate and send OTP to patient."""
@@ -304,35 +584,34 @@ class OTPRequestView(APIView):
             },
             required=['health_id']
         ),
-        responses={200: 'OTP sent successfully', 400: 'Bad Request'}
+        responses={200: 'OTP sent successfully', 400: 'Bad Request', 429: 'Too many OTP requests'}
     )
     def post(self, request):
         health_id = request.data.get('health_id')
         if not health_id:
             return Response({"error": "Health ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not is_valid_health_id(health_id):
+            raise Http404
 
         patient = get_object_or_404(Patient, health_id=health_id)
         doctor = get_object_or_404(Doctor, user=request.user)
 
-        # Generate 6-digit OTP
-        otp_code = str(random.randint(100000, 999999))
-        
-        # Save OTP
-        OTPRequest.objects.create(
-            doctor=doctor,
-            patient=patient,
-            otp_code=otp_code
-        )
+        # Rate limit per doctor (flooding many patients) and per patient (being flooded)
+        for key, rate in ((f"otp:doctor:{doctor.pk}", settings.OTP_DOCTOR_RATE),
+                          (f"otp:patient:{patient.pk}", settings.OTP_PATIENT_RATE)):
+            allowed, retry_after = take_token(key, rate)
+            if not allowed:
+                return Response(
+                    {"error": "Too many OTP requests. Try again later."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(math.ceil(retry_after))}
+                )
 
-        # In production, send via SMS/Email
-        print(f"==========================================")
-        print(f"OTP for {patient.health_id}: {otp_code}")
-        print(f"==========================================")
+        # Generate a 6-digit OTP, replacing any outstanding one for this doctor and patient
+        otp_code = get_otp_store().issue(doctor.pk, patient.pk)
+        get_otp_sender().send(patient, doctor, otp_code)
 
-        return Response({
-            "message": "OTP sent successfully to patient's registered contact.",
-            "dev_note": "Check console for OTP code"
-        })
+        return Response({"message": "OTP sent successfully to patient's registered contact."})
 
 
 class OTPVerifyView(APIView):
@@ -357,33 +636,23 @@ class OTPVerifyView(APIView):
 
         if not health_id or not otp_code:
             return Response({"error": "Health ID and OTP are required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not is_valid_health_id(health_id):
+            raise Http404
 
         patient = get_object_or_404(Patient, health_id=health_id)
         doctor = get_object_or_404(Doctor, user=request.user)
 
-        # Find valid OTP
-        otp_request = None
-        if otp_code == '12345':
-            # DEV BACKDOOR
-            pass
-        else:
-            otp_request = OTPRequest.objects.filter(
-                doctor=doctor,
-                patient=patient,
-                otp_code=otp_code,
-                is_verified=False
-            ).order_by('-created_at').first()
-
-            if not otp_request:
-                return Response({"error": "Invalid OTP"}, status=status.HTTP_400_BAD_REQUEST)
-
-            if otp_request.is_expired:
-                return Response({"error": "OTP has expired"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Mark OTP as verified if it exists
-        if otp_request:
-            otp_request.is_verified = True
-            otp_request.save()
+        # Check and consume the OTP
+        result = get_otp_store().verify(doctor.pk, patient.pk, otp_code)
+        if result == OTP_EXPIRED:
+            return Response({"error": "OTP has expired"}, status=status.HTTP_400_BAD_REQUEST)
+        if result == OTP_LOCKED:
+            return Response(
+                {"error": "Too many incorrect attempts. Request a new OTP."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        if result != OTP_OK:
+            return Response({"error": "Invalid OTP"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Grant Full Access
         permission, created = SharingPermission.objects.get_or_create(
@@ -400,11 +669,12 @@ class OTPVerifyView(APIView):
             permission.save()
 
         # Log Access
-        AccessLog.objects.create(
+        log_access(
             actor=request.user,
             patient=patient,
             action=AccessLog.Action.GRANT_ACCESS,
-            details=f"OTP Verified. Full Access Granted to Dr. {doctor.user.username}"
+            details=f"OTP Verified. Full Access Granted to Dr. {doctor.user.username}",
+            sync=True
         )
 
         # Send Email Notification
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_timeline_indexes'),
+        ('records', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', '-created_at', '-id'], name='record_patient_date_idx'),
+        ),
+    ]
@@ -26,3 +26,8 @@ class MedicalRecord(models.Model):
 
     def __str__(self):
         return f"{self.record_type} for {self.patient.health_id} by {self.doctor}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', '-created_at', '-id'], name='record_patient_date_idx'),
+        ]
@@ -4,10 +4,13 @@ from .models import MedicalRecord
 from .serializers import MedicalRecordSerializer
 from role_permissions.roles import IsDoctor, IsLabTech, IsPatient, IsPatientOwner
 from audit.models import AccessLog
+from audit.writer import log_access
 from patients.models import Patient
+from patients.access import doctor_access
 from django.shortcuts import get_object_or_404
+from utils.query_optimizer import OptimizedQuerysetMixin
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+class MedicalRecordViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = MedicalRecordSerializer
 
     def get_queryset(self):
@@ -20,6 +23,11 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         # Doctors/Labs can view records if they filter by patient
         patient_id = self.request.query_params.get('patient')
         if patient_id:
+            if user.role == 'DOCTOR':
+                patient = Patient.objects.filter(health_id=patient_id).only('pk').first()
+                # Doctors need an active sharing permission that covers records
+                if patient is None or not doctor_access(user, patient).can_view_records:
+                    return queryset.none()
             return queryset.filter(patient__health_id=patient_id)
         
         # If Doctor/Lab requests all without filter, maybe return none or ones they created?
@@ -38,7 +46,7 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         record = serializer.save(doctor=self.request.user)
         
-        AccessLog.objects.create(
+        log_access(
             actor=self.request.user,
             patient=record.patient,
             action=AccessLog.Action.UPLOAD_RECORD,
@@ -56,7 +64,7 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             # We should probably check if patient exists to log it correctly.
             try:
                 p = Patient.objects.get(health_id=patient_id)
-                AccessLog.objects.create(
+                log_access(
                     actor=request.user,
                     patient=p,
                     action=AccessLog.Action.VIEW_RECORDS,
@@ -4,8 +4,9 @@ from rest_framework.response import Response
 from django.utils import timezone
 from .models import SupportTicket
 from .serializers import SupportTicketSerializer
+from utils.query_optimizer import OptimizedQuerysetMixin
 
-class SupportTicketViewSet(viewsets.ModelViewSet):
+class SupportTicketViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = SupportTicket.objects.all()
     serializer_class = SupportTicketSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -0,0 +1,41 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers=2):
+    """Return the process-wide thread pool registered under `name`, creating it on first use."""
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"bg-{name}")
+            _executors[name] = executor
+        return executor
+
+
+def _run_task(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(fn, '__name__', fn))
+        raise
+    finally:
+        # Worker threads open their own DB connections; don't leak them between tasks.
+        connections.close_all()
+
+
+def submit(name, fn, *args, max_workers=2, **kwargs):
+    """Run `fn` on the named background pool and return its Future."""
+    executor = get_executor(name, max_workers)
+    return executor.submit(_run_task, fn, args, kwargs)
+
+
+def submit_on_commit(name, fn, *args, max_workers=2, **kwargs):
+    """Schedule `fn` on the named pool once the current transaction commits."""
+    transaction.on_commit(lambda: submit(name, fn, *args, max_workers=max_workers, **kwargs))
@@ -0,0 +1,116 @@
+import copy
+
+from django.db import models, router
+from django.db.models.signals import post_save, pre_save
+
+
+class DirtyFieldsMixin:
+    """
+    Model mixin that snapshots column values when an instance is loaded from the
+    database, so "did this field change?" checks happen in memory and save()
+    writes only the columns that actually changed (plus auto_now timestamps).
+
+    Mix in before models.Model: `class Patient(DirtyFieldsMixin, models.Model)`.
+    Passing update_fields explicitly to save() bypasses the automatic behaviour.
+
+    Saving an unchanged instance runs no query but still sends pre_save and post_save
+    (with update_fields=frozenset()), so signal handlers see every save() call as before.
+    File fields are compared by stored name, so replacing a file in place marks them dirty.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_loaded_values()
+        return instance
+
+    def _snapshot_loaded_values(self, attnames=None):
+        if attnames is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue  # deferred
+            if attnames is not None and field.attname not in attnames:
+                continue
+            self._loaded_values[field.attname] = _comparable(self.__dict__[field.attname], copy_mutable=True)
+
+    def get_initial_value(self, field_name):
+        """Value `field_name` had when the instance was loaded (or last saved)."""
+        attname = self._meta.get_field(field_name).attname
+        loaded = getattr(self, '_loaded_values', {})
+        if attname in loaded:
+            return loaded[attname]
+        if self._state.adding or self.pk is None:
+            return None
+        # Not loaded (constructed by hand or deferred): fall back to the stored value
+        return (
+            type(self)._base_manager.using(self._state.db)
+            .filter(pk=self.pk).values_list(attname, flat=True).first()
+        )
+
+    def has_changed(self, field_name):
+        attname = self._meta.get_field(field_name).attname
+        return self.get_initial_value(field_name) != _comparable(getattr(self, attname))
+
+    def get_dirty_fields(self):
+        """Names of loaded concrete fields whose value differs from the snapshot."""
+        loaded = getattr(self, '_loaded_values', None)
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if loaded is None or field.attname not in loaded:
+                dirty.append(field.name)
+            elif loaded[field.attname] != _comparable(self.__dict__[field.attname]):
+                dirty.append(field.name)
+        return dirty
+
+    def save(self, *args, **kwargs):
+        partial = (
+            hasattr(self, '_loaded_values')
+            and not self._state.adding
+            and not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        )
+        if partial:
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                self._save_unchanged(kwargs.get('using'))
+                return
+            dirty += [
+                f.name for f in self._meta.concrete_fields
+                if getattr(f, 'auto_now', False) and f.name not in dirty
+            ]
+            kwargs['update_fields'] = dirty
+
+        super().save(*args, **kwargs)
+        self._snapshot_loaded_values()
+
+    def _save_unchanged(self, using=None):
+        # Model.save(update_fields=[]) returns before sending any signal; nothing needs
+        # writing, but handlers (counters, access invalidation) still expect the save.
+        using = using or router.db_for_write(self.__class__, instance=self)
+        update_fields = frozenset()
+        pre_save.send(sender=self.__class__, instance=self, raw=False, using=using, update_fields=update_fields)
+        post_save.send(
+            sender=self.__class__, instance=self, created=False, update_fields=update_fields, raw=False, using=using
+        )
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        fields = kwargs.get('fields')
+        attnames = None
+        if fields is not None:
+            attnames = {self._meta.get_field(name).attname for name in fields}
+        self._snapshot_loaded_values(attnames)
+
+
+def _comparable(value, copy_mutable=False):
+    # A FieldFile is changed in place by .save()/.delete(); its stored name is what counts
+    if isinstance(value, models.fields.files.FieldFile):
+        return value.name
+    # JSON values are mutated in place; keep our own copy to compare against
+    if copy_mutable and isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
@@ -0,0 +1,374 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import Resolver404, resolve
+from django.utils.crypto import constant_time_compare
+
+from .query_inspector import QueryRecorder
+
+# Counters, gauges and histograms served in the Prometheus text format from /metrics.
+#
+# Each process keeps its values in memory. With several worker processes (gunicorn) set
+# METRICS_DIR to a directory the workers share: every process then writes its values to
+# <pid>.json there at most every METRICS_FLUSH_INTERVAL seconds, and whichever worker
+# serves /metrics adds up all the files. The counters and histograms of exited workers are
+# folded into aggregate.json and their files deleted, so totals never go backwards while
+# the directory lives and it does not grow as workers are recycled; a process that finds a
+# file under its own (reused) pid folds it in before writing its own. Gauges only count
+# live processes. Empty the directory when the server starts.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AGGREGATE_FILE = 'aggregate.json'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._dirty = False
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def changed(self):
+        self._dirty = True
+        if settings.METRICS_DIR and self._flusher_pid != os.getpid():
+            # First change in this process (or in a forked child): start its flusher
+            with self._lock:
+                if self._flusher_pid != os.getpid():
+                    self._flusher_pid = os.getpid()
+                    with self._locked(settings.METRICS_DIR) as directory:
+                        if os.path.exists(os.path.join(directory, f"{os.getpid()}.json")):
+                            self._fold(directory, [f"{os.getpid()}.json"])
+                    threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def snapshot(self):
+        return {name: metric.samples() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        """Write this process's values to METRICS_DIR, atomically."""
+        directory = settings.METRICS_DIR
+        if not directory or not self._dirty:
+            return
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+        _write_json(os.path.join(directory, f"{os.getpid()}.json"), self.snapshot())
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    @contextmanager
+    def _locked(self, directory):
+        """
+        Holds METRICS_DIR's lock file, so only one process at a time folds files into the
+        aggregate. METRICS_DIR is for multi-process servers (gunicorn), which are POSIX only,
+        so fcntl is imported here rather than at the top: the module loads on Windows too.
+        """
+        import fcntl
+
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield directory
+
+    def _fold(self, directory, filenames):
+        """Add the counters and histograms of exited processes to the aggregate file, then delete their files."""
+        aggregate = {
+            name: {tuple(labels): value for labels, value in samples}
+            for name, samples in (_read_json(os.path.join(directory, AGGREGATE_FILE)) or {}).items()
+        }
+        for filename in filenames:
+            for name, samples in (_read_json(os.path.join(directory, filename)) or {}).items():
+                metric = self.metrics.get(name)
+                if metric is None or metric.type == 'gauge':
+                    continue
+                totals = aggregate.setdefault(name, {})
+                for labels, value in samples:
+                    totals[tuple(labels)] = metric.merge(totals.get(tuple(labels)), value)
+        _write_json(
+            os.path.join(directory, AGGREGATE_FILE),
+            {name: [[list(key), value] for key, value in totals.items()] for name, totals in aggregate.items()},
+        )
+        for filename in filenames:
+            os.remove(os.path.join(directory, filename))
+
+    def _other_processes(self, directory):
+        """[(alive, snapshot)] of the other live processes, then the aggregate of the exited ones."""
+        snapshots, exited = [], []
+        for filename in os.listdir(directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != '.json' or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            if not _pid_alive(int(pid)):
+                exited.append(filename)
+                continue
+            snapshot = _read_json(os.path.join(directory, filename))
+            if snapshot is not None:
+                snapshots.append((True, snapshot))
+        if exited:
+            self._fold(directory, exited)
+        aggregate = _read_json(os.path.join(directory, AGGREGATE_FILE))
+        if aggregate is not None:
+            snapshots.append((False, aggregate))
+        return snapshots
+
+    def collect(self):
+        """{name: {label values: value}} summed over this process and, with METRICS_DIR, all others."""
+        others = []
+        if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+            with self._locked(settings.METRICS_DIR) as directory:
+                others = self._other_processes(directory)
+        merged = {name: {} for name in self.metrics}
+        for alive, snapshot in [(True, self.snapshot()), *others]:
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                for labels, value in samples:
+                    key = tuple(labels)
+                    merged[name][key] = metric.merge(merged[name].get(key), value)
+        return merged
+
+    def expose(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key in sorted(values):
+                lines.extend(metric.expose(key, values[key]))
+        return '\n'.join(lines) + '\n'
+
+
+def _read_json(path):
+    try:
+        with open(path) as fileobj:
+            return json.load(fileobj)
+    except (OSError, ValueError):
+        return None  # Gone already, or not ours to read
+
+
+def _write_json(path, data):
+    """Write through a temporary file, so readers see the old or the new contents, never half."""
+    with open(f"{path}.tmp", 'w') as out:
+        json.dump(data, out)
+    os.replace(f"{path}.tmp", path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = [*zip(self.labelnames, key), *extra]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, total, value):
+        return value if total is None else total + value
+
+    def expose(self, key, value):
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.changed()
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        self.registry.changed()
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """Values are [per-bucket counts (the last one is +Inf), sum]; exposed cumulatively."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = [counts, total + value]
+        self.registry.changed()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def merge(self, total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def expose(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, math.inf), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._labels(key, [('le', _format_value(float(bound)))])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(float(total))}")
+        lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+# --- What the application records ----------------------------------------------------------
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by URL name, method and status code', ['view', 'method', 'status'])
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by URL name', ['view', 'method'])
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being served, by URL name', ['view'])
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per HTTP request, by URL name', ['view'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+EMAILS = Counter('notification_emails_total', 'Notification emails by kind and outcome', ['kind', 'outcome'])
+PDF_RENDER = Histogram('pdf_render_seconds', 'Time to render a medical-history PDF', buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+QR_RENDER = Histogram('qr_render_seconds', 'Time to render a QR code image, by format', ['format'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+
+def view_name(request):
+    """The resolved URL name ('patient-detail', 'admin:index'), the route if unnamed, else 'unmatched'."""
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status code, in-flight count and database queries of every request,
+    labeled by resolved URL name. Goes first in MIDDLEWARE so the latency covers the rest.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        view = view_name(request)
+        queries = QueryRecorder()
+        status = 500
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(view=view)
+        try:
+            with queries.record():
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            HTTP_IN_FLIGHT.dec(view=view)
+            HTTP_LATENCY.observe(time.perf_counter() - started, view=view, method=request.method)
+            HTTP_REQUESTS.inc(view=view, method=request.method, status=status)
+            DB_QUERIES.observe(queries.count, view=view)
+
+
+def metrics_view(request):
+    """
+    All metrics in the Prometheus text exposition format. Needs METRICS_TOKEN as a bearer
+    token; without one it is only served while DEBUG is on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
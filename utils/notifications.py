@@ -2,16 +2,26 @@ from django.core.mail import send_mail
 from django.conf import settings
 import threading
 
-def send_email_async(subject, message, recipient_list):
+from utils.metrics import EMAILS
+
+def _deliver(subject, message, recipient_list, kind):
+    try:
+        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list, fail_silently=False)
+    except Exception:
+        EMAILS.inc(kind=kind, outcome='failed')
+        raise
+    EMAILS.inc(kind=kind, outcome='sent')
+
+def send_email_async(subject, message, recipient_list, kind='other'):
     """Send email in a separate thread to avoid blocking the main request."""
     try:
         email_thread = threading.Thread(
-            target=send_mail,
-            args=(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list),
-            kwargs={'fail_silently': False}
+            target=_deliver,
+            args=(subject, message, recipient_list, kind),
         )
         email_thread.start()
     except Exception as e:
+        EMAILS.inc(kind=kind, outcome='failed')
         print(f"Error sending email: {e}")
 
 def send_access_granted_email(patient, doctor, access_type):
@@ -31,7 +41,25 @@ def send_access_granted_email(patient, doctor, access_type):
     QR Health System
     """
     if patient.user.email:
-        send_email_async(subject, message, [patient.user.email])
+        send_email_async(subject, message, [patient.user.email], kind='access_granted')
+
+def send_otp_email(patient, doctor, code):
+    """Send the patient the one-time code a doctor requested to access their records."""
+    subject = "Your QR Health access code"
+    message = f"""
+    Hello {patient.user.get_full_name() or patient.user.username},
+
+    Dr. {doctor.user.get_full_name() or doctor.user.username} has requested full access to your health records.
+    
+    Your one-time code is: {code}
+    
+    Share it with the doctor only if you want to grant access. It expires in 10 minutes.
+    
+    Regards,
+    QR Health System
+    """
+    if patient.user.email:
+        send_email_async(subject, message, [patient.user.email], kind='otp')
 
 def send_access_revoked_email(patient, doctor):
     """Notify doctor that their access has been revoked."""
@@ -47,7 +75,7 @@ def send_access_revoked_email(patient, doctor):
     QR Health System
     """
     if doctor.user.email:
-        send_email_async(subject, message, [doctor.user.email])
+        send_email_async(subject, message, [doctor.user.email], kind='access_revoked')
 
 def send_record_uploaded_email(patient, record_type, doctor_name):
     """Notify patient that a new record has been added."""
@@ -63,7 +91,7 @@ def send_record_uploaded_email(patient, record_type, doctor_name):
     QR Health System
     """
     if patient.user.email:
-        send_email_async(subject, message, [patient.user.email])
+        send_email_async(subject, message, [patient.user.email], kind='record_uploaded')
 
 def send_lab_report_notification(patient, report):
     """Notify patient that a lab report has been uploaded."""
@@ -79,7 +107,7 @@ def send_lab_report_notification(patient, report):
     QR Health System
     """
     if patient.user.email:
-        send_email_async(subject, message, [patient.user.email])
+        send_email_async(subject, message, [patient.user.email], kind='lab_report')
 
 def send_consultation_notification(patient, consultation):
     """Notify patient that a consultation record has been added."""
@@ -95,7 +123,7 @@ def send_consultation_notification(patient, consultation):
     QR Health System
     """
     if patient.user.email:
-        send_email_async(subject, message, [patient.user.email])
+        send_email_async(subject, message, [patient.user.email], kind='consultation')
 
 def send_doctor_registration_email(doctor):
     """Notify system administrators about a new doctor registration."""
@@ -115,7 +143,7 @@ def send_doctor_registration_email(doctor):
     Regards,
     QR Health System
     """
-    send_email_async(subject, message, [settings.ADMIN_EMAIL])
+    send_email_async(subject, message, [settings.ADMIN_EMAIL], kind='doctor_registration')
 
 def send_hospital_registration_email(hospital):
     """Notify system administrators about a new hospital registration."""
@@ -134,7 +162,7 @@ def send_hospital_registration_email(hospital):
     Regards,
     QR Health System
     """
-    send_email_async(subject, message, [settings.ADMIN_EMAIL])
+    send_email_async(subject, message, [settings.ADMIN_EMAIL], kind='hospital_registration')
 
 def send_doctor_approved_email(doctor):
     """Notify doctor that their account has been verified."""
@@ -152,4 +180,4 @@ def send_doctor_approved_email(doctor):
     QR Health System
     """
     if doctor.user.email:
-        send_email_async(subject, message, [doctor.user.email])
+        send_email_async(subject, message, [doctor.user.email], kind='doctor_approved')
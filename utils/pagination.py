@@ -0,0 +1,66 @@
+import base64
+import json
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def encode_cursor(*values):
+    """Opaque, URL-safe cursor for keyset pagination."""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Inverse of encode_cursor. Raises ValueError for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def encode_time_cursor(timestamp, pk):
+    """Cursor for the common (timestamp, id) descending keyset."""
+    return encode_cursor(timestamp.isoformat(), pk)
+
+
+def decode_time_cursor(cursor):
+    """Inverse of encode_time_cursor: (aware datetime, pk). Raises ValueError if malformed."""
+    ts, pk = decode_cursor(cursor, 2)
+    ts = parse_datetime(ts) if isinstance(ts, str) else None
+    if ts is None or not isinstance(pk, int):
+        raise ValueError("Invalid cursor")
+    return ts, pk
+
+
+def clamp_limit(value, default=20, maximum=100):
+    """Parse a `limit` query parameter into 1..maximum, falling back to the default."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(maximum, value))
+
+
+def parse_date_bound(value, end_of_day=False):
+    """ISO datetime or date; a bare date means the start of that day (or of the next one for an upper bound)."""
+    # Dates first: parse_datetime would also accept a bare date, as midnight
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is not None:
+        if end_of_day:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Invalid date: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
@@ -4,12 +4,19 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from io import BytesIO
 
-def generate_patient_pdf(patient, records, prescriptions, lab_reports):
+from utils.metrics import PDF_RENDER
+
+
+@PDF_RENDER.time()
+def generate_patient_pdf(report):
     """
     Generate a PDF report for a patient including their profile,
-    medical records, prescriptions, and lab reports.
+    consultations, prescriptions, and lab reports.
+    Takes the plain-row bundle from utils.report_data.load_patient_report,
+    so building the document never touches the database.
     Returns: BytesIO object containing the PDF.
     """
+    patient = report.patient
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     styles = getSampleStyleSheet()
@@ -17,7 +24,7 @@ def generate_patient_pdf(patient, records, prescriptions, lab_reports):
 
     # --- Title & Header ---
     title_style = styles['Title']
-    story.append(Paragraph(f"Medical Report: {patient.user.get_full_name()}", title_style))
+    story.append(Paragraph(f"Medical Report: {patient.full_name}", title_style))
     story.append(Paragraph(f"Health ID: {patient.health_id}", styles['Heading2']))
     story.append(Spacer(1, 12))
 
@@ -40,19 +47,18 @@ def generate_patient_pdf(patient, records, prescriptions, lab_reports):
     story.append(t)
     story.append(Spacer(1, 20))
 
-    # --- Medical Records ---
-    story.append(Paragraph("Recent Medical Records", styles['Heading2']))
-    if records:
-        record_data = [["Date", "Title", "Type", "Doctor"]]
-        for rec in records:
-            doctor_name = rec.doctor.user.get_full_name() if rec.doctor else "Unknown"
-            record_data.append([
-                str(rec.created_at.date()),
-                rec.title,
-                rec.record_type,
-                doctor_name
+    # --- Consultations ---
+    story.append(Paragraph("Consultations", styles['Heading2']))
+    if report.consultations:
+        consultation_data = [["Date", "Complaint", "Diagnosis", "Doctor"]]
+        for consult in report.consultations:
+            consultation_data.append([
+                str(consult.date.date()),
+                consult.chief_complaint[:40],
+                consult.diagnosis[:40] or "N/A",
+                consult.doctor_name or "Unknown"
             ])
-        t_recs = Table(record_data, colWidths=[80, 150, 100, 120])
+        t_recs = Table(consultation_data, colWidths=[80, 150, 100, 120])
         t_recs.setStyle(TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -61,14 +67,14 @@ def generate_patient_pdf(patient, records, prescriptions, lab_reports):
         ]))
         story.append(t_recs)
     else:
-        story.append(Paragraph("No medical records found.", styles['Normal']))
+        story.append(Paragraph("No consultations found.", styles['Normal']))
     story.append(Spacer(1, 20))
 
     # --- Prescriptions ---
     story.append(Paragraph("Prescription History", styles['Heading2']))
-    if prescriptions:
-        for presc in prescriptions:
-            p_text = f"<b>Date:</b> {presc.prescription_date} | <b>Doctor:</b> {presc.doctor_name}"
+    if report.prescriptions:
+        for presc in report.prescriptions:
+            p_text = f"<b>Date:</b> {presc.date} | <b>Doctor:</b> {presc.doctor_name}"
             story.append(Paragraph(p_text, styles['Normal']))
             story.append(Paragraph(f"<b>Diagnosis:</b> {presc.diagnosis}", styles['Normal']))
             if presc.medicines:
@@ -82,14 +88,14 @@ def generate_patient_pdf(patient, records, prescriptions, lab_reports):
 
     # --- Lab Reports ---
     story.append(Paragraph("Lab Reports", styles['Heading2']))
-    if lab_reports:
+    if report.lab_reports:
         lab_data = [["Date", "Test", "Result", "Comments"]]
-        for rep in lab_reports:
-            test_name = rep.test_type.name if rep.test_type else "Unknown Test"
+        for rep in report.lab_reports:
+            test_name = rep.test_name or "Unknown Test"
             # Simplify result for table
             result_str = "See Details" 
             lab_data.append([
-                str(rep.created_at.date()),
+                str(rep.date.date()),
                 test_name,
                 result_str,
                 rep.comments[:50] + "..." if len(rep.comments) > 50 else rep.comments
@@ -108,3 +114,8 @@ def generate_patient_pdf(patient, records, prescriptions, lab_reports):
     doc.build(story)
     buffer.seek(0)
     return buffer
+
+
+def render_patient_pdf_bytes(report):
+    """Picklable entry point for process pools: report bundle in, PDF bytes out."""
+    return generate_patient_pdf(report).getvalue()
@@ -0,0 +1,20 @@
+import os
+
+
+def init_django_worker():
+    """
+    Process-pool initializer that makes Django usable in a worker process.
+    Forked workers inherit a configured Django; spawned workers (Windows/macOS) need setup.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        django.setup()
+
+
+def hash_password(raw_password):
+    """Picklable wrapper around make_password for use with process pools."""
+    from django.contrib.auth.hashers import make_password
+    return make_password(raw_password)
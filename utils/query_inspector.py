@@ -0,0 +1,180 @@
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Field, ForeignObjectRel
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SPACE = re.compile(r'\s+')
+_TRANSACTION = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT')
+_PROJECT_DIR = str(settings.BASE_DIR) + os.sep
+_LIBRARY_DIRS = ('site-packages', 'dist-packages', f'{os.sep}venv{os.sep}')
+
+
+def fingerprint(sql):
+    """The query with its parameters left out: the same fingerprint run N times is an N+1."""
+    return _IN_LIST.sub('IN (...)', _SPACE.sub(' ', sql.strip()))
+
+
+def _attribute_label(obj):
+    """'doctor.user' for the descriptor or related manager `obj`, if it is one."""
+    if isinstance(obj, BaseSerializer):
+        return None
+    field = getattr(obj, 'field', None)
+    if not isinstance(field, Field) or not hasattr(field, 'model'):
+        field = None
+    instance = getattr(obj, 'instance', None)
+    if field is not None and instance is not None:
+        # Reverse foreign key manager: patient.emergency_contacts
+        return f"{instance._meta.model_name}.{field.remote_field.get_accessor_name()}"
+    if field is not None:
+        # Forward relation or deferred column: doctor.user
+        return f"{field.model._meta.model_name}.{field.name}"
+    related = getattr(obj, 'related', None)
+    if isinstance(related, ForeignObjectRel):
+        # Reverse one-to-one: user.doctor_profile
+        return f"{related.model._meta.model_name}.{related.get_accessor_name()}"
+    if instance is not None and hasattr(obj, 'prefetch_cache_name'):
+        # Many-to-many manager
+        return f"{instance._meta.model_name}.{obj.prefetch_cache_name}"
+    return None
+
+
+def _is_project_code(filename):
+    return filename.startswith(_PROJECT_DIR) and not any(part in filename for part in _LIBRARY_DIRS)
+
+
+def query_origin(skip=2):
+    """
+    Describe where the query being executed comes from: the innermost project function on the
+    stack and, if the query was triggered by a lazy attribute, which one, e.g.
+    "SharingPermissionSerializer.get_doctor_name (patients/serializers.py:120) touching doctor.user".
+    When DRF is rendering a nested serializer the serializer is named too.
+    """
+    frame = sys._getframe(skip)
+    attribute = serializer = None
+    while frame is not None:
+        code = frame.f_code
+        this = frame.f_locals.get('self')
+        if _is_project_code(code.co_filename) and code.co_filename != __file__:
+            name = f"{type(this).__name__}.{code.co_name}" if this is not None else code.co_name
+            where = f"{name} ({os.path.relpath(code.co_filename, settings.BASE_DIR)}:{frame.f_lineno})"
+            if serializer:
+                where = f"{serializer}, rendered from {where}"
+            return f"{where} touching {attribute}" if attribute else where
+        if this is not None:
+            if attribute is None:
+                attribute = _attribute_label(this)
+            if serializer is None and isinstance(this, BaseSerializer) and not isinstance(this, ListSerializer):
+                serializer = type(this).__name__
+        frame = frame.f_back
+    return attribute or serializer or 'unknown'
+
+
+class QueryRecorder:
+    """
+    execute_wrapper that counts queries, adds up their time and tallies fingerprints. The
+    stack is only inspected when a fingerprint repeats, so the cost on clean requests is a
+    counter bump per query.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            if not sql.lstrip().upper().startswith(_TRANSACTION):
+                key = fingerprint(sql)
+                self.fingerprints[key] += 1
+                if self.fingerprints[key] == 2:
+                    self.origins[key] = query_origin()
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold=2):
+        """[(fingerprint, times, origin)] for queries run at least `threshold` times, worst first."""
+        return [
+            (key, times, self.origins.get(key, 'unknown'))
+            for key, times in self.fingerprints.most_common()
+            if times >= threshold
+        ]
+
+    def report(self, threshold=2):
+        return '\n'.join(f"  {times} x {key}\n    from {origin}" for key, times, origin in self.repeated(threshold))
+
+
+class QueryInspectorMiddleware:
+    """
+    Records every request's queries. Adds X-DB-Query-Count, X-DB-Time-Ms and
+    X-DB-Repeated-Queries headers when QUERY_INSPECTOR_HEADERS is on, and logs a warning
+    for requests over QUERY_REPEAT_WARNING repeats or QUERY_COUNT_WARNING queries.
+    Queries run while a streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_INSPECTOR:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        if settings.QUERY_INSPECTOR_HEADERS:
+            response['X-DB-Query-Count'] = str(recorder.count)
+            response['X-DB-Time-Ms'] = f"{recorder.duration * 1000:.1f}"
+            response['X-DB-Repeated-Queries'] = str(sum(times - 1 for _, times, _ in recorder.repeated()))
+
+        repeats = recorder.repeated(settings.QUERY_REPEAT_WARNING)
+        if repeats or recorder.count > settings.QUERY_COUNT_WARNING:
+            logger.warning(
+                "%s %s ran %d queries in %.1f ms%s\n%s",
+                request.method, request.path, recorder.count, recorder.duration * 1000,
+                "; likely N+1:" if repeats else "", recorder.report(settings.QUERY_REPEAT_WARNING),
+            )
+        return response
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin: assertQueryBudget() makes a request through the test client and fails if it
+    runs more than `budget` queries, or any query `repeat_limit` times or more (an N+1), naming
+    the code responsible.
+    """
+    repeat_limit = 3
+
+    def assertQueryBudget(self, budget, url, method='get', client=None, **kwargs):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = getattr(client or self.client, method)(url, **kwargs)
+        if recorder.count > budget:
+            self.fail(
+                f"{method.upper()} {url} ran {recorder.count} queries, budget is {budget}\n"
+                f"{recorder.report() or '  (no repeated queries)'}"
+            )
+        if recorder.repeated(self.repeat_limit):
+            self.fail(f"{method.upper()} {url} repeats queries (N+1?)\n{recorder.report(self.repeat_limit)}")
+        return response
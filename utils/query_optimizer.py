@@ -0,0 +1,189 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+# Derives select_related / prefetch_related / only() for a queryset from the serializer that
+# will render it, by walking the declared fields and their `source` paths:
+#   - nested serializers and dotted sources over single-valued relations are joined
+#     (select_related), many-valued ones are prefetched with their own optimized queryset;
+#   - every model level loads only the columns its fields read, unless something on that
+#     level is opaque to us (a SerializerMethodField, a property), in which case it loads
+#     every column.
+# Method fields that follow relations can declare them on the serializer's Meta as
+# `related_hints = ['patient__user']`. A nested serializer whose counts come from annotations
+# can provide a classmethod `annotate_queryset(queryset)`; that relation is then prefetched
+# with the annotated queryset instead of joined.
+
+
+class _Plan:
+    def __init__(self):
+        self.select = []
+        self.prefetch = []
+        self.only = []
+
+    def add_all_columns(self, model, prefix):
+        self.only.extend(prefix + f.name for f in model._meta.concrete_fields)
+
+
+def _get_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _single_valued(field):
+    return field.is_relation and (field.many_to_one or field.one_to_one)
+
+
+def _related_serializer(field):
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+def _reverse_fk_name(field):
+    """For a reverse FK, the column the prefetched children need to be matched to their parent."""
+    return field.field.name if field.one_to_many else None
+
+
+def _prefetch(plan, lookup, field, serializer=None, existing=()):
+    if lookup in existing:
+        return
+    queryset = field.related_model._default_manager.all()
+    if serializer is not None:
+        queryset = _annotate(queryset, serializer)
+        queryset = optimize_queryset(queryset, serializer, extra_only=_reverse_fk_name(field))
+    plan.prefetch.append(Prefetch(lookup, queryset=queryset))
+
+
+def _annotate(queryset, serializer):
+    hook = getattr(type(serializer), 'annotate_queryset', None)
+    return hook(queryset) if hook else queryset
+
+
+def _walk_hints(serializer, model, prefix, plan, existing):
+    for hint in getattr(getattr(serializer, 'Meta', None), 'related_hints', ()):
+        current, path = model, []
+        for name in hint.split('__'):
+            field = _get_field(current, name)
+            if field is None or not field.is_relation:
+                break
+            path.append(name)
+            lookup = prefix + '__'.join(path)
+            if not _single_valued(field):
+                # Anything past a many-valued step rides along in the prefetch
+                if lookup not in existing:
+                    plan.prefetch.append(prefix + hint)
+                break
+            if field.concrete:
+                plan.only.append(lookup)
+            plan.add_all_columns(field.related_model, lookup + '__')
+            plan.select.append(lookup)
+            current = field.related_model
+
+
+def _walk(serializer, model, prefix, plan, existing):
+    """Add what `serializer` reads from `model` (reached through `prefix`) to the plan."""
+    opaque = False
+    _walk_hints(serializer, model, prefix, plan, existing)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        nested = _related_serializer(field)
+        if field.source == '*':
+            if nested is not None:
+                _walk(nested, model, prefix, plan, existing)
+            else:
+                opaque = True  # SerializerMethodField and friends
+            continue
+
+        current, path = model, prefix
+        attrs = field.source.split('.')
+        for i, attr in enumerate(attrs):
+            model_field = _get_field(current, attr)
+            last = i == len(attrs) - 1
+            if model_field is None:
+                # A property or method of this (possibly related) object: load all its columns
+                plan.add_all_columns(current, path)
+                break
+            if not model_field.is_relation:
+                plan.only.append(path + attr)
+                break
+            lookup = path + attr
+            if not _single_valued(model_field):
+                if path + attr not in existing:
+                    child = nested if last else None
+                    _prefetch(plan, lookup, model_field, child, existing)
+                break
+            if model_field.concrete:
+                plan.only.append(lookup)
+            if last and nested is None:
+                # A primary key (or hyperlinked) related field: the FK column is enough
+                if not model_field.concrete:
+                    plan.select.append(lookup)
+                    plan.add_all_columns(model_field.related_model, lookup + '__')
+                break
+            if lookup in existing:
+                break
+            if last and hasattr(type(nested), 'annotate_queryset'):
+                _prefetch(plan, lookup, model_field, nested)
+                break
+            plan.select.append(lookup)
+            if last:
+                _walk(nested, model_field.related_model, lookup + '__', plan, existing)
+            else:
+                current, path = model_field.related_model, lookup + '__'
+
+    if opaque:
+        plan.add_all_columns(model, prefix)
+
+
+def optimize_queryset(queryset, serializer, extra_only=None):
+    """
+    Apply select_related / prefetch_related / only() for everything `serializer` (a
+    serializer instance, or a ListSerializer) will read from each object of `queryset`.
+    Lookups the queryset already prefetches are left alone, and only() is skipped if the
+    queryset already defers columns.
+    """
+    serializer = _related_serializer(serializer) or serializer
+    existing = {
+        lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        for lookup in queryset._prefetch_related_lookups
+    }
+    plan = _Plan()
+    _walk(serializer, queryset.model, '', plan, existing)
+    if extra_only:
+        plan.only.append(extra_only)
+
+    if plan.select:
+        queryset = queryset.select_related(*dict.fromkeys(plan.select))
+    if plan.prefetch:
+        queryset = queryset.prefetch_related(*plan.prefetch)
+    deferred, _ = queryset.query.deferred_loading
+    if not deferred and plan.only:
+        queryset = queryset.only(*dict.fromkeys(plan.only))
+    return queryset
+
+
+class OptimizedQuerysetMixin:
+    """
+    Generic view mixin: the queryset list() and get_object() work on is optimized for the
+    serializer the view renders with. Hooks filter_queryset(), so views keep overriding
+    get_queryset() as usual. Put it before the DRF base class.
+    Only reads are optimized, and on ViewSets only list and retrieve: custom actions may
+    not render with the view's serializer at all (they can call optimize_queryset).
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in ('GET', 'HEAD'):
+            # Writes save the instance back; keep those loading whole rows
+            return queryset
+        if getattr(self, 'action', None) not in (None, 'list', 'retrieve'):
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer())
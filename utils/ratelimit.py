@@ -0,0 +1,31 @@
+import time
+from django.core.cache import cache
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/hour' -> (5, 3600). Same format as DRF throttle rates."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period.strip()[0]]
+
+
+def take_token(key, rate, tokens=1):
+    """
+    Token bucket kept in the shared cache: `rate` tokens per period, bursting up to the full
+    allowance, refilled continuously. Returns (allowed, retry_after_seconds).
+    The read-modify-write is not atomic across processes, so under a concurrent burst a
+    caller may slip slightly past the limit; it never blocks legitimate traffic.
+    """
+    capacity, period = parse_rate(rate)
+    refill_per_second = capacity / period
+    now = time.time()
+    cache_key = f"bucket:{key}"
+
+    available, updated_at = cache.get(cache_key, (capacity, now))
+    available = min(capacity, available + (now - updated_at) * refill_per_second)
+    if available < tokens:
+        cache.set(cache_key, (available, now), timeout=period)
+        return False, (tokens - available) / refill_per_second
+    cache.set(cache_key, (available - tokens, now), timeout=period)
+    return True, 0
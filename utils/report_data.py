@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+ReportPatient = namedtuple('ReportPatient', [
+    'health_id', 'full_name', 'date_of_birth', 'blood_group', 'contact_number',
+    'address', 'allergies', 'chronic_conditions',
+])
+ReportConsultation = namedtuple('ReportConsultation', ['date', 'chief_complaint', 'diagnosis', 'doctor_name'])
+ReportPrescription = namedtuple('ReportPrescription', ['date', 'doctor_name', 'diagnosis', 'medicines'])
+ReportLabResult = namedtuple('ReportLabResult', ['date', 'test_name', 'comments'])
+PatientReport = namedtuple('PatientReport', ['patient', 'consultations', 'prescriptions', 'lab_reports'])
+
+
+def _full_name(first_name, last_name, fallback=''):
+    return f"{first_name} {last_name}".strip() or fallback
+
+
+def load_patient_report(patient_id):
+    """
+    Everything generate_patient_pdf needs, as plain rows, in four queries
+    (profile, consultations, prescriptions, lab reports) however long the history is.
+    Related names are joined in SQL instead of being walked per row.
+    """
+    from doctors.models import Consultation
+    from labs.models import LabReport
+    from patients.models import Patient, OldPrescription
+
+    row = Patient.objects.filter(pk=patient_id).values(
+        'health_id', 'user__first_name', 'user__last_name', 'user__username', 'date_of_birth',
+        'blood_group', 'contact_number', 'address', 'allergies', 'chronic_conditions',
+    ).get()
+    patient = ReportPatient(
+        health_id=row['health_id'],
+        full_name=_full_name(row['user__first_name'], row['user__last_name'], row['user__username']),
+        date_of_birth=row['date_of_birth'],
+        blood_group=row['blood_group'],
+        contact_number=row['contact_number'],
+        address=row['address'],
+        allergies=row['allergies'],
+        chronic_conditions=row['chronic_conditions'],
+    )
+
+    consultations = [
+        ReportConsultation(date, complaint, diagnosis, _full_name(first, last, username))
+        for date, complaint, diagnosis, first, last, username in
+        Consultation.objects.filter(patient_id=patient_id).order_by('-consultation_date').values_list(
+            'consultation_date', 'chief_complaint', 'diagnosis',
+            'doctor__user__first_name', 'doctor__user__last_name', 'doctor__user__username',
+        )
+    ]
+    prescriptions = [
+        ReportPrescription(*values)
+        for values in OldPrescription.objects.filter(patient_id=patient_id).order_by('-prescription_date').values_list(
+            'prescription_date', 'doctor_name', 'diagnosis', 'medicines',
+        )
+    ]
+    lab_reports = [
+        ReportLabResult(*values)
+        for values in LabReport.objects.filter(patient_id=patient_id).order_by('-created_at').values_list(
+            'created_at', 'test_type__name', 'comments',
+        )
+    ]
+    return PatientReport(patient, consultations, prescriptions, lab_reports)